@@ -1,12 +1,18 @@
 import argparse
+import json
 import os
 import pathlib
 import sys
-from typing import Union
+from typing import Any, Dict, Union
 
 from dotenv import find_dotenv, load_dotenv
 from loguru import logger
 
+from core.loops import BACKENDS
+from core.sampling import log_sampler
+from core.sharding import SHARD_ENV, shard_path
+from core.warehouse import Warehouse, load_warehouses
+
 
 class Range(argparse.Action):
     """Checks whether a numeric command-line argument satisfies the range bounds.
@@ -46,11 +52,48 @@ class Range(argparse.Action):
         setattr(namespace, self.dest, value)
 
 
+def validate_profile(profile: Dict[str, Any], path: str) -> Dict[str, Any]:
+    """Checks the detection's settings of a profile the same way as the command-line arguments they stand for:
+    every value is converted with the argument's type and checked against its Range bounds.
+    Exits with the parser's error on the first invalid value.
+
+    Args:
+        profile (dict): The profile's settings (see tools/tune.py), only PROFILE_KEYS of them are used.
+        path (str): Path to the profile, for the error message.
+
+    Returns:
+        settings (dict): The checked settings to set as the parser's defaults.
+    """
+
+    settings = {}
+    namespace = argparse.Namespace()
+
+    for action in parser._actions:
+        if (action.dest not in PROFILE_KEYS) or (action.dest not in profile):
+            continue
+
+        try:
+            value = action.type(str(profile[action.dest])) if action.type else profile[action.dest]
+            action(parser, namespace, value, action.option_strings[0])
+        except (TypeError, ValueError, argparse.ArgumentTypeError) as ex:
+            parser.error(f'invalid value {profile[action.dest]!r} of "{action.dest}" in the profile "{path}": {ex}')
+
+        settings[action.dest] = getattr(namespace, action.dest)
+
+    return settings
+
+
 DIR = pathlib.Path(__file__).parent.parent
 LOG_COLOR = True
 LOG_FILE_DEFAULT = f"{DIR}/log/bot.log"
 LOG_ROTATION_SIZE = "256 KB"
 LOG_COMPRESSION_FORMAT = "zip"
+LOG_SAMPLE_INTERVAL = 5.0
+PROFILE_KEYS = ("area", "color", "side", "kernel", "sharpness")
+BOT_API_URL_DEFAULT = "https://api.telegram.org"
+DEFERRED_FILE_DEFAULT = f"{DIR}/log/deferred.sqlite"
+SOAK_REPORT_DEFAULT = f"{DIR}/log/soak.json"
+SOAK_TOKEN = "123456:soak"
 FIELDS = [
     "id",
     "product",
@@ -76,6 +119,12 @@ parser.add_argument(
     dest="dev",
     help="run in the development mode using a test bot's token",
 )
+parser.add_argument(
+    "--api-url",
+    default=None,
+    dest="api_url",
+    help="base URL of the Telegram Bot API server (e.g. a local stand-in). Overrides the one set in the .env file",
+)
 parser.add_argument(
     "--area",
     type=int,
@@ -103,6 +152,90 @@ parser.add_argument(
     dest="side",
     help="side (in pixels) of a detection square for the UI",
 )
+parser.add_argument(
+    "--kernel",
+    type=int,
+    minimum=1,
+    maximum=15,
+    action=Range,
+    default=2,
+    dest="kernel",
+    help="side (in pixels) of the kernel used to outline the objects",
+)
+parser.add_argument(
+    "--profile",
+    default=None,
+    dest="profile",
+    help="path to a detection profile written by tools/tune.py. Explicitly passed arguments override its values",
+)
+parser.add_argument(
+    "--sharpness",
+    type=float,
+    action=Range,
+    default=0.0,
+    dest="sharpness",
+    help="minimal sharpness (variance of the Laplacian) of a potential QR-code to try decoding it (0 to disable)",
+)
+parser.add_argument(
+    "--track",
+    action="store_true",
+    dest="track",
+    help="track a detected QR-code between frames and decode it once it's still instead of re-detecting it",
+)
+parser.add_argument(
+    "--track-frames",
+    type=int,
+    minimum=1,
+    maximum=100,
+    action=Range,
+    default=3,
+    dest="track_frames",
+    help="number of frames in a row a tracked QR-code has to stay still to be decoded",
+)
+parser.add_argument(
+    "--track-retry",
+    type=int,
+    minimum=1,
+    maximum=100,
+    action=Range,
+    default=5,
+    dest="track_retry",
+    help="number of frames to wait before decoding a still tracked QR-code again when it couldn't be decoded",
+)
+parser.add_argument(
+    "--tiles",
+    type=int,
+    minimum=1,
+    maximum=16,
+    action=Range,
+    default=1,
+    dest="tiles",
+    help="split the detection square into N x N overlapping tiles scanned in parallel (1 to disable)",
+)
+parser.add_argument(
+    "--tile-overlap",
+    type=int,
+    action=Range,
+    default=64,
+    dest="tile_overlap",
+    help="width (in pixels) of the band shared by adjacent tiles, should exceed the QR-code's size",
+)
+parser.add_argument(
+    "--workers",
+    type=int,
+    minimum=1,
+    maximum=256,
+    action=Range,
+    default=os.cpu_count() or 1,
+    dest="workers",
+    help="number of workers scanning the tiles",
+)
+parser.add_argument(
+    "--tile-processes",
+    action="store_true",
+    dest="tile_processes",
+    help="scan the tiles in a process pool instead of a thread pool",
+)
 parser.add_argument(
     "--lang",
     choices=["en", "ru"],
@@ -118,12 +251,219 @@ parser.add_argument(
     dest="pause",
     help="delay (in seconds) before resuming the QR-code monitor",
 )
+parser.add_argument(
+    "--send-from",
+    type=int,
+    maximum=23,
+    action=Range,
+    default=0,
+    dest="send_from",
+    help="hour of the recipient's local time from which the notifications may be sent",
+)
+parser.add_argument(
+    "--send-until",
+    type=int,
+    maximum=23,
+    action=Range,
+    default=0,
+    dest="send_until",
+    help="hour of the recipient's local time from which the notifications are deferred until --send-from "
+    "(equal to --send-from to send at any time)",
+)
+parser.add_argument(
+    "--deferred",
+    default=DEFERRED_FILE_DEFAULT,
+    dest="deferred",
+    help="full path to a file keeping the deferred notifications",
+)
+parser.add_argument(
+    "--deferred-batch",
+    type=int,
+    minimum=1,
+    maximum=500,
+    action=Range,
+    default=25,
+    dest="deferred_batch",
+    help="number of the deferred notifications sent per second once they're due",
+)
+parser.add_argument(
+    "--throttle-rate",
+    type=float,
+    action=Range,
+    default=0.0,
+    dest="throttle_rate",
+    help="number of updates per second a single user may send before the rest are dropped (0 to disable)",
+)
+parser.add_argument(
+    "--throttle-burst",
+    type=float,
+    minimum=1,
+    action=Range,
+    default=5.0,
+    dest="throttle_burst",
+    help="number of updates a single user may send at once",
+)
+parser.add_argument(
+    "--throttle-global",
+    type=float,
+    action=Range,
+    default=0.0,
+    dest="throttle_global",
+    help="number of updates per second for all users together (0 to disable), bursts are twice as large",
+)
+parser.add_argument(
+    "--throttle-users",
+    type=int,
+    minimum=1,
+    maximum=10 ** 7,
+    action=Range,
+    default=10000,
+    dest="throttle_users",
+    help="number of recently seen users to keep the throttling state for",
+)
+parser.add_argument(
+    "--collapse",
+    type=float,
+    action=Range,
+    default=0.0,
+    dest="collapse",
+    help="time (in seconds) an identical callback of the same user is dropped as a repeat (0 to disable)",
+)
 parser.add_argument(
     "--logfile",
     default=LOG_FILE_DEFAULT,
     dest="logfile",
     help="full path to a log file",
 )
+parser.add_argument(
+    "--logjson",
+    default=None,
+    dest="logjson",
+    help="full path to an additional log file with one JSON-serialized record per line",
+)
+parser.add_argument(
+    "--log-enqueue",
+    action="store_true",
+    dest="log_enqueue",
+    help="pass log records through a background queue, so the sinks never block the event loop",
+)
+parser.add_argument(
+    "--log-sample",
+    type=float,
+    action=Range,
+    default=LOG_SAMPLE_INTERVAL,
+    dest="log_sample",
+    help="minimal interval (in seconds) between repeated per-frame log records",
+)
+parser.add_argument(
+    "--warehouses",
+    default=None,
+    dest="warehouses",
+    help="path to a JSON file defining several warehouses (table, DB login and cameras) served by the bot at once. "
+    "Overrides the table, the login and --source set for a single warehouse",
+)
+parser.add_argument(
+    "--metrics-interval",
+    type=float,
+    maximum=10 ** 6,
+    action=Range,
+    default=300.0,
+    dest="metrics_interval",
+    help="interval (in seconds) between the reports of the warehouses' metrics (0 to disable)",
+)
+parser.add_argument(
+    "--shards",
+    type=int,
+    maximum=64,
+    action=Range,
+    default=0,
+    dest="shards",
+    help="handle the updates in N worker processes, each serving its share of the users, while this process "
+    "receives the updates and scans the web-cams (0 to handle everything in this process). "
+    "The throttling rates apply per worker",
+)
+parser.add_argument(
+    "--standins",
+    action="store_true",
+    dest="standins",
+    help="use in-memory stand-ins with generated orders instead of the SQLAnywhere databases (e.g. for benchmarks)",
+)
+parser.add_argument(
+    "--loop",
+    choices=BACKENDS,
+    default="auto",
+    dest="loop",
+    help="event loop backend (auto picks uvloop where it's installed)",
+)
+parser.add_argument(
+    "--source",
+    default="0",
+    dest="source",
+    help='source of the frames: a web-cam\'s index, "synthetic" for generated frames or a path to a recording '
+    "(see --record) or to a video file",
+)
+parser.add_argument(
+    "--record",
+    default=None,
+    dest="record",
+    help="record the frames of every web-cam along with the outcomes of their scans into a new file in this folder",
+)
+parser.add_argument(
+    "--record-every",
+    type=int,
+    minimum=1,
+    maximum=1000,
+    action=Range,
+    default=1,
+    dest="record_every",
+    help="record only every Nth frame along with every frame with a potential QR-code",
+)
+parser.add_argument(
+    "--headless",
+    action="store_true",
+    dest="headless",
+    help="don't show the live capture's window",
+)
+parser.add_argument(
+    "--soak",
+    type=float,
+    action=Range,
+    maximum=10 ** 7,
+    default=0.0,
+    dest="soak",
+    help="run a soak test for N seconds against the stand-in database and Bot API server (0 to disable)",
+)
+parser.add_argument(
+    "--soak-interval",
+    type=float,
+    minimum=1,
+    action=Range,
+    default=60.0,
+    dest="soak_interval",
+    help="interval (in seconds) between the soak test's samples of memory and latency",
+)
+parser.add_argument(
+    "--soak-report",
+    default=SOAK_REPORT_DEFAULT,
+    dest="soak_report",
+    help="full path to the soak test's drift report",
+)
+parser.add_argument(
+    "--soak-port",
+    type=int,
+    minimum=1,
+    maximum=65535,
+    action=Range,
+    default=8081,
+    dest="soak_port",
+    help="port of the stand-in Bot API server used by the soak test",
+)
+parser.add_argument(
+    "--soak-image",
+    default=None,
+    dest="soak_image",
+    help="path to an image (e.g. a QR-code of a stand-in address) pasted onto the soak test's synthetic frames",
+)
 parser.add_argument(
     "-v",
     "--verbose",
@@ -132,28 +472,73 @@ parser.add_argument(
     dest="verbose",
     help="increase verbosity by setting the logger's level to DEBUG",
 )
+args, _ = parser.parse_known_args()
+
+if args.profile:
+    try:
+        with open(args.profile, encoding="utf-8") as file:
+            profile = json.load(file)
+    except (OSError, ValueError) as ex:
+        parser.error(f'can\'t read the profile "{args.profile}": {ex}')
+
+    if not isinstance(profile, dict):
+        parser.error(f'the profile "{args.profile}" isn\'t a JSON object')
+
+    parser.set_defaults(**validate_profile(profile, args.profile))
+
 args = parser.parse_args()
 
-logger.configure(
-    handlers=[
-        dict(
-            sink=sys.stderr,
-            format="<lvl>{time:YYYY-MM-DD HH:mm:ss!UTC}  | {level: <8} | {name}:{function}:{line}: {message}</lvl>",
-            level="DEBUG" if args.verbose else "INFO",
-            colorize=LOG_COLOR,
-        ),
+if args.soak:
+    args.headless = True
+    args.standins = True
+
+    if args.source == "0":
+        args.source = "synthetic"
+
+# A worker process (see core/sharding.py) logs to its own files from the start, never to the front process' ones
+if os.getenv(SHARD_ENV) is not None:
+    args.logfile = shard_path(args.logfile, int(os.environ[SHARD_ENV]))
+    args.logjson = args.logjson and shard_path(args.logjson, int(os.environ[SHARD_ENV]))
+
+log_level = "DEBUG" if args.verbose else "INFO"
+log_handlers = [
+    dict(
+        sink=sys.stderr,
+        format="<lvl>{time:YYYY-MM-DD HH:mm:ss!UTC}  | {level: <8} | {name}:{function}:{line}: {message}</lvl>",
+        level=log_level,
+        colorize=LOG_COLOR,
+        enqueue=args.log_enqueue,
+    ),
+    dict(
+        sink=args.logfile,
+        format="{time:YYYY-MM-DD HH:mm:ss!UTC}  | {level: <8} | {name}:{function}:{line}: {message}",
+        level=log_level,
+        rotation=LOG_ROTATION_SIZE,
+        compression=LOG_COMPRESSION_FORMAT,
+        enqueue=args.log_enqueue,
+    ),
+]
+
+if args.logjson:
+    log_handlers.append(
         dict(
-            sink=args.logfile,
-            format="{time:YYYY-MM-DD HH:mm:ss!UTC}  | {level: <8} | {name}:{function}:{line}: {message}",
-            level="DEBUG" if args.verbose else "INFO",
+            sink=args.logjson,
+            level=log_level,
+            serialize=True,
             rotation=LOG_ROTATION_SIZE,
             compression=LOG_COMPRESSION_FORMAT,
-        ),
-    ]
-)
+            enqueue=args.log_enqueue,
+        )
+    )
+
+logger.configure(handlers=log_handlers)
+log_sampler.interval = args.log_sample
 logger.debug("Running in debug mode")
 logger.info('Logging the activity to file: "{}"', args.logfile)
 
+if args.logjson:
+    logger.info('Logging the activity as JSON lines to file: "{}"', args.logjson)
+
 env_prefix = "DEV" if args.dev else "PROD"
 logger.debug("Loading environment variables from a .env file")
 load_dotenv(find_dotenv(), override=True)
@@ -162,9 +547,41 @@ BOT_TOKEN = os.getenv(f"{env_prefix}_BOT_TOKEN")
 DB_UID = os.getenv(f"{env_prefix}_DB_USER")
 DB_PASSWORD = os.getenv(f"{env_prefix}_DB_PASSWORD")
 DB_TABLE_NAME = os.getenv(f"{env_prefix}_DB_TABLENAME")
+BOT_API_URL = args.api_url or os.getenv(f"{env_prefix}_BOT_API_URL") or BOT_API_URL_DEFAULT
+
+if args.soak:
+    BOT_TOKEN = SOAK_TOKEN
+    BOT_API_URL = args.api_url or f"http://127.0.0.1:{args.soak_port}"
+    DB_UID = DB_UID or "admin"
+    DB_TABLE_NAME = DB_TABLE_NAME or "Orders"
+    logger.warning("Running a soak test for {} second(s) against the stand-in backends", args.soak)
+
+if args.warehouses:
+    WAREHOUSES = load_warehouses(args.warehouses)
+else:
+    WAREHOUSES = [Warehouse("default", DB_UID, DB_PASSWORD, DB_TABLE_NAME, [args.source])]
+
+if args.soak:
+    for warehouse in WAREHOUSES:
+        warehouse.cameras = [args.source] * len(warehouse.cameras)
+
 logger.success("Successfully loaded the environment variables")
+logger.debug('Got the Bot API server: "{}"', BOT_API_URL)
+if args.profile:
+    logger.info('Loaded the detection profile: "{}"', args.profile)
+
 logger.debug('Got minimal area of a potential QR-code: "{}"', args.area)
 logger.debug('Got minimal hue of a potential QR-code: "{}"', args.color)
 logger.debug('Got the detection square\'s side "{}"', args.side)
+logger.debug('Got the outlining kernel\'s side "{}"', args.kernel)
+logger.debug('Got minimal sharpness of a potential QR-code: "{}"', args.sharpness)
+logger.debug('Got the candidates\' tracking: "{}"', args.track)
+logger.debug('Got the detection tiles: "{0}x{0}" scanned by "{1}" worker(s)', args.tiles, args.workers)
+logger.debug('Got the frames\' source: "{}"', args.source)
+logger.debug('Got the recordings\' folder: "{}", every "{}" frame(s)', args.record, args.record_every)
+logger.debug('Got the updates\' worker processes: "{}"', args.shards)
+logger.debug('Got the event loop backend: "{}"', args.loop)
 logger.debug('Got the UI language: "{}"', args.lang)
 logger.debug('Got the delay time: "{}"', args.pause)
+logger.debug('Got the notifications\' window: "{}:00-{}:00"', args.send_from, args.send_until)
+logger.debug('Got the throttling rates: "{}" per user and "{}" in total', args.throttle_rate, args.throttle_global)
@@ -0,0 +1,405 @@
+from typing import Any, List, Optional, Tuple
+
+import cv2
+import numpy as np
+import pyzbar.pyzbar as pyzbar
+
+from core.sampling import log_sampler
+
+
+def create_square(frame: Any, side: int = 240) -> np.array:
+    """Calculates the (x,y)-coordinates of the centered square of side :side: for the captured frame.
+
+    Args:
+        frame (Union[Mat, UMat]): A frame of the webcam's captured stream.
+        [optional] side (int): Length of the side of a square to be drawn in the center of the screen.
+
+    Raises:
+        ValueError: On invalid length of the square. Its side can't be less of 10 and more than the minimum of height
+        and width of the frame.  It can't fit in the frame.
+
+    Returns:
+        square (np.ndarray): A numpy array of the square's (x,y)-coordinates on the frame.
+    """
+
+    height, width = np.size(frame, 0), np.size(frame, 1)
+    image_center = (width // 2, height // 2)
+
+    if side > min(width, height):
+        raise ValueError(
+            "Invalid length of a square. Can't be more than %d.\n"
+            "Web-cam connection has been aborted, the bot is still running. "
+            'Press "CTRL+C" to shutdown the bot completely' % min(width, height)
+        )
+
+    tl = (image_center[0] - (side // 2), image_center[1] - (side // 2))
+    tr = (image_center[0] + (side // 2), image_center[1] - (side // 2))
+    bl = (image_center[0] - (side // 2), image_center[1] + (side // 2))
+    br = (image_center[0] + (side // 2), image_center[1] + (side // 2))
+    points = [tl, tr, br, bl]
+    square = np.array(points, dtype="int0")
+
+    return square
+
+
+def order_points(points: np.ndarray) -> np.ndarray:
+    """Sorts a rectangle's points from top-left to bottom-left, so the points array has the following order:
+    0   1
+    3   2
+
+    Args:
+        points (np.ndarray): A numpy array of a rectangle's (x,y)-coordinates.
+
+    Returns:
+        rect (np.ndarray): The ordered numpy array of the rectangle's coordinates.
+    """
+
+    rect = np.zeros((4, 2), dtype="int0")
+
+    s = points.sum(axis=1)
+    rect[0] = points[np.argmin(s)]
+    rect[2] = points[np.argmax(s)]
+
+    diff = np.diff(points, axis=1)
+    rect[1] = points[np.argmin(diff)]
+    rect[3] = points[np.argmax(diff)]
+
+    return rect
+
+
+def contains_in_area(rectangle: np.ndarray, square: np.ndarray) -> bool:
+    """Checks whether a rectangle fully contains inside the area of a square.
+
+    Args:
+        rectangle (np.array): An ordered numpy array of a rectangle's coordinates.
+        square (np.array): An ordered numpy array of a square's coordinates.
+
+    Returns:
+        Whether the rectangle contains inside the square.  Since the both arrays are ordered it's suffice
+        to check that the top-left and the bottom-right points of the rectangle are both in the square.
+    """
+
+    if ((rectangle[0][0] < square[0][0]) or (rectangle[0][1] < square[0][1])) or (
+        (rectangle[2][0] > square[2][0]) or (rectangle[2][1] > square[2][1])
+    ):
+        return False
+
+    return True
+
+
+def detect_edges(frame: Any, kernel: np.ndarray, color_lower: int = 212, color_upper: int = 255) -> Any:
+    """Thresholds :frame: by the hue of gray and outlines the bright shapes on it.
+
+    Args:
+        frame (Union[Mat, UMat]): A frame (or a part of it) of the webcam's captured stream.
+        kernel (np.ndarray): A kernel for the frame dilation and transformation (to detect the contours of shapes).
+        [optional] color_lower (int): Minimal hue of gray of a detected object to be consider a QR-code.
+        [optional] color_upper (int): Maximal hue of gray of a detected object to be consider a QR-code.
+
+    Returns:
+        edge (Union[Mat, UMat]): A binary image of the detected edges.
+    """
+
+    filter_lower = np.array(color_lower, dtype="uint8")
+    filter_upper = np.array(color_upper, dtype="uint8")
+    mask = cv2.inRange(frame, filter_lower, filter_upper)
+    dilation = cv2.dilate(mask, kernel, iterations=3)
+    closing = cv2.morphologyEx(dilation, cv2.MORPH_GRADIENT, kernel)
+    closing = cv2.morphologyEx(dilation, cv2.MORPH_CLOSE, kernel)
+    closing = cv2.GaussianBlur(closing, (3, 3), 0)
+    edge = cv2.Canny(closing, 175, 250)
+
+    return edge
+
+
+def locate_inside_square(
+    frame: Any,
+    square: np.ndarray,
+    kernel: np.ndarray,
+    area_min: int = 300,
+    color_lower: int = 212,
+    color_upper: int = 255,
+    debug: bool = False,
+    draw: bool = True,
+) -> Optional[np.ndarray]:
+    """Detects and analyzes contours and shapes on the frame.  Returns the rectangle enclosing the first shape
+    whose area is >= :area_min:, whose color hue is >= :color_lower and which contains inside the square.
+
+    Args:
+        frame (Union[Mat, UMat]): A frame of the webcam's captured stream.
+        square (np.ndarray): A numpy array of the square's (x,y)-coordinates on the frame.
+        kernel (np.ndarray): A kernel for the frame dilation and transformation (to detect the contours of shapes).
+        [optional] area_min (int): Minimal area of a detected object to be consider a QR-code.
+        [optional] color_lower (int): Minimal hue of gray of a detected object to be consider a QR-code.
+        [optional] color_upper (int): Maximal hue of gray of a detected object to be consider a QR-code.
+        [optional] debug (boolean): Outputs the detected edges at potential detection.
+        [optional] draw (boolean): Outlines the large enough shapes on the frame.
+
+    Returns:
+        rect (np.ndarray): The ordered numpy array of the enclosing rectangle's coordinates, None if there's none.
+    """
+
+    edge = detect_edges(frame, kernel, color_lower, color_upper)
+    rect = find_candidate(edge, square, area_min, drawn=frame if draw else None)
+
+    if (rect is not None) and debug:
+        cv2.imshow("Edges", edge)
+
+    return rect
+
+
+def find_candidate(edge: Any, square: np.ndarray, area_min: int = 300, drawn: Any = None) -> Optional[np.ndarray]:
+    """Returns the rectangle enclosing the first shape outlined on :edge: whose area is >= :area_min: and which
+    contains inside the square.  This is the test of a potential QR-code shared by the whole-square and the tiled
+    detection.
+
+    Args:
+        edge (Union[Mat, UMat]): A binary image of the detected edges (see :detect_edges:).
+        square (np.ndarray): An ordered numpy array of the square's (x,y)-coordinates on the image.
+        [optional] area_min (int): Minimal area of a detected object to be consider a QR-code.
+        [optional] drawn (Union[Mat, UMat]): The frame to outline every large enough shape on, if set.
+
+    Returns:
+        rect (np.ndarray): The ordered numpy array of the enclosing rectangle's coordinates, None if there's none.
+    """
+
+    contours, hierarchy = cv2.findContours(edge, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
+
+    for contour in contours:
+        area = cv2.contourArea(contour)
+
+        if area < area_min:
+            continue
+
+        rect = cv2.minAreaRect(contour)
+        box = cv2.boxPoints(rect)
+        box = np.int0(box)
+        rect = order_points(box)
+
+        if drawn is not None:
+            cv2.drawContours(drawn, [box], 0, (0, 0, 255), 1)
+
+        if contains_in_area(rect, square):
+            return rect
+
+    return None
+
+
+def detect_inside_square(
+    frame: Any,
+    square: np.ndarray,
+    kernel: np.ndarray,
+    area_min: int = 300,
+    color_lower: int = 212,
+    color_upper: int = 255,
+    debug: bool = False,
+    draw: bool = True,
+) -> Tuple[bool, Any]:
+    """Detects and analyzes contours and shapes on the frame.  If the detected shape's area is >= :area_min:,
+    its color hue is >= :color_lower and a rectangle that encloses the shape contains inside the square returns True
+    and the cropped image of the frame.
+
+    Args:
+        frame (Union[Mat, UMat]): A frame of the webcam's captured stream.
+        square (np.ndarray): A numpy array of the square's (x,y)-coordinates on the frame.
+        kernel (np.ndarray): A kernel for the frame dilation and transformation (to detect the contours of shapes).
+        [optional] area_min (int): Minimal area of a detected object to be consider a QR-code.
+        [optional] color_lower (int): Minimal hue of gray of a detected object to be consider a QR-code.
+        [optional] color_upper (int): Maximal hue of gray of a detected object to be consider a QR-code.
+        [optional] debug (boolean): Crops and outputs an image containing inside the square at potential detection.
+        [optional] draw (boolean): Outlines the large enough shapes on the frame.
+
+    Returns:
+        A tuple where the first element is whether a potential shape has been detected inside the square or not.
+        If it was then the second element is the square-cropped image with the detected shape, None otherwise.
+    """
+
+    rect = locate_inside_square(frame, square, kernel, area_min, color_lower, color_upper, debug, draw)
+
+    if rect is None:
+        return (False, None)
+
+    cropped = frame[square[0][1] : square[2][1], square[0][0] : square[2][0]]
+
+    if debug:
+        cv2.imshow("Cropped", cropped)
+
+    return (True, cropped)
+
+
+def sharpness(image: Any, size: int = 160) -> float:
+    """Estimates how sharp :image: is as the variance of the Laplacian of its downscaled grey copy.
+    Motion-blurred crops score low, so decoding them can be skipped.
+
+    Args:
+        image (Union[Mat, UMat]): A crop of a frame from the web-cam's stream.
+        [optional] size (int): Length in pixels of the longer side of the downscaled copy.
+
+    Returns:
+        The variance of the Laplacian, 0 for an empty image.
+    """
+
+    if (image is None) or (image.size == 0):
+        return 0.0
+
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    scale = size / max(gray.shape[:2])
+
+    if scale < 1:
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+    return float(cv2.Laplacian(gray, cv2.CV_64F).var())
+
+
+class ScanStats:
+    """Counts the outcomes of potential QR-codes passed through the sharpness gate and the decoder.
+
+    Attributes:
+        candidates (int): Number of potential QR-codes detected inside the square.
+        gated (int): Number of candidates skipped as too blurry to decode.
+        attempts (int): Number of candidates passed to the decoder.
+        decoded (int): Number of candidates that have been successfully decoded.
+        sharpness_decoded (float): Sum of the sharpness of the decoded candidates.
+        sharpness_failed (float): Sum of the sharpness of the candidates that couldn't be decoded.
+    """
+
+    def __init__(self):
+        self.candidates = 0
+        self.gated = 0
+        self.attempts = 0
+        self.decoded = 0
+        self.sharpness_decoded = 0.0
+        self.sharpness_failed = 0.0
+
+    def record(self, score: float, gated: bool = False, decoded: bool = False) -> None:
+        self.candidates += 1
+
+        if gated:
+            self.gated += 1
+        elif decoded:
+            self.attempts += 1
+            self.decoded += 1
+            self.sharpness_decoded += score
+        else:
+            self.attempts += 1
+            self.sharpness_failed += score
+
+    def summary(self) -> str:
+        """Describes the decode success rate per candidate (as if there were no gate) and per attempt
+        (with the gate), as well as the average sharpness of the decoded and failed attempts to tune the threshold.
+        """
+
+        failed = self.attempts - self.decoded
+        return (
+            f"candidates={self.candidates} gated={self.gated} attempts={self.attempts} decoded={self.decoded} "
+            f"success per candidate={self.decoded / max(self.candidates, 1):.1%} "
+            f"success per attempt={self.decoded / max(self.attempts, 1):.1%} "
+            f"sharpness of decoded={self.sharpness_decoded / max(self.decoded, 1):.1f} "
+            f"sharpness of failed={self.sharpness_failed / max(failed, 1):.1f}"
+        )
+
+    def __str__(self) -> str:
+        return self.summary()
+
+
+def detect_qr(image: Any, debug: bool = False) -> str:
+    """Tries to locate and decode one (or multiple) QR-codes from :image:.
+
+    Args:
+        image (Union[Mat, UMat]): A square crop of a frame from the web-cam's stream.
+        [optional] debug (boolean): Outputs a copy of :image: with the located QR-codes outlined if there are several.
+
+    Returns:
+        A decoded str of the first located QR-code. None if a QR-code can't be located.
+    """
+
+    codes = pyzbar.decode(cv2.cvtColor(image, cv2.COLOR_BGR2GRAY))
+
+    if not codes:
+        return ""
+
+    if len(codes) > 1:
+        log_sampler.warning("Multiple QR-codes has been detected in the frame. Selecting the first one")
+
+        if debug:
+            outlined = image.copy()
+
+            for decoded in codes:
+                points = np.array(decoded.polygon, np.int32)
+                points = points.reshape((-1, 1, 2))
+                cv2.polylines(outlined, [points], True, (196, 0, 0), 3)
+
+            cv2.imshow("Codes", outlined)
+
+    result = codes[0].data.decode("utf-8")
+    return result
+
+
+def decode_candidate(cropped: Any, stats: ScanStats, sharpness_min: float = 0.0, debug: bool = False) -> str:
+    """Decodes the crop of a potential QR-code unless it's too blurry (see :sharpness:) and records the outcome.
+
+    Args:
+        cropped (Union[Mat, UMat]): The square's crop with a potential QR-code.
+        stats (ScanStats): The stats to record the outcome in.
+        [optional] sharpness_min (float): Minimal sharpness of the crop to try decoding it.
+        [optional] debug (boolean): Outputs the located QR-codes if there are several.
+
+    Returns:
+        address (str): The decoded address, empty if the crop has been skipped or couldn't be decoded.
+    """
+
+    log_sampler.debug("Detected a potential QR-code inside the square")
+    score = sharpness(cropped)
+
+    if score < sharpness_min:
+        stats.record(score, gated=True)
+        log_sampler.debug("Skipped a blurry potential QR-code with sharpness {:.1f}", score)
+        return ""
+
+    address = detect_qr(cropped, debug)
+    stats.record(score, decoded=bool(address))
+    log_sampler.debug("Scan stats: {}", stats, key="stats")
+
+    if not address:
+        log_sampler.debug("Couldn't decode the potential QR-code")
+
+    return address
+
+
+def scan_square(
+    frame: Any,
+    square: np.ndarray,
+    kernel: np.ndarray,
+    area_min: int = 300,
+    color_lower: int = 212,
+    sharpness_min: float = 0.0,
+    stats: Optional[ScanStats] = None,
+    debug: bool = False,
+) -> List[str]:
+    """Searches for a QR-code inside the square on a single frame and decodes it: the whole-square detection the bot
+    runs without the tracking and the tiles, shared with the tools replaying its frames.  Nothing is drawn on the
+    frame unless :debug:, so a frame can be recorded (or replayed from a mapped file) as it is.
+
+    Args:
+        frame (Union[Mat, UMat]): A frame of the webcam's captured stream.
+        square (np.ndarray): A numpy array of the square's (x,y)-coordinates on the frame.
+        kernel (np.ndarray): A kernel for the frame dilation and transformation (to detect the contours of shapes).
+        [optional] area_min (int): Minimal area of a detected object to be consider a QR-code.
+        [optional] color_lower (int): Minimal hue of gray of a detected object to be consider a QR-code.
+        [optional] sharpness_min (float): Minimal sharpness of a potential QR-code to try decoding it.
+        [optional] stats (ScanStats): The stats to record the outcome in.
+        [optional] debug (boolean): Outlines the shapes on the frame and outputs the intermediate images.
+
+    Returns:
+        addresses (list): A list of the decoded addresses, empty if there are none.
+    """
+
+    detected, cropped = detect_inside_square(
+        frame, square, kernel, area_min=area_min, color_lower=color_lower, debug=debug, draw=debug
+    )
+
+    if not detected:
+        return []
+
+    address = decode_candidate(cropped, stats if stats is not None else ScanStats(), sharpness_min, debug)
+    return [address] if address else []
@@ -0,0 +1,52 @@
+import asyncio
+from typing import List
+
+from loguru import logger
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+
+BACKENDS = ["auto", "asyncio", "uvloop"]
+
+
+def available() -> List[str]:
+    """Returns the event loop backends that can be used on this machine."""
+
+    return ["asyncio", "uvloop"] if uvloop is not None else ["asyncio"]
+
+
+def resolve(backend: str) -> str:
+    """Turns :backend: into the one to use: "auto" picks uvloop where it's installed (it's pinned for Linux only),
+    an unavailable backend falls back to the stock asyncio loop.
+    """
+
+    if backend == "auto":
+        return available()[-1]
+
+    if backend not in available():
+        logger.warning('Event loop backend "{}" is not installed, using the stock asyncio loop instead', backend)
+        return "asyncio"
+
+    return backend
+
+
+def install(backend: str = "auto") -> asyncio.AbstractEventLoop:
+    """Makes :backend: the event loop policy of the process and sets a new loop of it as the current one, so the
+    loops created later on (e.g. by the worker processes) are of the same backend.
+
+    Args:
+        [optional] backend (str): One of BACKENDS.
+
+    Returns:
+        loop (asyncio.AbstractEventLoop): The new current loop.
+    """
+
+    backend = resolve(backend)
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy() if backend == "uvloop" else asyncio.DefaultEventLoopPolicy())
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    logger.debug('Running on the "{}" event loop', backend)
+    return loop
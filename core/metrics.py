@@ -0,0 +1,82 @@
+import asyncio
+import collections
+import contextlib
+import time
+from typing import Deque, Dict, Iterator
+
+LAG_PROBE_PERIOD = 0.1
+
+
+class LatencyRecorder:
+    """Collects the latencies of the bot's stages (reading a frame, scanning it, notifying the users, etc.).
+    Keeps only the latest :capacity: samples per stage, so it never grows while nobody reads it.
+
+    Attributes:
+        [optional] capacity (int): Number of the latest samples kept per stage.
+        counts (dict): Total number of samples recorded per stage.
+    """
+
+    def __init__(self, capacity: int = 10000):
+        self.capacity = capacity
+        self.counts: Dict[str, int] = collections.Counter()
+        self._samples: Dict[str, Deque[float]] = {}
+
+    def record(self, stage: str, seconds: float) -> None:
+        samples = self._samples.get(stage)
+
+        if samples is None:
+            samples = self._samples[stage] = collections.deque(maxlen=self.capacity)
+
+        samples.append(seconds)
+        self.counts[stage] += 1
+
+    @contextlib.contextmanager
+    def measure(self, stage: str) -> Iterator[None]:
+        """Records the time spent inside the with-block as a sample of :stage:."""
+
+        started = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - started)
+
+    def drain(self) -> Dict[str, Dict[str, float]]:
+        """Summarizes the samples recorded since the last call and forgets them.
+
+        Returns:
+            summary (dict): Number of samples and their mean, median, 95th percentile and maximum (in milliseconds)
+            per stage.
+        """
+
+        summary = {}
+
+        for stage, samples in self._samples.items():
+            if not samples:
+                continue
+
+            ordered = sorted(samples)
+            samples.clear()
+            summary[stage] = {
+                "count": len(ordered),
+                "mean": 1000 * sum(ordered) / len(ordered),
+                "p50": 1000 * ordered[len(ordered) // 2],
+                "p95": 1000 * ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))],
+                "max": 1000 * ordered[-1],
+            }
+
+        return summary
+
+
+latencies = LatencyRecorder()
+
+
+async def probe_lag(recorder: LatencyRecorder = latencies, period: float = LAG_PROBE_PERIOD) -> None:
+    """Records how late the event loop wakes up a sleeping coroutine, i.e. how long the loop is blocked,
+    as the "loop_lag" stage of :recorder:.
+    """
+
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(period)
+        recorder.record("loop_lag", max(0.0, time.perf_counter() - started - period))
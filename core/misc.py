@@ -1,46 +1,108 @@
-import asyncio
+from typing import Any, Callable, Optional
 
 import sqlanydb
 from aiogram import Bot, Dispatcher
+from aiogram.bot.api import TelegramAPIServer
 from aiogram.types.message import ParseMode
 from aiogram.utils import executor
 from aiogram.utils.exceptions import ValidationError
 from loguru import logger
 
-from core import config
+from core import config, loops
 from core.packages import PackagesLoader
+from core.scheduler import Scheduler, SendWindow
+from core.throttling import ThrottlingMiddleware
+from core.warehouse import Warehouse
 
+loop = loops.install(config.args.loop)
 
 try:
-    bot = Bot(token=config.BOT_TOKEN, validate_token=True, parse_mode=ParseMode.MARKDOWN_V2)
+    bot = Bot(
+        token=config.BOT_TOKEN,
+        validate_token=True,
+        parse_mode=ParseMode.MARKDOWN_V2,
+        server=TelegramAPIServer.from_base(config.BOT_API_URL),
+        loop=loop,
+    )
 except ValidationError:
     logger.critical("Bot token is invalid. Make sure that you've set a valid token in the .env file")
     quit()
 
-loop = asyncio.get_event_loop()
 dp = Dispatcher(bot, loop=loop)
-runner = executor.Executor(dp, skip_updates=config.BOT_SKIPUPDATES)
+throttler = ThrottlingMiddleware(
+    rate=config.args.throttle_rate,
+    burst=config.args.throttle_burst,
+    global_rate=config.args.throttle_global,
+    global_burst=config.args.throttle_global * 2,
+    max_users=config.args.throttle_users,
+    collapse=config.args.collapse,
+)
+
+if throttler.enabled and not config.args.shards:
+    dp.middleware.setup(throttler)
+
+runner = executor.Executor(dp, skip_updates=config.BOT_SKIPUPDATES, loop=loop)
 
 loader = PackagesLoader()
+scheduler: Scheduler = None  # type: ignore
 
-try:
-    logger.debug('Connecting to a SQLA database with UID "{}"', config.DB_UID)
-    conn = sqlanydb.connect(uid=config.DB_UID, pwd=config.DB_PASSWORD)
-    curs = conn.cursor()
-    logger.success(
-        'Successfully connected to SQLAnywhere database as "{}". Reading table "{}"',
-        config.DB_UID,
-        config.DB_TABLE_NAME,
-    )
-except sqlanydb.InterfaceError:
-    logger.exception(
-        "Couldn't connect to SQLAnywhere database. "
-        'Make sure that you\'ve correctly set the full path to "dbcapi.dll" in the .env file'
-    )
-    quit()
-except (TypeError, sqlanydb.OperationalError):
-    logger.exception(
-        "Couldn't connect to SQLAnywhere database. "
-        "Make sure that you've correctly set your UID and password in the .env file"
+
+def open_scheduler() -> Scheduler:
+    """Opens the file of the deferred notifications.  Only the main process does it, the worker processes of
+    "--shards" handle the updates and never defer anything.
+    """
+
+    global scheduler
+
+    scheduler = Scheduler(
+        config.args.deferred,
+        SendWindow(config.args.send_from, config.args.send_until),
+        batch=config.args.deferred_batch,
     )
-    quit()
+    return scheduler
+
+
+def connect(warehouse: Warehouse) -> Any:
+    """Opens a connection to the :warehouse:'s SQL Anywhere database."""
+
+    return sqlanydb.connect(uid=warehouse.uid, pwd=warehouse.password)
+
+
+warehouses = config.WAREHOUSES
+
+
+def open_warehouses(connect: Callable[[Warehouse], Any] = connect, pool_size: Optional[int] = None) -> None:
+    """Opens the connection pools of all warehouses, quits if the database can't be connected to.
+
+    Args:
+        [optional] connect (callable): Opens a single connection for a warehouse, to SQL Anywhere by default.
+        [optional] pool_size (int): Number of the connections per warehouse, as defined for each of them if not set.
+    """
+
+    try:
+        for warehouse in warehouses:
+            logger.debug(
+                'Connecting to a SQLA database with UID "{}" for warehouse "{}"', warehouse.uid, warehouse.name
+            )
+
+            if pool_size is not None:
+                warehouse.pool_size = pool_size
+
+            warehouse.connect(connect)
+            logger.success(
+                'Successfully connected to SQLAnywhere database as "{}". Reading table "{}"',
+                warehouse.uid,
+                warehouse.table,
+            )
+    except sqlanydb.InterfaceError:
+        logger.exception(
+            "Couldn't connect to SQLAnywhere database. "
+            'Make sure that you\'ve correctly set the full path to "dbcapi.dll" in the .env file'
+        )
+        quit()
+    except (TypeError, sqlanydb.OperationalError):
+        logger.exception(
+            "Couldn't connect to SQLAnywhere database. "
+            "Make sure that you've correctly set your UID and password in the .env file"
+        )
+        quit()
@@ -1,52 +1,34 @@
 import asyncio
-from typing import Any, Tuple
+import time
+from typing import Any, List, Optional, Tuple
 
 import cv2
 import numpy as np
-import pyzbar.pyzbar as pyzbar
 from loguru import logger
 from PIL import Image, ImageDraw, ImageFont
 
 from core.config import args
+from core.detection import (
+    ScanStats,
+    create_square,
+    decode_candidate,
+    locate_inside_square,
+    scan_square,
+)
+from core.metrics import latencies
+from core.recording import RecordingWriter, recording_path
+from core.sampling import log_sampler
+from core.sources import open_capture
+from core.tiling import TiledDetector
+from core import tracking
+from core.tracking import BoxTracker
+from core.warehouse import Warehouse
 from handlers import notify
 
 
-cap = cv2.VideoCapture(0)
-
-
-def create_square(frame: Any, side: int = 240) -> np.array:
-    """Calculates the (x,y)-coordinates of the centered square of side :side: for the captured frame.
-
-    Args:
-        frame (Union[Mat, UMat]): A frame of the webcam's captured stream.
-        [optional] side (int): Length of the side of a square to be drawn in the center of the screen.
-
-    Raises:
-        ValueError: On invalid length of the square. Its side can't be less of 10 and more than the minimum of height
-        and width of the frame.  It can't fit in the frame.
-
-    Returns:
-        square (np.ndarray): A numpy array of the square's (x,y)-coordinates on the frame.
-    """
-
-    height, width = np.size(frame, 0), np.size(frame, 1)
-    image_center = (width // 2, height // 2)
-
-    if side > min(width, height):
-        raise ValueError(
-            "Invalid length of a square. Can't be more than %d.\n"
-            "Web-cam connection has been aborted, the bot is still running. "
-            'Press "CTRL+C" to shutdown the bot completely' % min(width, height)
-        )
-
-    tl = (image_center[0] - (side // 2), image_center[1] - (side // 2))
-    tr = (image_center[0] + (side // 2), image_center[1] - (side // 2))
-    bl = (image_center[0] - (side // 2), image_center[1] + (side // 2))
-    br = (image_center[0] + (side // 2), image_center[1] + (side // 2))
-    points = [tl, tr, br, bl]
-    square = np.array(points, dtype="int0")
-
-    return square
+captures: List[Any] = []
+recorders: List[RecordingWriter] = []
+stats = ScanStats()
 
 
 def draw_bounds(
@@ -173,191 +155,232 @@ def draw_bounds(
     return image
 
 
-def order_points(points: np.ndarray) -> np.ndarray:
-    """Sorts a rectangle's points from top-left to bottom-left, so the points array has the following order:
-    0   1
-    3   2
+async def scan_qr(warehouse: Warehouse, source: str, title: str = "Live Capture") -> None:
+    """Main function that creates a screen with the capture, monitors the web-cam's stream, searches for a QR-code in
+    a squared area and passes the decoded QR-code to the notify module.
+    The detection's settings are defined in the Argparse Namespace that's set in config.py/args.
 
     Args:
-        points (np.ndarray): A numpy array of a rectangle's (x,y)-coordinates.
-
-    Returns:
-        rect (np.ndarray): The ordered numpy array of the rectangle's coordinates.
+        warehouse (Warehouse): The warehouse the web-cam belongs to.
+        source (str): The web-cam's index or another source of the frames (see the "--source" argument).
+        [optional] title (str): The title of the capture's screen.
     """
 
-    rect = np.zeros((4, 2), dtype="int0")
+    try:
+        cap = open_capture(source, args.soak_image)
+    except (OSError, ValueError) as ex:
+        logger.critical('Couldn\'t open the source "{}": {}', source, ex)
+        return
 
-    s = points.sum(axis=1)
-    rect[0] = points[np.argmin(s)]
-    rect[2] = points[np.argmax(s)]
+    if (cap is None) or (not cap.isOpened()):
+        logger.critical("No video stream detected. Make sure that you've got a webcam connected and enabled")
+        return
 
-    diff = np.diff(points, axis=1)
-    rect[1] = points[np.argmin(diff)]
-    rect[3] = points[np.argmax(diff)]
+    captures.append(cap)
+    kernel = np.ones((args.kernel, args.kernel), np.uint8)
+    square = create_square(cap.read()[1], side=args.side)
+    tiler = (
+        TiledDetector(args.tiles, args.tile_overlap, args.workers, args.tile_processes, args.sharpness)
+        if args.tiles > 1
+        else None
+    )
+    tracker = BoxTracker(stable_frames=args.track_frames, retry_frames=args.track_retry) if args.track else None
+    recorder = open_recorder(warehouse, source) if args.record else None
+    number = 0
 
-    return rect
+    while cap.isOpened():
+        with latencies.measure("read"):
+            ret, frame = cap.read()
 
+        captured = time.time()
 
-def contains_in_area(rectangle: np.ndarray, square: np.ndarray) -> bool:
-    """Checks whether a rectangle fully contains inside the area of a square.
+        key = -1 if args.headless else cv2.waitKey(1)
 
-    Args:
-        rectangle (np.array): An ordered numpy array of a rectangle's coordinates.
-        square (np.array): An ordered numpy array of a square's coordinates.
+        if not ret or square is None or ((key & 0xFF) in {27, ord("Q"), ord("q")}):
+            release(cap, title)
 
-    Returns:
-        Whether the rectangle contains inside the square.  Since the both arrays are ordered it's suffice
-        to check that the top-left and the bottom-right points of the rectangle are both in the square.
-    """
+            if recorder is not None:
+                close_recorder(recorder)
+
+            if tiler is not None:
+                tiler.shutdown()
+
+            logger.info(
+                'Web-cam "{}" of warehouse "{}" has been shut down, the bot is still running. '
+                'Press "CTRL+C" to shutdown the bot completely',
+                source,
+                warehouse.name,
+            )
+            return
+
+        if not args.headless:
+            image = draw_bounds(frame, square, lang=args.lang)
+            cv2.imshow(title, image)
+
+        await asyncio.sleep(0.1)
+        # Only the square is recorded, as the detection never looks outside of it.  The scan outlines the shapes on
+        # the frame in the debug mode only, so only then the recorded square is a copy
+        raw = crop_square(frame, square, args.side) if recorder is not None else None
 
-    if ((rectangle[0][0] < square[0][0]) or (rectangle[0][1] < square[0][1])) or (
-        (rectangle[2][0] > square[2][0]) or (rectangle[2][1] > square[2][1])
-    ):
-        return False
+        if (raw is not None) and args.verbose and not args.headless:
+            raw = raw.copy()
 
-    return True
+        candidates, gated = stats.candidates, stats.gated
 
+        with latencies.measure("scan"), warehouse.measure("frames"):
+            addresses = await scan_frame(frame, square, kernel, tiler, tracker)
 
-def detect_inside_square(
+        warehouse.metrics["decoded"] += len(addresses)
+        number += 1
+
+        if (recorder is not None) and ((number % args.record_every == 0) or (stats.candidates > candidates)):
+            recorder.write(
+                raw, captured, candidates=stats.candidates - candidates, gated=stats.gated - gated, addresses=addresses
+            )
+
+        for address in addresses:
+            logger.debug('Detected: "{}"', address)
+            await notify.start(address, args.pause, warehouse=warehouse)
+
+
+async def scan_frame(
     frame: Any,
     square: np.ndarray,
     kernel: np.ndarray,
-    area_min: int = 300,
-    color_lower: int = 212,
-    color_upper: int = 255,
-    debug: bool = False,
-) -> Tuple[bool, Any]:
-    """Detects and analyzes contours and shapes on the frame.  If the detected shape's area is >= :area_min:,
-    its color hue is >= :color_lower and a rectangle that encloses the shape contains inside the square returns True
-    and the cropped image of the frame.
+    tiler: Optional[TiledDetector] = None,
+    tracker: Optional[BoxTracker] = None,
+) -> List[str]:
+    """Searches for QR-codes inside the square on a single frame and decodes them.
 
     Args:
         frame (Union[Mat, UMat]): A frame of the webcam's captured stream.
         square (np.ndarray): A numpy array of the square's (x,y)-coordinates on the frame.
         kernel (np.ndarray): A kernel for the frame dilation and transformation (to detect the contours of shapes).
-        [optional] area_min (int): Minimal area of a detected object to be consider a QR-code.
-        [optional] color_lower (int): Minimal hue of gray of a detected object to be consider a QR-code.
-        [optional] color_upper (int): Maximal hue of gray of a detected object to be consider a QR-code.
-        [optional] debug (boolean): Crops and outputs an image containing inside the square at potential detection.
+        [optional] tiler (TiledDetector): Scans the square's tiles in parallel if set.
+        [optional] tracker (BoxTracker): Tracks a detected candidate and decodes it once it's still if set.
+        Not used along with :tiler:.
 
     Returns:
-        A tuple where the first element is whether a potential shape has been detected inside the square or not.
-        If it was then the second element is the square-cropped image with the detected shape, None otherwise.
+        addresses (list): A list of the decoded addresses, empty if there are none.
     """
 
-    filter_lower = np.array(color_lower, dtype="uint8")
-    filter_upper = np.array(color_upper, dtype="uint8")
-    mask = cv2.inRange(frame, filter_lower, filter_upper)
-    dilation = cv2.dilate(mask, kernel, iterations=3)
-    closing = cv2.morphologyEx(dilation, cv2.MORPH_GRADIENT, kernel)
-    closing = cv2.morphologyEx(dilation, cv2.MORPH_CLOSE, kernel)
-    closing = cv2.GaussianBlur(closing, (3, 3), 0)
-    edge = cv2.Canny(closing, 175, 250)
+    if tiler is not None:
+        codes = await tiler.detect_async(frame, square, kernel, area_min=args.area, color_lower=args.color, stats=stats)
+        log_sampler.debug("Scan stats: {}", stats, key="stats")
+        return [address for (address, polygon) in codes]
 
-    contours, hierarchy = cv2.findContours(edge, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
+    debug = args.verbose and not args.headless
 
-    for contour in contours:
-        area = cv2.contourArea(contour)
+    if tracker is None:
+        return scan_square(
+            frame, square, kernel, args.area, args.color, sharpness_min=args.sharpness, stats=stats, debug=debug
+        )
 
-        if area < area_min:
-            continue
+    cropped = track_candidate(frame, square, kernel, tracker)
 
-        rect = cv2.minAreaRect(contour)
-        box = cv2.boxPoints(rect)
-        box = np.int0(box)
-        rect = order_points(box)
-        cv2.drawContours(frame, [box], 0, (0, 0, 255), 1)
+    if cropped is None:
+        return []
 
-        if not contains_in_area(rect, square):
-            continue
+    address = decode_candidate(cropped, stats, args.sharpness, debug)
+    tracker.attempt(decoded=bool(address))
+    return [address] if address else []
 
-        cropped = frame[square[0][1] : square[2][1], square[0][0] : square[2][0]]
 
-        if debug:
-            cv2.imshow("Edges", edge)
-            cv2.imshow("Cropped", cropped)
+def track_candidate(frame: Any, square: np.ndarray, kernel: np.ndarray, tracker: BoxTracker) -> Any:
+    """Follows the tracked candidate on :frame: or, if there's none, runs the full detection to find a new one
+    (see core.tracking.track_candidate).  The shapes aren't outlined on the frame, so the tracker's template and
+    the decoded crop stay clean.
 
-        return (True, cropped)
+    Args:
+        frame (Union[Mat, UMat]): A frame of the webcam's captured stream.
+        square (np.ndarray): A numpy array of the square's (x,y)-coordinates on the frame.
+        kernel (np.ndarray): A kernel for the frame dilation and transformation (to detect the contours of shapes).
+        tracker (BoxTracker): The tracker of the candidate.
 
-    return (False, None)
+    Returns:
+        The square's crop to decode once the candidate has become stable inside it, None otherwise.
+    """
 
+    lost = tracker.lost
+    cropped = tracking.track_candidate(
+        frame,
+        square,
+        tracker,
+        lambda image: locate_inside_square(
+            image,
+            square,
+            kernel,
+            area_min=args.area,
+            color_lower=args.color,
+            debug=args.verbose and not args.headless,
+            draw=False,
+        ),
+    )
 
-def detect_qr(image: Any) -> str:
-    """Tries to locate and decode one (or multiple) QR-codes from :image:.
+    if tracker.lost > lost:
+        log_sampler.debug("Lost track of the potential QR-code")
 
-    Args:
-        image (Union[Mat, UMat]): A square crop of a frame from the web-cam's stream.
+    return cropped
 
-    Returns:
-        A decoded str of the first located QR-code. None if a QR-code can't be located.
+
+def crop_square(frame: Any, square: np.ndarray, side: int) -> Any:
+    """Returns a view of the :side: by :side: part of :frame: the square starts at.  The centered square of the same
+    side created on it (see core.detection.create_square) covers the same pixels as :square: on the whole frame,
+    so the recorded crops are replayed just like the full frames.
     """
 
-    img = image.copy()
-    img_gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    codes = pyzbar.decode(img_gray)
+    (left, top) = square[0]
+    return frame[top : top + side, left : left + side]
 
-    if not codes:
-        return ""
 
-    if len(codes) > 1:
-        logger.warning("Multiple QR-codes has been detected in the frame. Selecting the first one")
+def open_recorder(warehouse: Warehouse, source: str) -> RecordingWriter:
+    """Starts recording the squares of the frames of a web-cam (see crop_square) into a new file in the "--record"
+    folder, along with the settings needed to replay them.
+    """
 
-        for decoded in codes:
-            points = np.array(decoded.polygon, np.int32)
-            points = points.reshape((-1, 1, 2))
-            cv2.polylines(image, [points], True, (196, 0, 0), 3)
+    settings = {key: getattr(args, key) for key in ("area", "color", "side", "kernel", "sharpness", "tiles", "track")}
+    recorder = RecordingWriter(
+        recording_path(args.record, warehouse.name, source),
+        dict(warehouse=warehouse.name, source=source, every=args.record_every, cropped=True, settings=settings),
+    )
+    recorders.append(recorder)
+    logger.info('Recording the frames of web-cam "{}" to "{}"', source, recorder.path)
+    return recorder
 
-    result = codes[0].data.decode("utf-8")
-    return result
 
+def close_recorder(recorder: RecordingWriter) -> None:
+    recorder.close()
 
-async def scan_qr() -> None:
-    """Main function that creates a screen with the capture, monitors the web-cam's stream, searches for a QR-code in
-    a squared area and passes the decoded QR-code to the notify module.
-    All required arguments are defined in the Argparse Namespace that's set in config.py/args, hence, no arguments in
-    this coroutine function.
-    """
+    if recorder in recorders:
+        recorders.remove(recorder)
 
-    if (cap is None) or (not cap.isOpened()):
-        logger.critical("No video stream detected. Make sure that you've got a webcam connected and enabled")
-        return
 
-    kernel = np.ones((2, 2), np.uint8)
-    square = create_square(cap.read()[1], side=args.side)
+def release(cap: Any, title: str) -> None:
+    """Releases a single web-cam capture and closes its screen."""
 
-    while cap.isOpened():
-        ret, frame = cap.read()
-        key = cv2.waitKey(1)
+    if not args.headless:
+        cv2.destroyWindow(title)
 
-        if not ret or square is None or ((key & 0xFF) in {27, ord("Q"), ord("q")}):
-            free_all()
-            logger.info(
-                'Web-cam has been shut down, the bot is still running. Press "CTRL+C" to shutdown the bot completely'
-            )
-            return
+    cap.release()
 
-        image = draw_bounds(frame, square, lang=args.lang)
-        cv2.imshow("Live Capture", image)
-        await asyncio.sleep(0.1)
+    if cap in captures:
+        captures.remove(cap)
 
-        detected, cropped = detect_inside_square(
-            frame, square, kernel, area_min=args.area, color_lower=args.color, debug=args.verbose
-        )
 
-        if not detected:
-            continue
+def free_all() -> None:
+    """Releases all web-cam captures and finishes their recordings."""
 
-        address = detect_qr(cropped)
+    logger.info("Scan stats: {}", stats.summary())
 
-        if not address:
-            continue
+    if not args.headless:
+        cv2.destroyAllWindows()
 
-        logger.debug('Detected: "{}"', address)
-        await notify.start(address, args.pause)
+    for cap in captures:
+        cap.release()
 
+    captures.clear()
 
-def free_all() -> None:
-    """Releases the web-cam capture."""
+    for recorder in recorders:
+        recorder.close()
 
-    cv2.destroyAllWindows()
-    cap.release()
+    recorders.clear()
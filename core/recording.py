@@ -0,0 +1,246 @@
+import json
+import mmap
+import os
+import pathlib
+import queue
+import re
+import struct
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Tuple
+
+import numpy as np
+from loguru import logger
+
+MAGIC = b"QRREC\x00\x01\x00"
+SUFFIX = ".qrrec"
+ALIGNMENT = 16
+CHUNK = struct.Struct("<4sIQ")
+HEADER, FRAME = b"HEAD", b"FRAM"
+FLUSH_FRAMES = 32
+MAX_BYTES = 64 * 1024 * 1024
+CLOSE_TIMEOUT = 10.0
+
+
+def recording_path(folder: str, warehouse: str, source: str) -> str:
+    """Returns a new recording's path in :folder: named after the warehouse, the camera and the current time."""
+
+    name = "-".join(re.sub(r"\W+", "_", part).strip("_") for part in (warehouse, source, time.strftime("%Y%m%d%H%M%S")))
+    return str(pathlib.Path(folder) / f"{name}{SUFFIX}")
+
+
+def encode_chunk(kind: bytes, metadata: Dict[str, Any], offset: int, payload_size: int = 0) -> bytes:
+    """Returns the chunk's header and JSON metadata, padded so the payload following them at :offset: is aligned."""
+
+    encoded = json.dumps(metadata, separators=(",", ":"), default=str).encode()
+    end = offset + CHUNK.size + len(encoded)
+    encoded += b" " * (-end % ALIGNMENT)
+    return CHUNK.pack(kind, len(encoded), payload_size) + encoded
+
+
+class RecordingWriter:
+    """Writes the frames of a camera along with the outcomes of their scans into a recording file.
+    The file starts with MAGIC followed by chunks, each made of a CHUNK header (the chunk's kind, the size of its
+    JSON metadata and the size of its payload), the metadata and the payload.  The first chunk holds the metadata
+    of the whole recording, every following one a raw frame, aligned so it's readable in place (see Recording).
+    The frames are written by a background thread, so the recording never blocks the event loop: when the disk
+    can't keep up, the frames that would take the queued ones over :max_bytes: are dropped and counted.
+    The file is flushed every :flush_frames: frames, so a crash loses only the last few of them.  Once a write fails
+    (e.g. the disk is full), the recording stops and the following frames are dropped.
+
+    Attributes:
+        path (str): Path to the recording file.
+        metadata (dict): Metadata of the recording, e.g. the source and the detection's settings.
+        [optional] max_bytes (int): Maximal size in bytes of the frames waiting to be written.
+        [optional] flush_frames (int): Number of the frames written between the flushes of the file.
+        written (int): Number of the written frames.
+        dropped (int): Number of the dropped frames.
+        failed (bool): Whether a write has failed.
+    """
+
+    def __init__(
+        self, path: str, metadata: Dict[str, Any], max_bytes: int = MAX_BYTES, flush_frames: int = FLUSH_FRAMES
+    ):
+        pathlib.Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.metadata = dict(metadata, started=time.time())
+        self.max_bytes = max_bytes
+        self.flush_frames = flush_frames
+        self.written = 0
+        self.dropped = 0
+        self.failed = False
+        self._file = open(path, "wb")
+        self._file.write(MAGIC)
+        self._file.write(encode_chunk(HEADER, self.metadata, len(MAGIC)))
+        self._offset = self._file.tell()
+        self._queue: queue.Queue = queue.Queue()
+        self._queued_bytes = 0
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="recorder", daemon=True)
+        self._thread.start()
+
+    def write(self, frame: np.ndarray, timestamp: float, **outcome: Any) -> None:
+        """Queues :frame: captured at :timestamp: along with the :outcome: of its scan.
+        The frame must not be changed afterwards, pass a copy if it's going to be drawn on.
+        """
+
+        if self.failed:
+            self.dropped += 1
+            return
+
+        with self._lock:
+            if self._queued_bytes + frame.nbytes > self.max_bytes:
+                self.dropped += 1
+                return
+
+            self._queued_bytes += frame.nbytes
+
+        self._queue.put_nowait((frame, timestamp, outcome))
+
+    def close(self, timeout: float = CLOSE_TIMEOUT) -> None:
+        """Writes the queued frames and closes the file, waiting for the writing thread for :timeout: seconds
+        at most.
+        """
+
+        if self._file.closed:
+            return
+
+        if self._thread.is_alive():
+            self._queue.put_nowait(None)
+            self._thread.join(timeout)
+
+        if self._thread.is_alive():
+            logger.warning('Recording to "{}" hasn\'t finished in {} second(s), closing it anyway', self.path, timeout)
+
+        self._file.close()
+        logger.info('Recorded {} frame(s) to "{}", dropped {}', self.written, self.path, self.dropped)
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+
+            if item is None:
+                break
+
+            if self.failed:
+                self.dropped += 1
+            else:
+                try:
+                    self._write(*item)
+                except (OSError, ValueError) as ex:
+                    self.failed = True
+                    self.dropped += 1
+                    logger.error('Couldn\'t write a frame to "{}", stopping the recording: {}', self.path, ex)
+
+            with self._lock:
+                self._queued_bytes -= item[0].nbytes
+
+        try:
+            self._file.flush()
+        except (OSError, ValueError):
+            pass
+
+    def _write(self, frame: np.ndarray, timestamp: float, outcome: Dict[str, Any]) -> None:
+        frame = np.ascontiguousarray(frame)
+        metadata = dict(outcome, index=self.written, time=timestamp, shape=frame.shape, dtype=frame.dtype.str)
+        chunk = encode_chunk(FRAME, metadata, self._offset, frame.nbytes)
+        self._file.write(chunk)
+        self._file.write(memoryview(frame).cast("B"))
+        self._offset += len(chunk) + frame.nbytes
+        self.written += 1
+
+        if self.written % self.flush_frames == 0:
+            self._file.flush()
+
+
+class Recording:
+    """A recording file written by RecordingWriter, memory-mapped for reading.  The frames are numpy arrays viewing
+    the mapped file, so reading a frame copies nothing and only the pages actually accessed are loaded.  The mapping
+    is copy-on-write: drawing on a frame (as the detection does) changes the mapped copy, never the file.
+    A recording cut off by a crash is read up to its last complete frame.  The frames may be the squares cropped
+    out of the captured frames (see core.qr_cam.crop_square), as the metadata's "cropped" tells.
+
+    Attributes:
+        path (str): Path to the recording file.
+        metadata (dict): Metadata of the recording.
+        frames (list): Offsets and metadata of the recording's frames.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.frames: List[Tuple[int, Dict[str, Any]]] = []
+
+        with open(path, "rb") as file:
+            size = os.fstat(file.fileno()).st_size
+
+            if size < len(MAGIC) + CHUNK.size:
+                raise ValueError(f'"{path}" is not a recording, it\'s too short ({size} byte(s))')
+
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_COPY)
+
+        if self._map[: len(MAGIC)] != MAGIC:
+            self._map.close()
+            raise ValueError(f'"{path}" is not a recording')
+
+        chunks = self._chunks()
+        self.metadata = next(chunks, (0, {}))[1]
+        self.frames.extend(chunks)
+
+    def __len__(self) -> int:
+        return len(self.frames)
+
+    def __getitem__(self, index: int) -> Tuple[np.ndarray, Dict[str, Any]]:
+        """Returns the frame number :index: along with its metadata."""
+
+        offset, metadata = self.frames[index]
+        frame = np.frombuffer(
+            self._map, dtype=np.dtype(metadata["dtype"]), count=int(np.prod(metadata["shape"])), offset=offset
+        )
+        return (frame.reshape(metadata["shape"]), metadata)
+
+    def __iter__(self) -> Iterator[Tuple[np.ndarray, Dict[str, Any]]]:
+        for index in range(len(self.frames)):
+            yield self[index]
+
+    def __enter__(self) -> "Recording":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Unmaps the file, unless some frames are still in use (then it's unmapped once they're gone)."""
+
+        try:
+            self._map.close()
+        except BufferError:
+            pass
+
+    def _chunks(self) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        offset = len(MAGIC)
+
+        while offset + CHUNK.size <= len(self._map):
+            kind, metadata_size, payload_size = CHUNK.unpack_from(self._map, offset)
+            start = offset + CHUNK.size + metadata_size
+
+            if start + payload_size > len(self._map):
+                logger.warning('Recording "{}" is cut off after {} frame(s)', self.path, len(self.frames))
+                return
+
+            metadata = json.loads(self._map[offset + CHUNK.size : start])
+
+            if kind in (HEADER, FRAME):
+                yield (start, metadata)
+
+            offset = start + payload_size
+
+
+def find_recordings(paths: List[str]) -> List[str]:
+    """Returns the recordings among :paths:, looking into the folders for the files with SUFFIX."""
+
+    found = []
+
+    for path in map(pathlib.Path, paths):
+        found.extend(sorted(map(str, path.glob(f"*{SUFFIX}"))) if path.is_dir() else [str(path)])
+
+    return found
@@ -0,0 +1,68 @@
+import time
+from typing import Any, Dict, Hashable, Optional
+
+from loguru import logger
+
+
+class LogSampler:
+    """Rate-limits log records of high-frequency events (e.g. per-frame detections), so that verbose logging
+    doesn't slow down the capture loop.  Records sharing the same key are emitted at most once per :interval:
+    seconds; the number of records dropped in between is appended to the next emitted one.
+
+    Attributes:
+        interval (float): Minimal time in seconds between two emitted records with the same key.
+        suppressed (dict): Number of dropped records per key since the last emitted one.
+    """
+
+    def __init__(self, interval: float = 5.0):
+        self.interval = interval
+        self.suppressed: Dict[Hashable, int] = {}
+        self._last: Dict[Hashable, float] = {}
+
+    def log(self, level: str, message: str, *args: Any, key: Optional[Hashable] = None, **kwargs: Any) -> bool:
+        """Emits the record unless a record with the same key was emitted less than :interval: seconds ago.
+
+        Args:
+            level (str): Name of the logging level (e.g. "DEBUG").
+            message (str): The record's message, formatted by loguru with :args: and :kwargs:.
+            *args: Positional arguments of the message.
+            [optional] key (Hashable): Key to group similar records by.  Defaults to the message template.
+            **kwargs: Keyword arguments of the message.
+
+        Returns:
+            Whether the record has been emitted.
+        """
+
+        return self._log(level, message, *args, key=key, **kwargs)
+
+    def debug(self, message: str, *args: Any, **kwargs: Any) -> bool:
+        return self._log("DEBUG", message, *args, **kwargs)
+
+    def info(self, message: str, *args: Any, **kwargs: Any) -> bool:
+        return self._log("INFO", message, *args, **kwargs)
+
+    def warning(self, message: str, *args: Any, **kwargs: Any) -> bool:
+        return self._log("WARNING", message, *args, **kwargs)
+
+    def _log(self, level: str, message: str, *args: Any, key: Optional[Hashable] = None, **kwargs: Any) -> bool:
+        key = message if key is None else key
+        now = time.monotonic()
+        last = self._last.get(key)
+
+        if (last is not None) and (now - last < self.interval):
+            self.suppressed[key] = self.suppressed.get(key, 0) + 1
+            return False
+
+        self._last[key] = now
+        dropped = self.suppressed.pop(key, 0)
+        record = logger.opt(depth=2)
+
+        if dropped:
+            record = record.bind(suppressed=dropped)
+            message = f"{message} ({dropped} similar record(s) suppressed)"
+
+        record.log(level, message, *args, **kwargs)
+        return True
+
+
+log_sampler = LogSampler()
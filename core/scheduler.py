@@ -0,0 +1,297 @@
+import asyncio
+import heapq
+import json
+import pathlib
+import sqlite3
+import time
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import pytz
+from aiogram.utils.exceptions import NetworkError, RetryAfter
+from loguru import logger
+
+
+BATCH_PAUSE = 1.0
+FLUSH_INTERVAL = 1.0
+RETRY_DELAY = 60.0
+MAX_ATTEMPTS = 5
+COLUMNS = {"warehouse": "TEXT NOT NULL DEFAULT ''", "attempts": "INTEGER NOT NULL DEFAULT 0"}
+
+
+class SendWindow:
+    """The daytime window of the recipients' local time when the notifications may be sent.
+
+    Attributes:
+        start (int): The hour the window opens at.
+        end (int): The hour the window closes at, the window wraps around midnight if it's less than :start:.
+        The window is always open if it equals :start:.
+    """
+
+    def __init__(self, start: int, end: int):
+        self.start = start
+        self.end = end
+
+    @property
+    def enabled(self) -> bool:
+        return self.start != self.end
+
+    def allows(self, hour: int) -> bool:
+        if self.start < self.end:
+            return self.start <= hour < self.end
+
+        return (hour >= self.start) or (hour < self.end)
+
+    def release(self, timezone: Optional[str], now: Optional[datetime] = None) -> Optional[float]:
+        """Checks whether a notification may be sent to a recipient in :timezone: right now.
+
+        Args:
+            timezone (str): The recipient's timezone, UTC if it's unknown.
+            [optional] now (datetime): The timezone-aware current time.
+
+        Returns:
+            due (float): The UNIX time the notification has to be deferred to, None if it may be sent now.
+        """
+
+        if not self.enabled:
+            return None
+
+        try:
+            zone = pytz.timezone(timezone or "UTC")
+        except pytz.UnknownTimeZoneError:
+            zone = pytz.utc
+
+        local = (now or datetime.now(pytz.utc)).astimezone(zone)
+
+        if self.allows(local.hour):
+            return None
+
+        opening = local.replace(hour=self.start, minute=0, second=0, microsecond=0, tzinfo=None)
+
+        if opening <= local.replace(tzinfo=None):
+            opening += timedelta(days=1)
+
+        return zone.localize(opening).timestamp()
+
+
+class Scheduler:
+    """Keeps the deferred notifications until they're due and releases them in batches.
+    The due times are kept in a heap, so scheduling a notification is O(log n) and finding the next due one is O(1);
+    the notifications themselves are stored in an SQLite file, so they survive restarts.  A newer notification
+    for the same recipient and address at the same warehouse replaces the pending one, so several warehouses
+    may share the scheduler (and its file).
+    The scheduled notifications are committed by :run: at most every :flush_interval: seconds rather than one by
+    one, and the WAL journal isn't synced on every commit, so scheduling never waits for the disk.  A crash of the
+    bot may lose the notifications of the last :flush_interval: seconds, a crash of the machine those since the
+    last checkpoint.
+    A notification that can't be sent is retried every :retry_delay: seconds.  Network errors are retried for as
+    long as they last, any other error :max_attempts: times at most: then the notification is moved to the "dead"
+    table of the file along with the error, so it can be looked into and doesn't block the others.
+
+    Attributes:
+        path (str): Path to the SQLite file.
+        window (SendWindow): The window of the recipients' local time when the notifications may be sent.
+        [optional] batch (int): Maximal number of the notifications released at once.
+        [optional] pause (float): Time in seconds between the released batches.
+        [optional] flush_interval (float): Maximal time in seconds the scheduled notifications stay uncommitted.
+        [optional] retry_delay (float): Time in seconds to defer a notification by when it couldn't be sent.
+        [optional] max_attempts (int): Number of the failed attempts (other than network errors) to give up after.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        window: SendWindow,
+        batch: int = 25,
+        pause: float = BATCH_PAUSE,
+        flush_interval: float = FLUSH_INTERVAL,
+        retry_delay: float = RETRY_DELAY,
+        max_attempts: int = MAX_ATTEMPTS,
+    ):
+        self.path = path
+        self.window = window
+        self.batch = batch
+        self.pause = pause
+        self.flush_interval = flush_interval
+        self.retry_delay = retry_delay
+        self.max_attempts = max_attempts
+        pathlib.Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode=WAL;")
+        self._conn.execute("PRAGMA synchronous=NORMAL;")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS deferred (id INTEGER PRIMARY KEY AUTOINCREMENT, due REAL NOT NULL, "
+            "telegram_id INTEGER NOT NULL, address TEXT NOT NULL, payload TEXT NOT NULL);"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS dead (id INTEGER PRIMARY KEY, failed REAL NOT NULL, warehouse TEXT NOT NULL, "
+            "telegram_id INTEGER NOT NULL, address TEXT NOT NULL, payload TEXT NOT NULL, error TEXT NOT NULL);"
+        )
+        existing = [column[1] for column in self._conn.execute("PRAGMA table_info(deferred);")]
+
+        for column, definition in COLUMNS.items():
+            if column not in existing:
+                self._conn.execute(f"ALTER TABLE deferred ADD COLUMN {column} {definition};")
+
+        self._conn.execute("DROP INDEX IF EXISTS deferred_recipient;")
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS deferred_warehouse_recipient ON deferred (warehouse, telegram_id, address);"
+        )
+        self._conn.commit()
+        self._heap: List[Tuple[float, int]] = self._conn.execute("SELECT due, id FROM deferred;").fetchall()
+        self._stale = 0
+        self._dirty: Optional[float] = None
+        self._changed = asyncio.Event()
+        heapq.heapify(self._heap)
+
+    @property
+    def pending(self) -> int:
+        """Number of the deferred notifications."""
+
+        return len(self._heap) - self._stale
+
+    def schedule(self, due: float, rows: List[Dict[str, Any]], warehouse: str = "") -> None:
+        """Defers the notification about the orders in :rows: (of the same recipient and address) of :warehouse:
+        until :due:.
+        """
+
+        recipient = (warehouse, rows[0]["telegram_id"], rows[0]["address"])
+        replaced = self._conn.execute(
+            "DELETE FROM deferred WHERE warehouse=? AND telegram_id=? AND address=?;", recipient
+        ).rowcount
+        cursor = self._conn.execute(
+            "INSERT INTO deferred (due, warehouse, telegram_id, address, payload) VALUES (?, ?, ?, ?, ?);",
+            (due, *recipient, json.dumps(rows, default=str)),
+        )
+        self._dirty = self._dirty or time.time()
+        self._stale += replaced
+        heapq.heappush(self._heap, (due, cursor.lastrowid))
+        self._changed.set()
+
+    def flush(self) -> None:
+        """Commits the notifications scheduled since the last commit."""
+
+        if self._dirty is not None:
+            self._conn.commit()
+            self._dirty = None
+
+    async def run(self, send: Callable[[List[Dict[str, Any]]], Awaitable[None]]) -> None:
+        """Passes the due notifications to :send: in batches, waiting for the next one in between.
+        A batch is removed once it's been passed, so the notifications interrupted by a restart are sent again.
+        When Telegram asks to retry later, the rest of the batch is kept and released after the given time;
+        a notification that fails otherwise is kept and deferred by :retry_delay: seconds.
+        """
+
+        logger.info("Got {} deferred notification(s)", self.pending)
+
+        while True:
+            now = time.time()
+
+            if (self._dirty is not None) and (now >= self._dirty + self.flush_interval):
+                self.flush()
+
+            if not self._heap or (self._heap[0][0] > now):
+                self._changed.clear()
+
+                try:
+                    await asyncio.wait_for(self._changed.wait(), self._timeout(now))
+                except asyncio.TimeoutError:
+                    pass
+
+                continue
+
+            ids = []
+
+            while self._heap and (self._heap[0][0] <= now) and (len(ids) < self.batch):
+                ids.append(heapq.heappop(self._heap)[1])
+
+            records = self._conn.execute(
+                "SELECT id, due, payload, attempts FROM deferred WHERE id IN (%s) ORDER BY due;"
+                % ", ".join("?" * len(ids)),
+                ids,
+            ).fetchall()
+            self._stale -= len(ids) - len(records)
+            pause = await self._release(records, send)
+
+            if records:
+                logger.info("Released {} deferred notification(s), {} still pending", len(records), self.pending)
+
+            await asyncio.sleep(max(self.pause, pause))
+
+    async def _release(
+        self, records: List[Tuple[int, float, str, int]], send: Callable[[List[Dict[str, Any]]], Awaitable[None]]
+    ) -> float:
+        """Passes :records: to :send: and removes those passed, keeps the rest (see Scheduler).
+
+        Returns:
+            pause (float): Time in seconds Telegram has asked to wait for, 0 if it hasn't.
+        """
+
+        sent, failed, dead, pause = [], [], [], 0.0
+
+        for index, (record_id, due, payload, attempts) in enumerate(records):
+            try:
+                await send(json.loads(payload))
+            except RetryAfter as ex:
+                pause = float(ex.timeout)
+                logger.warning(
+                    "Flood control: keeping {} deferred notification(s) for {} second(s)", len(records) - index, pause
+                )
+
+                for kept in records[index:]:
+                    heapq.heappush(self._heap, (kept[1], kept[0]))
+
+                break
+            except NetworkError as ex:
+                logger.warning(
+                    "Couldn't send deferred notification {}, retrying in {}s: {}", record_id, self.retry_delay, ex
+                )
+                failed.append((0, record_id))
+            except Exception as ex:
+                if attempts + 1 >= self.max_attempts:
+                    logger.exception(
+                        "Couldn't send deferred notification {}, giving up after {} attempt(s)", record_id, attempts + 1
+                    )
+                    dead.append((time.time(), repr(ex), record_id))
+                else:
+                    logger.exception(
+                        "Couldn't send deferred notification {}, retrying in {}s", record_id, self.retry_delay
+                    )
+                    failed.append((1, record_id))
+            else:
+                sent.append(record_id)
+
+        retried = time.time() + self.retry_delay
+        self._conn.executemany(
+            "INSERT INTO dead (id, failed, warehouse, telegram_id, address, payload, error) "
+            "SELECT id, ?, warehouse, telegram_id, address, payload, ? FROM deferred WHERE id=?;",
+            dead,
+        )
+        self._conn.executemany(
+            "DELETE FROM deferred WHERE id=?;", [(record_id,) for record_id in sent + [item[2] for item in dead]]
+        )
+        self._conn.executemany(
+            "UPDATE deferred SET due=?, attempts=attempts+? WHERE id=?;",
+            [(retried, counted, record_id) for (counted, record_id) in failed],
+        )
+        self._conn.commit()
+        self._dirty = None
+
+        for counted, record_id in failed:
+            heapq.heappush(self._heap, (retried, record_id))
+
+        return pause
+
+    def _timeout(self, now: float) -> Optional[float]:
+        """Returns the time in seconds until the next notification is due or the next commit, None if there's none."""
+
+        deadlines = [self._heap[0][0]] if self._heap else []
+
+        if self._dirty is not None:
+            deadlines.append(self._dirty + self.flush_interval)
+
+        return max(0.0, min(deadlines) - now) if deadlines else None
+
+    def close(self) -> None:
+        self.flush()
+        self._conn.close()
@@ -0,0 +1,261 @@
+import asyncio
+import bisect
+import collections
+import functools
+import hashlib
+import multiprocessing
+import os
+import pathlib
+import signal
+from typing import Any, Callable, Dict, List, Optional
+
+from aiogram import Bot, Dispatcher, types
+from aiogram.utils import executor
+from loguru import logger
+
+from core.throttling import ThrottlingMiddleware
+
+
+REPLICAS = 64
+STOP_TIMEOUT = 10.0
+SHARD_ENV = "BOT_SHARD"
+
+
+class HashRing:
+    """Consistent hashing of the users' Telegram IDs onto the workers.  Every worker owns :replicas: points of the
+    ring, so the users are spread evenly and changing the number of the workers moves only ~1/N of them.
+
+    Attributes:
+        nodes (int): Number of the workers.
+        [optional] replicas (int): Number of the ring's points per worker.
+    """
+
+    def __init__(self, nodes: int, replicas: int = REPLICAS):
+        points = sorted((self._hash(f"{node}:{replica}"), node) for node in range(nodes) for replica in range(replicas))
+        self.nodes = nodes
+        self._keys = [key for key, _ in points]
+        self._nodes = [node for _, node in points]
+
+    def node(self, key: Any) -> int:
+        """Returns the index of the worker owning :key:."""
+
+        return self._nodes[bisect.bisect(self._keys, self._hash(str(key))) % len(self._keys)]
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+
+def user_of(update: Dict[str, Any]) -> int:
+    """Returns the Telegram ID of the user (or the chat) an update came from, 0 if it has got none."""
+
+    for key, value in update.items():
+        if isinstance(value, dict):
+            sender = value.get("from") or value.get("chat") or {}
+
+            if "id" in sender:
+                return sender["id"]
+
+    return 0
+
+
+class ShardRouter:
+    """Routes the updates received by the front process to the worker processes running the handlers, by the
+    consistent hash of the users' Telegram IDs.  The updates of a single user always go to the same worker, which
+    handles them in order, while the updates of different users are handled in parallel on several cores.
+    The updates received at once are passed to every worker in a single batch.
+
+    Attributes:
+        shards (int): Number of the workers.
+        ring (HashRing): The ring mapping the users onto the workers.
+        routed (collections.Counter): Number of the updates passed to each worker.
+        [optional] connect (callable): Opens a warehouse's database connection in a worker, see misc.open_warehouses.
+        It's passed to the workers, so it has to be a module-level function.
+        [optional] pool_size (int): Number of the database connections per warehouse in a worker.
+        [optional] throttler (ThrottlingMiddleware): Limits the updates before they're routed, if set.
+    """
+
+    def __init__(
+        self,
+        shards: int,
+        connect: Optional[Callable[[Any], Any]] = None,
+        pool_size: Optional[int] = None,
+        throttler: Optional[ThrottlingMiddleware] = None,
+    ):
+        context = multiprocessing.get_context("spawn")
+        self.shards = shards
+        self.ring = HashRing(shards)
+        self.routed: collections.Counter = collections.Counter()
+        self.queues = [context.Queue() for _ in range(shards)]
+        self.processes = [
+            context.Process(target=work, args=(index, queue, connect, pool_size), name=f"shard-{index}", daemon=True)
+            for index, queue in enumerate(self.queues)
+        ]
+        self.throttler = throttler
+        self._pending: Dict[int, List[Dict[str, Any]]] = {}
+
+    def start(self) -> None:
+        for index, process in enumerate(self.processes):
+            os.environ[SHARD_ENV] = str(index)
+
+            try:
+                process.start()
+            finally:
+                del os.environ[SHARD_ENV]
+
+        logger.info("Started {} worker process(es) handling the updates", self.shards)
+
+    async def route(self, update: types.Update) -> None:
+        if self.throttler is not None:
+            self.throttler.check_update(update)
+
+        data = update.to_python()
+
+        if not self._pending:
+            asyncio.get_event_loop().call_soon(self.flush)
+
+        self._pending.setdefault(self.ring.node(user_of(data)), []).append(data)
+
+    def flush(self) -> None:
+        for shard, batch in self._pending.items():
+            self.queues[shard].put(batch)
+            self.routed[shard] += len(batch)
+
+        self._pending = {}
+
+    def stop(self, timeout: float = STOP_TIMEOUT) -> None:
+        """Lets the workers finish the queued updates and stops them."""
+
+        self.flush()
+
+        for queue in self.queues:
+            queue.put(None)
+
+        for process in self.processes:
+            process.join(timeout)
+
+            if process.is_alive():
+                logger.warning("Worker {} hasn't stopped in {} second(s), terminating it", process.name, timeout)
+                process.terminate()
+
+        logger.info("Updates routed to the workers: {}", dict(sorted(self.routed.items())))
+
+
+async def process(dp: Dispatcher, data: Dict[str, Any], previous: Optional[asyncio.Task]) -> None:
+    """Handles an update once the previous update of the same user, if any, has been handled."""
+
+    if previous is not None:
+        await asyncio.wait([previous])
+
+    try:
+        await dp.process_updates([types.Update(**data)], fast=False)
+    except Exception:
+        logger.exception("Couldn't handle update {}", data.get("update_id"))
+
+
+def forget(chains: Dict[int, asyncio.Task], user_id: int, task: asyncio.Task) -> None:
+    if chains.get(user_id) is task:
+        del chains[user_id]
+
+
+async def serve(dp: Dispatcher, updates: Any) -> int:
+    """Handles the batches of updates from :updates: until it gets None.
+
+    Returns:
+        handled (int): Number of the handled updates.
+    """
+
+    loop = asyncio.get_event_loop()
+    chains: Dict[int, asyncio.Task] = {}
+    handled = 0
+
+    while True:
+        batch = await loop.run_in_executor(None, updates.get)
+
+        if batch is None:
+            break
+
+        for data in batch:
+            user_id = user_of(data)
+            task = loop.create_task(process(dp, data, chains.get(user_id)))
+            task.add_done_callback(functools.partial(forget, chains, user_id))
+            chains[user_id] = task
+
+        handled += len(batch)
+
+    if chains:
+        await asyncio.wait(list(chains.values()))
+
+    return handled
+
+
+def shard_path(path: str, index: int) -> str:
+    """Returns the path of the worker :index:'s own log file next to the bot's one at :path:."""
+
+    file = pathlib.Path(path)
+    return str(file.with_name(f"{file.stem}.shard{index}{file.suffix}"))
+
+
+def work(
+    index: int, updates: Any, connect: Optional[Callable[[Any], Any]] = None, pool_size: Optional[int] = None
+) -> None:
+    """The worker process: loads the handlers and handles the updates routed to it.
+    It builds only what the handlers need (the Bot and the warehouses' connections): the deferred notifications
+    and the throttling stay with the front process.  It logs to its own files next to the bot's ones (the text
+    and the JSON one, see shard_path), so the processes don't write and rotate the same file: the front process
+    passes the worker's :index: in the SHARD_ENV environment variable, so core.config configures the worker's
+    files before it logs anything, even when it's imported along with the re-imported main module.  The worker
+    ignores "CTRL+C", so it's the front process that stops it once the queued updates have been handled.
+    """
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    from core import misc
+
+    misc.open_warehouses(connect or misc.connect, pool_size)
+    misc.loader.load_packages(["handlers"])
+    Bot.set_current(misc.bot)
+    Dispatcher.set_current(misc.dp)
+    logger.info("Worker {} is handling the updates", index)
+
+    try:
+        handled = misc.loop.run_until_complete(serve(misc.dp, updates))
+        logger.info("Worker {} has handled {} update(s)", index, handled)
+    finally:
+        for warehouse in misc.warehouses:
+            warehouse.close()
+
+        misc.loop.run_until_complete(misc.bot.close())
+
+
+def setup(
+    runner: executor.Executor,
+    dp: Dispatcher,
+    shards: int,
+    connect: Optional[Callable[[Any], Any]] = None,
+    pool_size: Optional[int] = None,
+    throttler: Optional[ThrottlingMiddleware] = None,
+) -> ShardRouter:
+    """Starts :shards: worker processes and makes :dp: route every update to them instead of handling it.
+
+    Args:
+        runner (executor.Executor): The executor the bot is started with.
+        dp (Dispatcher): The front process' dispatcher.
+        shards (int): Number of the workers.
+        [optional] connect (callable): Opens a warehouse's database connection in a worker, to SQL Anywhere if not set.
+        [optional] pool_size (int): Number of the database connections per warehouse in a worker.
+        [optional] throttler (ThrottlingMiddleware): Limits the updates of all the workers together, if set.
+
+    Returns:
+        router (ShardRouter): The started router.
+    """
+
+    router = ShardRouter(shards, connect, pool_size, throttler)
+    router.start()
+    dp.updates_handler.register(router.route, index=0)
+
+    async def on_shutdown(dp: Dispatcher) -> None:
+        router.stop()
+
+    runner.on_shutdown(on_shutdown)
+    return router
@@ -0,0 +1,122 @@
+import itertools
+from typing import Any, Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from core.recording import SUFFIX, Recording
+
+
+class SyntheticCapture:
+    """A stand-in for cv2.VideoCapture that generates frames instead of reading a web-cam: a noisy background
+    with a bright label (or the :image:, e.g. a printed QR-code) sliding through the middle of the frame.
+    Every :period: frames the label is taken away for a while, so the detection is exercised both ways.
+
+    Attributes:
+        [optional] width (int): Width of the frames.
+        [optional] height (int): Height of the frames.
+        [optional] image (np.ndarray): The image to show instead of the generated label.
+        [optional] period (int): Number of frames in a full cycle of the label's appearance.
+        [optional] seed (int): Seed of the background noise.
+    """
+
+    def __init__(
+        self,
+        width: int = 640,
+        height: int = 480,
+        image: Optional[np.ndarray] = None,
+        period: int = 50,
+        seed: int = 0,
+    ):
+        self.width = width
+        self.height = height
+        self.period = period
+        self._opened = True
+        self._frames = itertools.count()
+        rng = np.random.default_rng(seed)
+        self._background = rng.integers(0, 96, (height, width, 3), dtype=np.uint8)
+
+        if image is None:
+            side = min(width, height) // 3
+            image = np.full((side, side, 3), 245, dtype=np.uint8)
+            cell = max(side // 10, 2)
+
+            for x, y in itertools.product(range(cell, side - cell, 2 * cell), repeat=2):
+                if rng.random() < 0.5:
+                    image[y : y + cell, x : x + cell] = 16
+
+        scale = min(1.0, 0.5 * min(width, height) / max(image.shape[:2]))
+        self._image = cv2.resize(image, None, fx=scale, fy=scale) if scale < 1 else image
+
+    def isOpened(self) -> bool:  # noqa: N802  (mirrors cv2.VideoCapture)
+        return self._opened
+
+    def read(self) -> Tuple[bool, Any]:
+        if not self._opened:
+            return (False, None)
+
+        number = next(self._frames)
+        frame = self._background.copy()
+        phase = number % self.period
+
+        if phase < self.period * 3 // 4:
+            height, width = self._image.shape[:2]
+            x = (self.width - width) // 2 + int(8 * np.sin(phase / 4))
+            y = (self.height - height) // 2
+            frame[y : y + height, x : x + width] = self._image
+
+        return (True, frame)
+
+    def release(self) -> None:
+        self._opened = False
+
+
+class RecordingCapture:
+    """A stand-in for cv2.VideoCapture that reads the frames of a recording (see core/recording.py) in place,
+    so the bot can be run against the frames recorded in the field.
+
+    Attributes:
+        path (str): Path to the recording.
+        recording (Recording): The opened recording.
+        metadata (dict): Metadata of the last read frame, including the outcome of its scan when it was recorded.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.recording = Recording(path)
+        self.metadata: Dict[str, Any] = {}
+        self._frames = iter(self.recording)
+
+    def isOpened(self) -> bool:  # noqa: N802  (mirrors cv2.VideoCapture)
+        return self._frames is not None
+
+    def read(self) -> Tuple[bool, Any]:
+        frame, self.metadata = next(self._frames, (None, {})) if self._frames is not None else (None, {})
+        return (frame is not None, frame)
+
+    def release(self) -> None:
+        self._frames = None
+        self.recording.close()
+
+
+def open_capture(source: str, image: Optional[str] = None) -> Any:
+    """Opens the frames' source of the QR-code monitor.
+
+    Args:
+        source (str): A web-cam's index, "synthetic" for generated frames, a path to a recording or to a video file.
+        [optional] image (str): Path to an image shown on the synthetic frames instead of the generated label.
+
+    Returns:
+        capture (Union[cv2.VideoCapture, SyntheticCapture, RecordingCapture]): The opened source.
+    """
+
+    if source == "synthetic":
+        return SyntheticCapture(image=cv2.imread(image) if image else None)
+
+    if source.endswith(SUFFIX):
+        return RecordingCapture(source)
+
+    if source.isdigit():
+        return cv2.VideoCapture(int(source))
+
+    return cv2.VideoCapture(source)
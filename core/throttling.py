@@ -0,0 +1,177 @@
+import collections
+import time
+from typing import Dict, Optional, Tuple
+
+from aiogram.dispatcher.handler import CancelHandler
+from aiogram.dispatcher.middlewares import BaseMiddleware
+from aiogram.types import CallbackQuery, Message, Update
+
+
+class TokenBucket:
+    """A classic token bucket: holds up to :capacity: tokens and refills at :rate: tokens per second.
+
+    Attributes:
+        rate (float): Number of tokens added per second.
+        capacity (float): Maximal number of tokens, i.e. the allowed burst.
+        tokens (float): Number of tokens currently available.
+        updated (float): Time (as of time.monotonic) of the last refill.
+    """
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float, now: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic() if now is None else now
+
+    def available(self, now: float, amount: float = 1.0) -> bool:
+        """Refills the bucket up to :now: and checks whether it holds at least :amount: tokens."""
+
+        self.tokens = min(self.capacity, self.tokens + max(0.0, now - self.updated) * self.rate)
+        self.updated = max(self.updated, now)
+        return self.tokens >= amount
+
+    def consume(self, now: float, amount: float = 1.0) -> bool:
+        """Refills the bucket up to :now: and takes :amount: tokens out of it if there are enough of them.
+
+        Returns:
+            Whether the tokens have been taken.
+        """
+
+        if not self.available(now, amount):
+            return False
+
+        self.tokens -= amount
+        return True
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """Drops incoming messages and callback queries before they reach the handlers (and the database) whenever
+    a user or the whole bot exceeds its update rate.  Every limit is off when set to 0, so the middleware passes
+    everything unless it's configured.  Repeated identical callbacks of a user (e.g. hammering the
+    same inline button) are collapsed into the first one.  Dropped callbacks are not answered, Telegram clears
+    the button's loading state by itself.
+
+    Attributes:
+        [optional] rate (float): Number of updates per second a single user may send, 0 to disable.
+        [optional] burst (float): Number of updates a single user may send at once.
+        [optional] global_rate (float): Number of updates per second for all users together, 0 to disable.
+        [optional] global_burst (float): Number of updates all users together may send at once.
+        [optional] max_users (int): Number of users to keep the buckets for.  The least recently seen ones are
+        evicted first.
+        [optional] collapse (float): Time in seconds an identical callback of the same user is considered a repeat,
+        0 to disable.
+        absorbed (collections.Counter): Number of dropped updates per reason ("user", "global" and "duplicate").
+        passed (int): Number of updates passed to the handlers.
+    """
+
+    def __init__(
+        self,
+        rate: float = 0.0,
+        burst: float = 5.0,
+        global_rate: float = 0.0,
+        global_burst: float = 60.0,
+        max_users: int = 10000,
+        collapse: float = 0.0,
+    ):
+        super(ThrottlingMiddleware, self).__init__()
+        self.rate = rate
+        self.burst = burst
+        self.max_users = max_users
+        self.collapse = collapse
+        self.absorbed: collections.Counter = collections.Counter()
+        self.passed = 0
+
+        self._global = TokenBucket(global_rate, global_burst) if global_rate else None
+        self._buckets: "collections.OrderedDict[int, TokenBucket]" = collections.OrderedDict()
+        self._callbacks: "collections.OrderedDict[int, Tuple[str, float]]" = collections.OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        """Whether any of the limits is set."""
+
+        return bool(self.rate or self._global or self.collapse)
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """Number of passed updates and the number of absorbed ones in total and per reason."""
+
+        return dict(self.absorbed, passed=self.passed, absorbed=sum(self.absorbed.values()))
+
+    async def on_pre_process_message(self, message: Message, data: dict) -> None:
+        self._throttle(message.from_user.id, time.monotonic())
+
+    async def on_pre_process_callback_query(self, cb_query: CallbackQuery, data: dict) -> None:
+        self._callback(cb_query, time.monotonic())
+
+    def check_update(self, update: Update) -> None:
+        """Applies the limits to a whole update, for the process that routes the updates instead of handling them
+        (see core/sharding.py), so the limits hold for all the worker processes together.
+
+        Raises:
+            CancelHandler: If the update has to be dropped.
+        """
+
+        if update.message is not None:
+            self._throttle(update.message.from_user.id, time.monotonic())
+        elif update.callback_query is not None:
+            self._callback(update.callback_query, time.monotonic())
+
+    def _callback(self, cb_query: CallbackQuery, now: float) -> None:
+        user_id = cb_query.from_user.id
+
+        if self.collapse:
+            self._collapse(user_id, cb_query.data, now)
+
+        self._throttle(user_id, now)
+
+    def _collapse(self, user_id: int, data: str, now: float) -> None:
+        last = self._callbacks.pop(user_id, None)
+        self._callbacks[user_id] = (data, now)
+
+        if len(self._callbacks) > self.max_users:
+            self._callbacks.popitem(last=False)
+
+        if (last is not None) and (last[0] == data) and (now - last[1] < self.collapse):
+            self._absorb("duplicate")
+
+    def _throttle(self, user_id: int, now: float) -> None:
+        """Takes a token out of the user's and the global buckets, if both of them have got one, so an update
+        dropped by one of the limits doesn't count against the other.
+
+        Raises:
+            CancelHandler: If either of the buckets is empty, so the update never reaches the handlers.
+        """
+
+        bucket = self._bucket(user_id, now) if self.rate else None
+
+        if (bucket is not None) and not bucket.available(now):
+            self._absorb("user")
+
+        if (self._global is not None) and not self._global.available(now):
+            self._absorb("global")
+
+        for taken in (bucket, self._global):
+            if taken is not None:
+                taken.consume(now)
+
+        self.passed += 1
+
+    def _bucket(self, user_id: int, now: float) -> TokenBucket:
+        """Returns the user's bucket, making it the most recently seen one."""
+
+        bucket = self._buckets.pop(user_id, None)
+
+        if bucket is None:
+            bucket = TokenBucket(self.rate, self.burst, now)
+
+            if len(self._buckets) >= self.max_users:
+                self._buckets.popitem(last=False)
+
+        self._buckets[user_id] = bucket
+        return bucket
+
+    def _absorb(self, reason: str) -> None:
+        self.absorbed[reason] += 1
+        raise CancelHandler()
@@ -0,0 +1,198 @@
+import asyncio
+import os
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+import pyzbar.pyzbar as pyzbar
+
+from core.detection import ScanStats, detect_edges, find_candidate, sharpness
+
+
+Tile = Tuple[int, int, int, int]
+Code = Tuple[str, np.ndarray]
+
+
+def split_tiles(square: np.ndarray, grid: int = 2, overlap: int = 64) -> List[Tile]:
+    """Splits the area of :square: into :grid: x :grid: tiles that overlap each other by :overlap: pixels, so a
+    QR-code lying across a border of two tiles fits completely in at least one of them as long as it's not larger
+    than :overlap:.
+
+    Args:
+        square (np.ndarray): An ordered numpy array of a square's (x,y)-coordinates on the frame.
+        [optional] grid (int): Number of tiles along each side of the square.
+        [optional] overlap (int): Width in pixels of the band shared by two adjacent tiles.
+
+    Returns:
+        tiles (list): A list of tiles' (x0, y0, x1, y1) bounds on the frame.
+    """
+
+    (left, top), (right, bottom) = square[0], square[2]
+    step_x = (right - left) / grid
+    step_y = (bottom - top) / grid
+    half = overlap // 2
+    tiles = []
+
+    for row in range(grid):
+        for col in range(grid):
+            x0 = max(left, int(left + col * step_x) - half)
+            y0 = max(top, int(top + row * step_y) - half)
+            x1 = min(right, int(left + (col + 1) * step_x) + half)
+            y1 = min(bottom, int(top + (row + 1) * step_y) + half)
+            tiles.append((x0, y0, x1, y1))
+
+    return tiles
+
+
+def scan_tile(
+    tile: Any,
+    origin: Tuple[int, int],
+    kernel: np.ndarray,
+    area_min: int = 300,
+    color_lower: int = 212,
+    color_upper: int = 255,
+    sharpness_min: float = 0.0,
+) -> Tuple[Optional[float], List[Code]]:
+    """Looks for a potential QR-code on a single tile and decodes all QR-codes on it if there is one and the tile
+    is sharp enough.  A potential QR-code is found by the same test as on the whole square (see
+    core.detection.find_candidate), it has to lie within the tile.  Runs in a worker of the tiles' pool, hence,
+    doesn't draw anything on the frame.
+
+    Args:
+        tile (Union[Mat, UMat]): A part of a frame of the webcam's captured stream.
+        origin (tuple): The (x,y)-coordinates of the tile's top-left corner on the frame.
+        kernel (np.ndarray): A kernel for the frame dilation and transformation (to detect the contours of shapes).
+        [optional] area_min (int): Minimal area of a detected object to be consider a QR-code.
+        [optional] color_lower (int): Minimal hue of gray of a detected object to be consider a QR-code.
+        [optional] color_upper (int): Maximal hue of gray of a detected object to be consider a QR-code.
+        [optional] sharpness_min (float): Minimal sharpness of the tile to try decoding it.
+
+    Returns:
+        A tuple where the first element is the tile's sharpness, None if there's no potential QR-code on it.
+        The second one is a list of the decoded strings and the codes' polygons in the frame's coordinates.
+    """
+
+    height, width = tile.shape[:2]
+    bounds = np.array([(0, 0), (width, 0), (width, height), (0, height)], dtype="int0")
+    edge = detect_edges(tile, kernel, color_lower, color_upper)
+
+    if find_candidate(edge, bounds, area_min) is None:
+        return (None, [])
+
+    tile_gray = cv2.cvtColor(tile, cv2.COLOR_BGR2GRAY)
+    score = sharpness(tile_gray)
+    codes: List[Code] = []
+
+    if score < sharpness_min:
+        return (score, codes)
+
+    for decoded in pyzbar.decode(tile_gray):
+        polygon = np.array(decoded.polygon, np.int32) + np.array(origin, np.int32)
+        codes.append((decoded.data.decode("utf-8"), polygon))
+
+    return (score, codes)
+
+
+def merge_codes(
+    results: List[Tuple[Optional[float], List[Code]]], sharpness_min: float = 0.0, stats: Optional[ScanStats] = None
+) -> List[Code]:
+    """Merges the codes decoded on all tiles.  A code found on several overlapping tiles is kept once, with the
+    largest of its polygons, i.e. the one from the tile it fitted in completely.
+
+    Args:
+        results (list): The tiles' sharpness and lists of codes decoded on each tile as returned by :scan_tile:.
+        [optional] sharpness_min (float): Minimal sharpness of a tile the decoding was attempted on.
+        [optional] stats (ScanStats): Records the outcome of every tile with a potential QR-code if set.
+
+    Returns:
+        codes (list): A list of the unique decoded strings and their polygons in the order they were found.
+    """
+
+    merged: Dict[str, Code] = {}
+
+    for score, codes in results:
+        if (stats is not None) and (score is not None):
+            stats.record(score, gated=score < sharpness_min, decoded=bool(codes))
+
+        for data, polygon in codes:
+            known = merged.get(data)
+
+            if (known is None) or (cv2.contourArea(polygon) > cv2.contourArea(known[1])):
+                merged[data] = (data, polygon)
+
+    return list(merged.values())
+
+
+class TiledDetector:
+    """Detects and decodes QR-codes inside a square by splitting it into overlapping tiles and scanning them
+    in parallel.  Both OpenCV and zbar release the GIL, so a thread pool scales across cores without copying
+    the frame; a process pool is available for builds where they don't.
+
+    Attributes:
+        [optional] grid (int): Number of tiles along each side of the square.
+        [optional] overlap (int): Width in pixels of the band shared by two adjacent tiles.
+        [optional] workers (int): Number of the pool's workers.  Defaults to the number of CPUs.
+        [optional] processes (bool): Use a process pool instead of a thread pool.
+        [optional] sharpness_min (float): Minimal sharpness of a tile to try decoding it.
+        executor (Executor): The pool running :scan_tile: for every tile.
+    """
+
+    def __init__(
+        self,
+        grid: int = 2,
+        overlap: int = 64,
+        workers: Optional[int] = None,
+        processes: bool = False,
+        sharpness_min: float = 0.0,
+    ):
+        self.grid = grid
+        self.overlap = overlap
+        self.workers = workers or os.cpu_count() or 1
+        self.processes = processes
+        self.sharpness_min = sharpness_min
+        self.executor: Executor = (
+            ProcessPoolExecutor(self.workers) if processes else ThreadPoolExecutor(self.workers, "tile")
+        )
+
+    def submit(
+        self,
+        frame: Any,
+        square: np.ndarray,
+        kernel: np.ndarray,
+        area_min: int = 300,
+        color_lower: int = 212,
+        color_upper: int = 255,
+    ) -> List[Future]:
+        """Submits every tile of :square: on :frame: to the pool.
+
+        Returns:
+            futures (list): A list of futures resolving to the codes decoded on each tile.
+        """
+
+        return [
+            self.executor.submit(
+                scan_tile, frame[y0:y1, x0:x1], (x0, y0), kernel, area_min, color_lower, color_upper, self.sharpness_min
+            )
+            for (x0, y0, x1, y1) in split_tiles(square, self.grid, self.overlap)
+        ]
+
+    def detect(self, *args: Any, stats: Optional[ScanStats] = None, **kwargs: Any) -> List[Code]:
+        """Scans all tiles and blocks until every one of them is done.  Takes the same arguments as :submit:
+        and, optionally, the ScanStats to record the tiles' outcomes in.
+
+        Returns:
+            codes (list): A list of the unique decoded strings and their polygons in the frame's coordinates.
+        """
+
+        results = [future.result() for future in self.submit(*args, **kwargs)]
+        return merge_codes(results, self.sharpness_min, stats)
+
+    async def detect_async(self, *args: Any, stats: Optional[ScanStats] = None, **kwargs: Any) -> List[Code]:
+        """Same as :detect:, but awaits the tiles instead of blocking the event loop."""
+
+        futures = [asyncio.wrap_future(future) for future in self.submit(*args, **kwargs)]
+        return merge_codes(await asyncio.gather(*futures), self.sharpness_min, stats)
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=False)
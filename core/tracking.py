@@ -0,0 +1,191 @@
+from typing import Any, Callable, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from core.detection import contains_in_area
+
+
+class BoxTracker:
+    """Follows a detected QR-code candidate from frame to frame by matching its grey template in a small search
+    window around its last position, which is far cheaper than running the full contour search on every frame.
+    The candidate is considered stable once it hasn't moved for :stable_frames: frames in a row; it should be
+    decoded then, again every :retry_frames: frames while the decoding fails, and once more after it has moved.
+
+    Attributes:
+        [optional] margin (int): Number of pixels the search window extends the box by in every direction.
+        [optional] min_score (float): Minimal normalized correlation of the template match to keep tracking.
+        [optional] stable_frames (int): Number of frames in a row the box has to stay still to be stable.
+        [optional] stable_shift (int): Maximal shift in pixels between two frames for the box to stay still.
+        [optional] retry_frames (int): Number of frames to wait before decoding a stable box again after a failure.
+        box (np.ndarray): The ordered numpy array of the tracked box's coordinates, None if nothing is tracked.
+        still (int): Number of frames in a row the box has stayed still.
+        decoded (bool): Whether the box has been decoded since it became stable.
+        lost (int): Number of times the tracking has been lost.
+    """
+
+    def __init__(
+        self,
+        margin: int = 32,
+        min_score: float = 0.6,
+        stable_frames: int = 3,
+        stable_shift: int = 2,
+        retry_frames: int = 5,
+    ):
+        self.margin = margin
+        self.min_score = min_score
+        self.stable_frames = stable_frames
+        self.stable_shift = stable_shift
+        self.retry_frames = retry_frames
+        self.box: Optional[np.ndarray] = None
+        self.still = 0
+        self.decoded = False
+        self.lost = 0
+        self._since: Optional[int] = None
+        self._template: Any = None
+
+    @property
+    def active(self) -> bool:
+        return self.box is not None
+
+    @property
+    def stable(self) -> bool:
+        return self.active and (self.still >= self.stable_frames)
+
+    @property
+    def due(self) -> bool:
+        """Whether the box is stable and should be decoded on the current frame."""
+
+        return self.stable and not self.decoded and ((self._since is None) or (self._since >= self.retry_frames))
+
+    def attempt(self, decoded: bool) -> None:
+        """Records the outcome of decoding the box, so a failed one is retried after :retry_frames: frames."""
+
+        self.decoded = decoded
+        self._since = 0
+
+    def start(self, frame: Any, box: np.ndarray) -> None:
+        """Starts tracking the ordered rectangle :box: detected on :frame:."""
+
+        self.box = np.array(box, dtype=np.int32)
+        self.still = 0
+        self.decoded = False
+        self._since = None
+        x0, y0, x1, y1 = self.bounds(frame)
+
+        if min(x1 - x0, y1 - y0) < 8:
+            self.reset()
+            return
+
+        self._template = self._gray(frame, (x0, y0, x1, y1))
+
+    def reset(self) -> None:
+        self.box = None
+        self.still = 0
+        self.decoded = False
+        self._since = None
+        self._template = None
+
+    def update(self, frame: Any) -> Optional[np.ndarray]:
+        """Looks for the tracked box on the next :frame:.
+
+        Args:
+            frame (Union[Mat, UMat]): The next frame of the webcam's captured stream.
+
+        Returns:
+            box (np.ndarray): The box's new coordinates, None if the tracking has been lost.
+        """
+
+        if self.box is None:
+            return None
+
+        x0, y0, x1, y1 = self.bounds(frame)
+        height, width = frame.shape[:2]
+        window = (
+            max(0, x0 - self.margin),
+            max(0, y0 - self.margin),
+            min(width, x1 + self.margin),
+            min(height, y1 + self.margin),
+        )
+        search = self._gray(frame, window)
+
+        if (search.shape[0] < self._template.shape[0]) or (search.shape[1] < self._template.shape[1]):
+            self.reset()
+            self.lost += 1
+            return None
+
+        result = cv2.matchTemplate(search, self._template, cv2.TM_CCOEFF_NORMED)
+        min_val, score, min_loc, location = cv2.minMaxLoc(result)
+
+        if score < self.min_score:
+            self.reset()
+            self.lost += 1
+            return None
+
+        shift = np.array((window[0] + location[0] - x0, window[1] + location[1] - y0), dtype=np.int32)
+        self.box = self.box + shift
+
+        if np.abs(shift).max() <= self.stable_shift:
+            self.still += 1
+
+            if self._since is not None:
+                self._since += 1
+        else:
+            self.start(frame, self.box)
+
+        return self.box
+
+    def bounds(self, frame: Any, margin: int = 0) -> Tuple[int, int, int, int]:
+        """Returns the (x0, y0, x1, y1) bounds of the tracked box extended by :margin: and clipped to :frame:."""
+
+        height, width = frame.shape[:2]
+        (x0, y0), (x1, y1) = self.box.min(axis=0), self.box.max(axis=0)  # type: ignore
+        return (
+            int(max(0, x0 - margin)),
+            int(max(0, y0 - margin)),
+            int(min(width, x1 + margin)),
+            int(min(height, y1 + margin)),
+        )
+
+    @staticmethod
+    def _gray(frame: Any, bounds: Tuple[int, int, int, int]) -> Any:
+        x0, y0, x1, y1 = bounds
+        crop = frame[y0:y1, x0:x1]
+        return cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY) if crop.ndim == 3 else crop
+
+
+def track_candidate(
+    frame: Any, square: np.ndarray, tracker: BoxTracker, locate: Callable[[Any], Optional[np.ndarray]]
+) -> Any:
+    """Follows the tracked candidate on :frame: or, if there's none, runs the full detection to find a new one.
+    The candidate is decoded on the same square crop as without the tracking, so the sharpness gate and the decoder
+    see the same image either way.
+
+    Args:
+        frame (Union[Mat, UMat]): A frame of the webcam's captured stream.
+        square (np.ndarray): A numpy array of the square's (x,y)-coordinates on the frame.
+        tracker (BoxTracker): The tracker of the candidate.
+        locate (callable): The full detection returning the candidate's rectangle on a frame, None if there's none.
+        It mustn't draw on the frame, as the tracker's template of a new candidate is taken from it.
+
+    Returns:
+        The square's crop to decode once the candidate has become stable inside it (see BoxTracker.due),
+        None otherwise.
+    """
+
+    if tracker.active:
+        box = tracker.update(frame)
+
+        if box is not None:
+            if not contains_in_area(box, square):
+                tracker.reset()
+                return None
+
+            return frame[square[0][1] : square[2][1], square[0][0] : square[2][0]] if tracker.due else None
+
+    rect = locate(frame)
+
+    if rect is not None:
+        tracker.start(frame, rect)
+
+    return None
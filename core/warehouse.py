@@ -0,0 +1,205 @@
+import asyncio
+import collections
+import contextlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence
+
+from loguru import logger
+
+
+class ConnectionPool:
+    """A fixed set of database connections shared by the coroutines of a warehouse.  The queries run in a thread
+    per connection, so a slow query of one warehouse doesn't block the event loop and the other warehouses.
+
+    Attributes:
+        connect (callable): Opens a new connection.
+        [optional] size (int): Number of the connections.
+    """
+
+    def __init__(self, connect: Callable[[], Any], size: int = 2):
+        self.size = size
+        self._connections = [connect() for _ in range(size)]
+        self._idle: asyncio.Queue = asyncio.Queue()
+        self._executor = ThreadPoolExecutor(size)
+
+        for conn in self._connections:
+            self._idle.put_nowait(conn)
+
+    async def execute(self, query: str, params: Sequence[Any] = (), fetch: bool = True, commit: bool = False) -> Any:
+        """Runs :query: with :params: on an idle connection.
+
+        Args:
+            query (str): The query.
+            [optional] params (sequence): The query's parameters.
+            [optional] fetch (bool): Fetch and return all rows of the result.
+            [optional] commit (bool): Commit the changes after the query.
+
+        Returns:
+            rows (list): The rows of the result if :fetch:, None otherwise.
+        """
+
+        conn = await self._idle.get()
+
+        try:
+            return await asyncio.get_event_loop().run_in_executor(
+                self._executor, self._run, conn, query, params, fetch, commit
+            )
+        finally:
+            self._idle.put_nowait(conn)
+
+    def close(self) -> None:
+        for conn in self._connections:
+            conn.commit()
+            conn.close()
+
+        self._executor.shutdown()
+
+    @staticmethod
+    def _run(conn: Any, query: str, params: Sequence[Any], fetch: bool, commit: bool) -> Any:
+        curs = conn.cursor()
+
+        try:
+            if params:
+                curs.execute(query, params)
+            else:
+                curs.execute(query)
+
+            rows = curs.fetchall() if fetch else None
+
+            if commit:
+                conn.commit()
+
+            return rows
+        finally:
+            curs.close()
+
+
+class Warehouse:
+    """A warehouse served by the bot: its orders table, the database login and the cameras scanning the parcels.
+    Keeps its own metrics, so the load of the warehouses sharing a machine can be compared.
+
+    Attributes:
+        name (str): The warehouse's name used in the logs.
+        uid (str): The database user's UID, also the schema of the table.
+        password (str): The database user's password.
+        table (str): The orders table's name.
+        cameras (list): Sources of the cameras' frames (see the "--source" argument).
+        [optional] pool_size (int): Number of the database connections.
+        pool (ConnectionPool): The database connections, None until :connect: is called.
+        metrics (collections.Counter): Number of the scanned frames, decoded QR-codes, queries, sent and deferred
+        notifications along with the time spent on each stage.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        uid: Optional[str],
+        password: Optional[str],
+        table: Optional[str],
+        cameras: List[str],
+        pool_size: int = 2,
+    ):
+        self.name = name
+        self.uid = uid
+        self.password = password
+        self.table = table
+        self.cameras = cameras
+        self.pool_size = pool_size
+        self.pool: Optional[ConnectionPool] = None
+        self.metrics: collections.Counter = collections.Counter()
+        self._started = time.monotonic()
+
+    def connect(self, connect: Callable[["Warehouse"], Any]) -> None:
+        """Opens the warehouse's connection pool, :connect: opens a single connection for the warehouse."""
+
+        self.pool = ConnectionPool(lambda: connect(self), self.pool_size)
+
+    async def execute(self, query: str, params: Sequence[Any] = (), fetch: bool = True, commit: bool = False) -> Any:
+        """Runs :query: on a connection of the warehouse's pool, see ConnectionPool.execute."""
+
+        with self.measure("query"):
+            return await self.pool.execute(query, params, fetch=fetch, commit=commit)  # type: ignore
+
+    @contextlib.contextmanager
+    def measure(self, stage: str) -> Iterator[None]:
+        """Counts the with-block as one more :stage: and adds the time spent inside it to the stage's total."""
+
+        started = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            self.metrics[stage] += 1
+            self.metrics[f"{stage}_seconds"] += time.perf_counter() - started
+
+    def summary(self) -> Dict[str, Any]:
+        """Returns the metrics along with the rates per second and the mean time per stage in milliseconds."""
+
+        elapsed = time.monotonic() - self._started
+        summary: Dict[str, Any] = dict(self.metrics)
+
+        for stage in [key for key in self.metrics if not key.endswith("_seconds")]:
+            summary[f"{stage}_per_second"] = round(self.metrics[stage] / elapsed, 3)
+
+            if f"{stage}_seconds" in self.metrics:
+                summary[f"{stage}_ms"] = round(1000 * self.metrics[f"{stage}_seconds"] / self.metrics[stage], 3)
+                summary[f"{stage}_load"] = round(self.metrics[f"{stage}_seconds"] / elapsed, 4)
+                del summary[f"{stage}_seconds"]
+
+        return summary
+
+    def close(self) -> None:
+        if self.pool is not None:
+            self.pool.close()
+
+
+def load_warehouses(path: str) -> List[Warehouse]:
+    """Reads the warehouses' definitions from a JSON file containing a list of objects like
+    {"name": "north", "uid": "north", "password_env": "NORTH_DB_PASSWORD", "table": "Orders", "cameras": ["0", "1"]}.
+    The password is taken either from "password" or from the environment variable named in "password_env";
+    "pool" sets the number of the database connections.
+
+    Args:
+        path (str): Path to the JSON file.
+
+    Returns:
+        warehouses (list): The defined warehouses.
+    """
+
+    with open(path, encoding="utf-8") as file:
+        definitions = json.load(file)
+
+    warehouses = []
+
+    for number, definition in enumerate(definitions):
+        password = definition.get("password")
+
+        if "password_env" in definition:
+            password = os.getenv(definition["password_env"])
+
+        warehouses.append(
+            Warehouse(
+                name=definition.get("name", f"warehouse{number}"),
+                uid=definition["uid"],
+                password=password,
+                table=definition["table"],
+                cameras=[str(camera) for camera in definition.get("cameras", [])],
+                pool_size=definition.get("pool", 2),
+            )
+        )
+
+    logger.info("Loaded {} warehouse(s): {}", len(warehouses), ", ".join(warehouse.name for warehouse in warehouses))
+    return warehouses
+
+
+async def report(warehouses: List[Warehouse], interval: float) -> None:
+    """Logs every warehouse's metrics every :interval: seconds."""
+
+    while True:
+        await asyncio.sleep(interval)
+
+        for warehouse in warehouses:
+            logger.info('Warehouse "{}" metrics: {}', warehouse.name, warehouse.summary())
@@ -25,3 +25,51 @@ MSG_NOTIFY_RU = (
     """Вес: {weight:.3f} кг\n"""
     """ID: {id}"""
 )
+
+MSG_NOTIFY_MULTI_EN = (
+    """Hello, {first_name}\!\n\n"""
+    """As of {timestamp}, {count} of your orders have arrived to our base.\n"""
+    """We are going to deliver them to your address _{address}_ no later than in 3 days."""
+)
+
+MSG_NOTIFY_MULTI_RU = (
+    """Здравствуйте, {first_name}\!\n\n"""
+    """{timestamp} Ваши заказы в количестве {count} шт. доставлены в наш центр.\n"""
+    """Мы доставим их по Вашему адресу _{address}_ не позже, чем через 3 дня."""
+)
+
+MSG_ORDER_EN = (
+    """*Order* `{id}`\n"""
+    """Product: {product}\n"""
+    """Model: {model}\n"""
+    """Price: €{price:.2f}\n"""
+    """Amount: {amount}\n"""
+    """Weight: {weight:.3f} kg"""
+)
+
+MSG_ORDER_RU = (
+    """*Заказ* `{id}`\n"""
+    """Товар: {product}\n"""
+    """Модель: {model}\n"""
+    """Цена: €{price:.2f}\n"""
+    """Количество: {amount}\n"""
+    """Вес: {weight:.3f} кг"""
+)
+
+MSG_SUMMARY_EN = (
+    """*Summary for {address}:*\n"""
+    """Orders: {count}\n"""
+    """Items: {amount}\n"""
+    """Total price: €{price:.2f}\n"""
+    """Total weight: {weight:.3f} kg"""
+)
+
+MSG_SUMMARY_RU = (
+    """*Итого по адресу {address}:*\n"""
+    """Заказов: {count}\n"""
+    """Товаров: {amount}\n"""
+    """Общая стоимость: €{price:.2f}\n"""
+    """Общий вес: {weight:.3f} кг"""
+)
+
+MSG_LENGTH_MAX = 4096
@@ -8,8 +8,7 @@ from aiogram.types import (
 from loguru import logger
 
 from . import constants
-from core import config
-from core.misc import bot, conn, curs, dp
+from core.misc import bot, dp, warehouses
 
 
 @dp.message_handler(commands=["start"])
@@ -33,22 +32,30 @@ async def cmd_start(message: Message) -> None:
 @dp.message_handler(commands=["lang"])
 async def cmd_lang(message: Message) -> None:
     """Handles the "/lang" command from a Telegram user.  Allows the user to change the locale from the chosen one.
-    Outputs the message in the language that was initially chosen by the user.
+    Outputs the message in the language that was initially chosen by the user (in the first warehouse having the
+    user's orders).
 
     Args:
         message (Message): User's Telegram message that is sent to the bot.
     """
 
     query = "SELECT locale FROM %s.%s WHERE telegram_id=%d;"
-    curs.execute(
-        query
-        % (
-            config.DB_UID,
-            config.DB_TABLE_NAME,
-            message.from_user.id,
+    lang = "en_US"
+
+    for warehouse in warehouses:
+        rows = await warehouse.execute(
+            query
+            % (
+                warehouse.uid,
+                warehouse.table,
+                message.from_user.id,
+            )
         )
-    )
-    (lang,) = curs.fetchone()
+
+        if rows:
+            (lang,) = rows[0]
+            break
+
     logger.debug('Got user\'s {} current language "{}"', message.from_user.id, lang)
     str_lang = "Please choose your language\." if lang.startswith("en") else "Пожалуйста, выберите язык\."
     btn_en = InlineKeyboardButton("🇬🇧 English", callback_data="lang_en")
@@ -61,7 +68,7 @@ async def cmd_lang(message: Message) -> None:
 
 @dp.callback_query_handler(lambda c: c.data.startswith("lang"))
 async def set_lang(cb_query: CallbackQuery) -> None:
-    """Handles the callback that sets the user preferred locale.  Updates the locale in the table.
+    """Handles the callback that sets the user preferred locale.  Updates the locale in the tables of all warehouses.
 
     Args:
         cb_query (CallbackQuery): User's Telegram callback query that is sent to the bot.
@@ -73,17 +80,20 @@ async def set_lang(cb_query: CallbackQuery) -> None:
 
     try:
         query = "UPDATE %s.%s SET locale='%s' WHERE telegram_id=%d;"
-        curs.execute(
-            query
-            % (
-                config.DB_UID,
-                config.DB_TABLE_NAME,
-                lang,
-                cb_query.from_user.id,
+
+        for warehouse in warehouses:
+            logger.debug('Commiting the changes to warehouse "{}"', warehouse.name)
+            await warehouse.execute(
+                query
+                % (
+                    warehouse.uid,
+                    warehouse.table,
+                    lang,
+                    cb_query.from_user.id,
+                ),
+                fetch=False,
+                commit=True,
             )
-        )
-        logger.debug("Commiting the changes")
-        conn.commit()
 
     except sqlanydb.Error as ex:
         logger.exception(ex)
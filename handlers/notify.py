@@ -11,27 +11,37 @@ from aiogram.utils.exceptions import (
     UserDeactivated,
 )
 from loguru import logger
-from typing import Dict
+from typing import Any, Dict, List, Optional
 
 from . import constants
-from core import config
-from core.misc import bot, curs
+from core import config, misc
+from core.metrics import latencies
+from core.sampling import log_sampler
+from core.warehouse import Warehouse
 
 
-async def notify_user(row: Dict[str, str]) -> None:
-    """Sends a notification about the order contained in :row: to a user with a Telegram ID from :row:.
+def render(rows: List[Dict[str, Any]]) -> List[str]:
+    """Renders the notification about the orders in :rows: that share the same recipient and address.
+    A single order gets the detailed message; several orders get one message listing all of them followed by
+    the address' summary, split into several messages only if it exceeds Telegram's message length limit.
+    The summary adds up the orders' "price" and "weight" fields as they're stored, the same values the orders'
+    own blocks show, without assuming they're per unit.
 
     Args:
-        row (dict): A dict containing full record about the user's order.
+        rows (list): A list of dicts containing full records about the user's orders.
+
+    Returns:
+        messages (list): A list of the messages' texts escaped for the MarkdownV2 parse mode.
     """
 
-    try:
-        user_id = row["telegram_id"]
-        timestamp = datetime.now(pytz.timezone(row["timezone"])).strftime("%d/%m/%Y %H:%M:%S %Z")
+    row = rows[0]
+    timestamp = datetime.now(pytz.timezone(row["timezone"])).strftime("%d/%m/%Y %H:%M:%S %Z")
+    lang = row.get("locale") or "en_US"
+    english = lang.startswith("en")
 
-        lang = row.get("locale", "en_US")
-        info = constants.MSG_NOTIFY_EN if lang.startswith("en") else constants.MSG_NOTIFY_RU
-        info = (
+    if len(rows) == 1:
+        info = constants.MSG_NOTIFY_EN if english else constants.MSG_NOTIFY_RU
+        blocks = [
             info.format(
                 first_name=row["first_name"],
                 timestamp=timestamp,
@@ -43,12 +53,68 @@ async def notify_user(row: Dict[str, str]) -> None:
                 amount=row["amount"],
                 weight=float(row["weight"]),
             )
-            .replace(".", "\.")
-            .replace("-", "\-")
+        ]
+    else:
+        header = constants.MSG_NOTIFY_MULTI_EN if english else constants.MSG_NOTIFY_MULTI_RU
+        order = constants.MSG_ORDER_EN if english else constants.MSG_ORDER_RU
+        summary = constants.MSG_SUMMARY_EN if english else constants.MSG_SUMMARY_RU
+        blocks = [
+            header.format(first_name=row["first_name"], timestamp=timestamp, count=len(rows), address=row["address"])
+        ]
+        blocks.extend(
+            order.format(
+                id=record["id"],
+                product=record["product"],
+                model=record["model"],
+                price=float(record["price"]),
+                amount=record["amount"],
+                weight=float(record["weight"]),
+            )
+            for record in rows
         )
+        blocks.append(
+            summary.format(
+                address=row["address"],
+                count=len(rows),
+                amount=sum(record["amount"] for record in rows),
+                price=sum(float(record["price"]) for record in rows),
+                weight=sum(float(record["weight"]) for record in rows),
+            )
+        )
+
+    messages = [""]
+
+    for block in blocks:
+        block = block.replace(".", "\.").replace("-", "\-")
+
+        if messages[-1] and (len(messages[-1]) + len(block) + 2 > constants.MSG_LENGTH_MAX):
+            messages.append("")
+
+        messages[-1] = f"{messages[-1]}\n\n{block}" if messages[-1] else block
+
+    return messages
+
+
+async def notify_user(rows: List[Dict[str, Any]], raise_errors: bool = False) -> None:
+    """Sends a single notification about all orders contained in :rows: to a user with a Telegram ID from :rows:.
+
+    Args:
+        rows (list): A list of dicts containing full records about the user's orders at the same address.
+        [optional] raise_errors (bool): Re-raise the network errors and those of invalid records (e.g. an unknown
+        timezone) after logging them, so the caller may retry or keep the notification (see core.scheduler).
+        The errors caused by the recipient (e.g. a blocked bot) are never raised.
+    """
+
+    info = ""
 
-        await bot.send_message(user_id, info)
-        logger.success("Order notification message has been successfully sent to user {}", user_id)
+    try:
+        user_id = rows[0]["telegram_id"]
+
+        for info in render(rows):
+            with latencies.measure("send"):
+                await misc.bot.send_message(user_id, info)
+
+        logger.success("Notification about {} order(s) has been successfully sent to user {}", len(rows), user_id)
     except CantParseEntities as ex:
         logger.error(
             'Notification failed. AIOgram couldn\'t properly parse the following text:\n"{}"\n Exception: {}',
@@ -62,58 +128,83 @@ async def notify_user(row: Dict[str, str]) -> None:
     except UserDeactivated:
         logger.error("Notification failed. User {}'s account has been deactivated", user_id)
     except NetworkError:
-        logger.critical("Could not access https://api.telegram.org/. Check your internet connection")
+        logger.critical("Could not access {}. Check your internet connection", config.BOT_API_URL)
+
+        if raise_errors:
+            raise
     except KeyError:
         logger.exception("Got invalid query response. See below for the details")
 
+        if raise_errors:
+            raise
 
-async def start(address: str, pause_success: int = 5, pause_fail: int = 1) -> None:
-    """Checks whether the :address: string contains in the set of all different addresses saved in the table.
-    If it does, gets the record containing :address: in its "address" field.
-    Sends the record to the notification function.
+
+async def start(
+    address: str,
+    pause_success: int = 5,
+    pause_fail: int = 1,
+    urgent: bool = False,
+    warehouse: Optional[Warehouse] = None,
+) -> None:
+    """Gets all records containing :address: in their "address" field with a single query.
+    Sends one notification per recipient listing all of the recipient's orders at this address.
+    Unless :urgent:, the notifications of the recipients for whom it's outside of the sending window are deferred.
 
     Args:
         address (str): The decoded address to check the table with.
         [optional] pause_success (int): Time in seconds to standby for after the notification was sent.
         [optional] pause_fail (int): Time in seconds to standby for after detecting an invalid QR-code.
+        [optional] urgent (bool): Send the notifications right away regardless of the recipients' local time.
+        [optional] warehouse (Warehouse): The warehouse whose orders table to check, the first one if not set.
     """
 
+    warehouse = warehouse or misc.warehouses[0]
+
     try:
-        query_addresses = "SELECT address FROM %s.%s;"
-        curs.execute(
-            query_addresses
-            % (
-                config.DB_UID,
-                config.DB_TABLE_NAME,
-            )
-        )
-        response_addresses = curs.fetchall()
-        addresses = set([res[0] for res in response_addresses])
-        if not (address in addresses):
-            logger.warning('Address "{}" not found among the available addresses. Skipping', address)
-            logger.info("Standing by for {} second(s)", pause_fail)
-            await asyncio.sleep(pause_fail)
-            return
-        query = "SELECT * FROM %s.%s WHERE address='%s';"
-        curs.execute(
-            query
-            % (
-                config.DB_UID,
-                config.DB_TABLE_NAME,
-                address,
+        query = "SELECT * FROM %s.%s WHERE address=?;"
+
+        with latencies.measure("query"):
+            response = await warehouse.execute(
+                query
+                % (
+                    warehouse.uid,
+                    warehouse.table,
+                ),
+                (address,),
             )
-        )
-        response = curs.fetchone()
-        logger.debug('Got response for address "{}": "{}"', address, response)
+
+        logger.debug('Got {} record(s) for address "{}": "{}"', len(response), address, response)
     except sqlanydb.Error:
         logger.exception("Encountered an error while handling query to the database. See below for the details")
         return
 
-    res_row = {}
+    if not response:
+        warehouse.metrics["not_found"] += 1
+        log_sampler.warning('Address "{}" not found among the available addresses. Skipping', address)
+        logger.info("Standing by for {} second(s)", pause_fail)
+        await asyncio.sleep(pause_fail)
+        return
+
+    recipients: Dict[Any, List[Dict[str, Any]]] = {}
+
+    for record in response:
+        res_row = dict(zip(config.FIELDS, record))
+        recipients.setdefault(res_row["telegram_id"], []).append(res_row)
 
-    for (i, field) in zip(range(len(response)), config.FIELDS):
-        res_row[field] = response[i]
+    for rows in recipients.values():
+        due = None if urgent else misc.scheduler.window.release(rows[0]["timezone"])
+
+        if due is None:
+            with warehouse.measure("notified"):
+                await notify_user(rows)
+        else:
+            warehouse.metrics["deferred"] += 1
+            misc.scheduler.schedule(due, rows, warehouse=warehouse.name)
+            logger.info(
+                "Deferred the notification to user {} until {:%d/%m/%Y %H:%M:%S} UTC",
+                rows[0]["telegram_id"],
+                datetime.utcfromtimestamp(due),
+            )
 
-    await notify_user(res_row)
     logger.info("Standing by for {} second(s)", pause_success)
     await asyncio.sleep(pause_success)
@@ -59,45 +59,94 @@ r"""Chat-Bot for Telegram messenger as a test project showcasing a possible SAP
     See the License for the specific language governing permissions and
     limitations under the License.
 """
+import asyncio
+import functools
+import json
+from typing import List
+
 import aiogram
 from aiogram.utils.exceptions import NetworkError, Unauthorized
 from loguru import logger
 
-from core import misc, qr_cam
+from core import config, metrics, misc, qr_cam, warehouse
+from handlers import notify
+
 
+tasks: List[asyncio.Task] = []
 
-async def monitor_camera() -> None:
-    logger.debug("Connecting to a web-cam")
-    await qr_cam.scan_qr()
+
+async def monitor_camera(site: warehouse.Warehouse, source: str, title: str) -> None:
+    logger.debug('Connecting to web-cam "{}" of warehouse "{}"', source, site.name)
+    await qr_cam.scan_qr(site, source, title)
 
 
 async def startup(dp: aiogram.Dispatcher) -> None:
-    misc.loop.create_task(monitor_camera())
+    cameras = [(site, source) for site in misc.warehouses for source in site.cameras]
+
+    for site, source in cameras:
+        title = f"Live Capture ({site.name}: {source})" if len(cameras) > 1 else "Live Capture"
+        misc.loop.create_task(monitor_camera(site, source, title))
+
+    tasks.append(misc.loop.create_task(misc.scheduler.run(functools.partial(notify.notify_user, raise_errors=True))))
+    tasks.append(misc.loop.create_task(metrics.probe_lag()))
+
+    if config.args.metrics_interval:
+        tasks.append(misc.loop.create_task(warehouse.report(misc.warehouses, config.args.metrics_interval)))
 
 
 async def shutdown(dp: aiogram.Dispatcher) -> None:
-    logger.debug("Committing all unsaved changes")
-    misc.conn.commit()
-    logger.debug("Shutting down DB connection")
-    misc.curs.close()
-    misc.conn.close()
+    for task in tasks:
+        task.cancel()
+
+    logger.info("Throttling stats: {}", misc.throttler.stats)
+    logger.info("Stage latencies (ms): {}", json.dumps(metrics.latencies.drain()))
+
+    for site in misc.warehouses:
+        logger.info('Warehouse "{}" metrics: {}', site.name, site.summary())
+        logger.debug('Committing all unsaved changes and shutting down DB connections of warehouse "{}"', site.name)
+        site.close()
+
     logger.success("Successfully committed unsaved changes and disconnected from the SQLAnywhere database")
+    logger.info("Keeping {} deferred notification(s) until the next start", misc.scheduler.pending)
+    misc.scheduler.close()
 
-    logger.debug("Shutting down the web-cam")
+    logger.debug("Shutting down the web-cams")
     qr_cam.free_all()
-    logger.success("Successfully shut down the web-cam")
+    logger.success("Successfully shut down the web-cams")
+    await logger.complete()
 
 
 def main():
-    misc.loader.load_packages(["handlers"])
+    if config.args.standins:
+        from tools.standins import connect_warehouse as connect
+
+        pool_size = 1
+    else:
+        connect, pool_size = misc.connect, None
+
+    misc.open_warehouses(connect, pool_size)
+    misc.open_scheduler()
+
+    if config.args.shards:
+        from core import sharding
+
+        throttler = misc.throttler if misc.throttler.enabled else None
+        sharding.setup(misc.runner, misc.dp, config.args.shards, connect, pool_size, throttler)
+    else:
+        misc.loader.load_packages(["handlers"])
 
     misc.runner.on_startup(startup)
     misc.runner.on_shutdown(shutdown)
 
+    if config.args.soak:
+        from tools import soak
+
+        soak.setup(misc.runner)
+
     try:
         misc.runner.start_polling()
     except NetworkError:
-        logger.critical("Could not access https://api.telegram.org/. Check your internet connection")
+        logger.critical("Could not access {}. Check your internet connection", config.BOT_API_URL)
     except Unauthorized:
         logger.critical("Bot token is invalid. Make sure that you've set a valid token in the .env file")
 
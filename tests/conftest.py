@@ -0,0 +1,19 @@
+import sys
+
+import pytest
+
+
+@pytest.fixture(scope="session")
+def notify(tmp_path_factory):
+    """The real handlers.notify, imported with the soak test's stand-in settings instead of pytest's arguments."""
+
+    folder = tmp_path_factory.mktemp("bot")
+    argv = sys.argv
+    sys.argv = ["main.py", "--soak", "1", "--logfile", str(folder / "bot.log"), "--deferred", str(folder / "d.sqlite")]
+
+    try:
+        from handlers import notify
+    finally:
+        sys.argv = argv
+
+    return notify
@@ -0,0 +1,64 @@
+from typing import Any, Dict, List
+
+
+def orders(count: int, **fields: Any) -> List[Dict[str, Any]]:
+    """Full records of :count: orders of the same recipient at the same address."""
+
+    record = dict(
+        product="Keyboard",
+        model="K120",
+        price=17.5,
+        amount=1,
+        weight=0.55,
+        first_name="Ann",
+        last_name="Lee",
+        address="Baker Street 221B",
+        telegram_id=1,
+        timezone="UTC",
+        locale="en_US",
+    )
+    return [dict(record, id=number, **fields) for number in range(1, count + 1)]
+
+
+def test_single_order_gets_the_detailed_message(notify):
+    messages = notify.render(orders(1))
+
+    assert len(messages) == 1
+    assert "your order `1` has arrived" in messages[0]
+    assert "*Product Details:*" in messages[0]
+    assert "Price: €17\\.50" in messages[0]
+    assert "Summary" not in messages[0]
+
+
+def test_several_orders_are_listed_in_one_message(notify):
+    messages = notify.render(orders(3))
+
+    assert len(messages) == 1
+    assert "3 of your orders have arrived" in messages[0]
+    assert all(f"*Order* `{number}`" in messages[0] for number in (1, 2, 3))
+    assert messages[0].endswith("Total weight: 1\\.650 kg")
+
+
+def test_summary_adds_up_the_stored_values(notify):
+    rows = orders(2)
+    rows[1].update(price=2.25, amount=3, weight=0.25)
+    messages = notify.render(rows)
+
+    assert "Orders: 2\nItems: 4\nTotal price: €19\\.75\nTotal weight: 0\\.800 kg" in messages[0]
+
+
+def test_russian_locale_is_used(notify):
+    messages = notify.render(orders(2, locale="ru_RU"))
+
+    assert "Ваши заказы в количестве 2 шт\\. доставлены" in messages[0]
+
+
+def test_long_notification_is_split_at_the_length_limit(notify):
+    messages = notify.render(orders(60))
+    text = "\n\n".join(messages)
+
+    assert len(messages) > 1
+    assert all(len(message) <= notify.constants.MSG_LENGTH_MAX for message in messages)
+    assert [text.count(f"*Order* `{number}`") for number in range(1, 61)] == [1] * 60
+    assert "Summary" in messages[-1]
+    assert "Orders: 60" in messages[-1]
@@ -0,0 +1,126 @@
+import os
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from core.recording import Recording, RecordingWriter, find_recordings
+
+
+def frames(count: int):
+    return [np.full((4, 6, 3), number, dtype=np.uint8) for number in range(count)]
+
+
+def record(path: str, count: int, **kwargs) -> RecordingWriter:
+    writer = RecordingWriter(path, dict(source="synthetic", settings=dict(area=300)), **kwargs)
+
+    for number, frame in enumerate(frames(count)):
+        writer.write(frame, 100.0 + number, addresses=[f"address {number}"] if number % 2 else [])
+
+    writer.close()
+    return writer
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "camera.qrrec")
+    writer = record(path, 5, flush_frames=2)
+
+    assert (writer.written, writer.dropped, writer.failed) == (5, 0, False)
+
+    with Recording(path) as recording:
+        assert recording.metadata["source"] == "synthetic"
+        assert recording.metadata["settings"] == dict(area=300)
+        assert len(recording) == 5
+
+        for number, (frame, metadata) in enumerate(recording):
+            assert frame.ctypes.data % 16 == 0
+            np.testing.assert_array_equal(frame, frames(5)[number])
+            assert metadata["index"] == number
+            assert metadata["time"] == 100.0 + number
+            assert metadata["addresses"] == ([f"address {number}"] if number % 2 else [])
+
+        del frame
+
+
+def test_truncated_file_is_read_up_to_the_last_complete_frame(tmp_path):
+    path = str(tmp_path / "camera.qrrec")
+    record(path, 3)
+
+    with open(path, "r+b") as file:
+        file.truncate(os.path.getsize(path) - 10)
+
+    with Recording(path) as recording:
+        assert len(recording) == 2
+        np.testing.assert_array_equal(recording[1][0], frames(2)[1])
+
+
+def test_other_files_are_rejected(tmp_path):
+    path = tmp_path / "image.qrrec"
+    path.write_bytes(b"\x89PNG\r\n\x1a\n" + bytes(64))
+
+    with pytest.raises(ValueError):
+        Recording(str(path))
+
+    assert find_recordings([str(tmp_path)]) == [str(path)]
+
+
+@pytest.mark.parametrize("size", [0, 5, 12])
+def test_empty_and_short_files_are_rejected(tmp_path, size):
+    path = tmp_path / "camera.qrrec"
+    path.write_bytes((b"QRREC\x00\x01\x00" + bytes(16))[:size])
+
+    with pytest.raises(ValueError, match="too short"):
+        Recording(str(path))
+
+
+def test_failed_write_stops_the_recording(tmp_path):
+    writer = RecordingWriter(str(tmp_path / "camera.qrrec"), {})
+
+    def fail(*args) -> None:
+        raise OSError("No space left on device")
+
+    writer._write = fail  # type: ignore
+    writer.write(frames(1)[0], 0.0)
+    writer._thread.join(0.1)
+    writer.write(frames(1)[0], 1.0)
+    writer.close()
+
+    assert writer.failed
+    assert (writer.written, writer.dropped) == (0, 2)
+
+
+def test_queue_is_bounded_by_bytes(tmp_path):
+    frame = frames(1)[0]
+    writer = RecordingWriter(str(tmp_path / "camera.qrrec"), {}, max_bytes=2 * frame.nbytes)
+    writing = threading.Event()
+    resume = threading.Event()
+    write = writer._write
+
+    def slow(*args) -> None:
+        writing.set()
+        resume.wait(1.0)
+        write(*args)
+
+    writer._write = slow  # type: ignore
+    writer.write(frame, 0.0)
+    writing.wait(1.0)
+
+    for number in range(1, 4):
+        writer.write(frame, float(number))
+
+    resume.set()
+    writer.close()
+
+    assert (writer.written, writer.dropped) == (2, 2)
+
+
+def test_close_does_not_block_without_the_writing_thread(tmp_path):
+    writer = RecordingWriter(str(tmp_path / "camera.qrrec"), {})
+    writer._queue.put(None)
+    writer._thread.join()
+    writer.write(frames(1)[0], 0.0)
+    started = time.monotonic()
+    writer.close(timeout=0.1)
+
+    assert time.monotonic() - started < 1.0
@@ -0,0 +1,225 @@
+import asyncio
+import functools
+import sqlite3
+import time
+from datetime import datetime
+from typing import Any, Dict, List
+
+import pytest
+import pytz
+from aiogram.utils.exceptions import ChatNotFound, NetworkError, RetryAfter
+
+from core.scheduler import Scheduler, SendWindow
+
+
+def at(hour: int, zone: str = "UTC") -> datetime:
+    return pytz.timezone(zone).localize(datetime(2021, 3, 1, hour, 30))
+
+
+def rows(telegram_id: int, address: str, *ids: int):
+    return [dict(id=order, telegram_id=telegram_id, address=address, timezone="UTC") for order in ids or (1,)]
+
+
+def test_window_allows_inside_and_defers_to_the_next_opening():
+    window = SendWindow(9, 21)
+
+    assert window.release("UTC", at(12)) is None
+    assert window.release("UTC", at(22)) == at(9).replace(day=2, minute=0).timestamp()
+    assert window.release("UTC", at(3)) == at(9).replace(minute=0).timestamp()
+
+
+def test_window_uses_the_recipient_timezone():
+    window = SendWindow(9, 21)
+
+    assert window.release("Europe/Moscow", at(7)) is None
+    assert window.release("America/New_York", at(12)) == at(9, "America/New_York").replace(minute=0).timestamp()
+    assert window.release("Nowhere/Unknown", at(22)) == window.release("UTC", at(22))
+
+
+def test_window_wraps_around_midnight_and_can_be_disabled():
+    assert SendWindow(22, 6).release("UTC", at(23)) is None
+    assert SendWindow(22, 6).release("UTC", at(12)) == at(22).replace(minute=0).timestamp()
+    assert SendWindow(0, 0).release("UTC", at(3)) is None
+
+
+def run(scheduler: Scheduler, send, until) -> None:
+    """Runs the scheduler until :until: returns True (or for a second at most)."""
+
+    async def main() -> None:
+        task = asyncio.get_event_loop().create_task(scheduler.run(send))
+        deadline = time.monotonic() + 1.0
+
+        while not until() and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+
+        task.cancel()
+
+    asyncio.run(main())
+
+
+def test_newer_notification_replaces_pending_one_and_survives_restart(tmp_path):
+    path = str(tmp_path / "deferred.sqlite")
+    scheduler = Scheduler(path, SendWindow(9, 21))
+    scheduler.schedule(time.time() + 3600, rows(1, "A", 1))
+    scheduler.schedule(time.time() + 3600, rows(1, "A", 1, 2))
+    scheduler.schedule(time.time() + 3600, rows(2, "A"))
+
+    assert scheduler.pending == 2
+
+    scheduler.close()
+    restored = Scheduler(path, SendWindow(9, 21))
+
+    assert restored.pending == 2
+    restored.close()
+
+
+def test_releases_due_notifications_and_removes_them(tmp_path):
+    path = str(tmp_path / "deferred.sqlite")
+    scheduler = Scheduler(path, SendWindow(9, 21), pause=0.0)
+    scheduler.schedule(time.time() - 1, rows(1, "A", 1, 2))
+    scheduler.schedule(time.time() + 3600, rows(2, "B"))
+    sent = []
+
+    async def send(payload) -> None:
+        sent.append(payload)
+
+    run(scheduler, send, lambda: sent)
+    scheduler.close()
+
+    assert sent == [rows(1, "A", 1, 2)]
+    assert Scheduler(path, SendWindow(9, 21)).pending == 1
+
+
+def test_flood_control_keeps_the_rest_of_the_batch(tmp_path):
+    scheduler = Scheduler(str(tmp_path / "deferred.sqlite"), SendWindow(9, 21), pause=0.0)
+
+    for telegram_id in (1, 2, 3):
+        scheduler.schedule(time.time() - 10 + telegram_id, rows(telegram_id, "A"))
+
+    sent = []
+    calls = []
+
+    async def send(payload) -> None:
+        calls.append(payload[0]["telegram_id"])
+
+        if len(calls) == 2:
+            raise RetryAfter(0)
+
+        sent.append(payload[0]["telegram_id"])
+
+    run(scheduler, send, lambda: len(sent) == 3)
+
+    assert calls == [1, 2, 2, 3]
+    assert sent == [1, 2, 3]
+    assert scheduler.pending == 0
+    scheduler.close()
+
+
+def test_failed_notification_is_kept_and_deferred(tmp_path):
+    path = str(tmp_path / "deferred.sqlite")
+    scheduler = Scheduler(path, SendWindow(9, 21), pause=0.0, retry_delay=3600)
+    scheduler.schedule(time.time() - 1, rows(1, "A"))
+    calls = []
+
+    async def send(payload) -> None:
+        calls.append(payload)
+        raise RuntimeError("Boom")
+
+    run(scheduler, send, lambda: calls)
+    scheduler.close()
+    restored = Scheduler(path, SendWindow(9, 21))
+
+    assert len(calls) == 1
+    assert restored.pending == 1
+    assert restored._heap[0][0] == pytest.approx(time.time() + 3600, abs=5)
+    restored.close()
+
+
+def test_notifications_of_different_warehouses_are_kept_apart(tmp_path):
+    scheduler = Scheduler(str(tmp_path / "deferred.sqlite"), SendWindow(9, 21))
+    scheduler.schedule(time.time() + 3600, rows(1, "A"), warehouse="north")
+    scheduler.schedule(time.time() + 3600, rows(1, "A"), warehouse="south")
+    scheduler.schedule(time.time() + 3600, rows(1, "A", 1, 2), warehouse="south")
+
+    assert scheduler.pending == 2
+    scheduler.close()
+
+
+def test_file_without_warehouses_is_upgraded(tmp_path):
+    path = str(tmp_path / "deferred.sqlite")
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE deferred (id INTEGER PRIMARY KEY AUTOINCREMENT, due REAL NOT NULL, "
+        "telegram_id INTEGER NOT NULL, address TEXT NOT NULL, payload TEXT NOT NULL);"
+    )
+    conn.execute("INSERT INTO deferred (due, telegram_id, address, payload) VALUES (0, 1, 'A', '[]');")
+    conn.commit()
+    conn.close()
+    scheduler = Scheduler(path, SendWindow(9, 21))
+    scheduler.schedule(time.time() + 3600, rows(1, "A"))
+
+    assert scheduler.pending == 1
+    scheduler.close()
+
+
+def order(telegram_id: int, address: str, **fields: Any) -> List[Dict[str, Any]]:
+    """A full record of a single order, as notify.start passes it on."""
+
+    record = dict(
+        id=1,
+        product="Keyboard",
+        model="K120",
+        price=17.5,
+        amount=1,
+        weight=0.55,
+        first_name="Ann",
+        last_name="Lee",
+        address=address,
+        telegram_id=telegram_id,
+        timezone="UTC",
+        locale="en_US",
+    )
+    return [dict(record, **fields)]
+
+
+def deliver(notify, scheduler: Scheduler, monkeypatch, error: Exception, until) -> List[Any]:
+    """Runs :scheduler: with the real notify_user whose every message fails with :error:."""
+
+    calls: List[Any] = []
+
+    async def send_message(*args, **kwargs) -> None:
+        calls.append(args)
+        raise error
+
+    monkeypatch.setattr(notify.misc.bot, "send_message", send_message)
+    run(scheduler, functools.partial(notify.notify_user, raise_errors=True), lambda: until(calls))
+    return calls
+
+
+def test_network_error_keeps_the_notification(tmp_path, notify, monkeypatch):
+    path = str(tmp_path / "deferred.sqlite")
+    scheduler = Scheduler(path, SendWindow(9, 21), pause=0.0, retry_delay=3600, max_attempts=1)
+    scheduler.schedule(time.time() - 1, order(1, "A"))
+    calls = deliver(notify, scheduler, monkeypatch, NetworkError("Connection refused"), bool)
+    scheduler.close()
+    restored = Scheduler(path, SendWindow(9, 21))
+
+    assert len(calls) == 1
+    assert restored.pending == 1
+    restored.close()
+
+
+def test_permanent_error_is_given_up_after_max_attempts(tmp_path, notify, monkeypatch):
+    path = str(tmp_path / "deferred.sqlite")
+    scheduler = Scheduler(path, SendWindow(9, 21), pause=0.0, retry_delay=0.0, max_attempts=3)
+    scheduler.schedule(time.time() - 1, order(1, "A", timezone="Nowhere/Unknown"))
+    scheduler.schedule(time.time() - 1, order(2, "B"))
+    deliver(notify, scheduler, monkeypatch, ChatNotFound("Chat not found"), lambda calls: scheduler.pending == 0)
+    scheduler.close()
+    conn = sqlite3.connect(path)
+
+    assert conn.execute("SELECT telegram_id FROM deferred;").fetchall() == []
+    assert conn.execute("SELECT telegram_id, error FROM dead;").fetchall() == [
+        (1, "UnknownTimeZoneError('Nowhere/Unknown')")
+    ]
+    conn.close()
@@ -0,0 +1,121 @@
+import time
+
+import pytest
+from aiogram.dispatcher.handler import CancelHandler
+from aiogram.types import Update
+
+from core.throttling import ThrottlingMiddleware, TokenBucket
+
+
+def test_bucket_starts_full_and_refills_at_rate():
+    bucket = TokenBucket(rate=2.0, capacity=3.0, now=0.0)
+
+    assert [bucket.consume(0.0) for _ in range(4)] == [True, True, True, False]
+    assert not bucket.consume(0.4)
+    assert bucket.consume(0.5)
+    assert bucket.tokens == pytest.approx(0.0)
+
+
+def test_bucket_never_exceeds_capacity():
+    bucket = TokenBucket(rate=10.0, capacity=2.0, now=0.0)
+
+    assert bucket.available(100.0)
+    assert bucket.tokens == 2.0
+
+
+def test_bucket_available_takes_nothing():
+    bucket = TokenBucket(rate=1.0, capacity=1.0, now=0.0)
+
+    assert bucket.available(0.0)
+    assert bucket.available(0.0)
+    assert bucket.consume(0.0)
+    assert not bucket.available(0.0)
+
+
+def passes(throttler: ThrottlingMiddleware, user_id: int, now: float) -> bool:
+    try:
+        throttler._throttle(user_id, now)
+    except CancelHandler:
+        return False
+
+    return True
+
+
+def test_disabled_by_default():
+    throttler = ThrottlingMiddleware()
+
+    assert not throttler.enabled
+    assert all(passes(throttler, user_id, 0.0) for user_id in range(1000))
+    assert throttler.stats == dict(passed=1000, absorbed=0)
+
+
+def test_per_user_limit():
+    throttler = ThrottlingMiddleware(rate=1.0, burst=2.0)
+
+    assert [passes(throttler, 1, 0.0) for _ in range(3)] == [True, True, False]
+    assert passes(throttler, 2, 0.0)
+    assert passes(throttler, 1, 1.0)
+    assert throttler.absorbed == {"user": 1}
+
+
+def test_global_rejection_keeps_user_token():
+    throttler = ThrottlingMiddleware(rate=1.0, burst=1.0, global_rate=1.0, global_burst=1.0)
+    now = time.monotonic()
+
+    assert passes(throttler, 1, now)
+    assert not passes(throttler, 2, now)
+    assert throttler.absorbed == {"global": 1}
+    assert throttler._buckets[2].tokens == 1.0
+    assert passes(throttler, 2, now + 1.0)
+
+
+def test_user_rejection_keeps_global_token():
+    throttler = ThrottlingMiddleware(rate=1.0, burst=1.0, global_rate=1.0, global_burst=2.0)
+    now = time.monotonic()
+
+    assert passes(throttler, 1, now)
+    assert not passes(throttler, 1, now)
+    assert throttler._global.tokens == pytest.approx(1.0)
+    assert passes(throttler, 2, now)
+
+
+def test_evicts_least_recently_seen_users():
+    throttler = ThrottlingMiddleware(rate=1.0, burst=1.0, max_users=2)
+
+    for user_id in (1, 2, 1, 3):
+        passes(throttler, user_id, 0.0)
+
+    assert list(throttler._buckets) == [1, 3]
+
+
+def test_check_update_limits_messages_and_collapses_callbacks():
+    throttler = ThrottlingMiddleware(rate=1.0, burst=1.0, collapse=1.0)
+    message = Update(
+        update_id=1,
+        message={
+            "message_id": 1,
+            "date": 0,
+            "chat": {"id": 1, "type": "private"},
+            "from": {"id": 1, "is_bot": False, "first_name": "A"},
+            "text": "/lang",
+        },
+    )
+    callback = Update(
+        update_id=2,
+        callback_query={
+            "id": "1",
+            "chat_instance": "1",
+            "data": "lang_en",
+            "from": {"id": 2, "is_bot": False, "first_name": "B"},
+        },
+    )
+    throttler.check_update(message)
+    throttler.check_update(callback)
+
+    with pytest.raises(CancelHandler):
+        throttler.check_update(message)
+
+    with pytest.raises(CancelHandler):
+        throttler.check_update(callback)
+
+    assert throttler.absorbed == {"user": 1, "duplicate": 1}
@@ -0,0 +1,99 @@
+r"""Throughput of the bot's update handlers and the event loop's lag on the stock asyncio loop and on uvloop.
+
+For every event loop backend, starts the Bot API stand-in from tools/fake_api.py and the bot itself
+("main.py --loop BACKEND" with the in-memory stand-in database and no web-cams), queues a burst of "/lang"
+updates from many users at once and measures how fast the bot answers them (see tools/bench_sharding.py).
+The bot probes its own loop's lag all the time and logs its summary at the shutdown, which is read back here:
+
+    python -m tools.bench_loop --loops asyncio,uvloop --updates 20000 --users 2000
+
+The backends that aren't installed are skipped.
+"""
+
+import asyncio
+import json
+import os
+from typing import Any, Dict
+
+from loguru import logger
+
+from core import loops
+from tools.bench_sharding import measure
+from tools.fake_api import create_parser
+
+LATENCIES_MARKER = "Stage latencies (ms): "
+
+
+def loop_lag(folder: str) -> Dict[str, float]:
+    """Returns the summary of the loop lag logged by the bot (see main.shutdown), an empty one if there's none."""
+
+    with open(os.path.join(folder, "bot.log"), encoding="utf-8") as file:
+        for line in file:
+            if LATENCIES_MARKER in line:
+                return json.loads(line.split(LATENCIES_MARKER, 1)[1]).get("loop_lag", {})
+
+    return {}
+
+
+async def compare(args: Any) -> None:
+    results = []
+
+    for backend in args.loops:
+        if backend not in loops.available():
+            logger.warning('Skipping the "{}" event loop: it is not installed', backend)
+            continue
+
+        logger.info('Measuring the bot on the "{}" event loop...', backend)
+
+        try:
+            result = await measure(args, args.shards, ["--loop", backend])
+        except (TimeoutError, asyncio.TimeoutError) as ex:
+            logger.error('Skipping the "{}" event loop: {}', backend, ex or "the bot hasn't started polling")
+            continue
+
+        lag = loop_lag(result["folder"])
+        result.update(
+            backend=backend, lag_p50=lag.get("p50", 0.0), lag_p95=lag.get("p95", 0.0), lag_max=lag.get("max", 0.0)
+        )
+        results.append(result)
+        logger.info(
+            "{backend}: {updates} update(s) in {elapsed:.2f}s, {rate:.0f} update(s)/s, "
+            "latency p50={p50:.1f}ms p99={p99:.1f}ms, loop lag p50={lag_p50:.2f}ms p95={lag_p95:.2f}ms "
+            "max={lag_max:.2f}ms",
+            **result,
+        )
+
+    if not results:
+        return
+
+    base = results[0]["rate"]
+
+    for result in results:
+        logger.success(
+            "{:>8}: {:>8.0f} update(s)/s, x{:.2f}, loop lag p95 {:.2f}ms",
+            result["backend"],
+            result["rate"],
+            result["rate"] / base,
+            result["lag_p95"],
+        )
+
+
+def main() -> None:
+    parser = create_parser("Throughput of the update handlers and the loop lag on the event loop backends")
+    parser.add_argument(
+        "--loops",
+        type=lambda value: [backend for backend in value.split(",") if backend],
+        default=["asyncio", "uvloop"],
+        help="comma-separated event loop backends to compare",
+    )
+    parser.add_argument("--shards", type=int, default=0, help="number of the bot's worker processes")
+    parser.add_argument("--updates", type=int, default=10000, help="number of the measured updates")
+    parser.add_argument("--users", type=int, default=1000, help="number of distinct users sending updates")
+    parser.add_argument("--first-user", type=int, default=1, help="Telegram ID of the first user")
+    parser.add_argument("--timeout", type=float, default=120, help="time (in seconds) to wait for the bot")
+    args = parser.parse_args()
+    asyncio.get_event_loop().run_until_complete(compare(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+r"""Throughput of the bot's update handlers against the number of the worker processes.
+
+For every number of the workers, starts the Bot API stand-in from tools/fake_api.py and the bot itself
+("main.py --shards N" with the in-memory stand-in database and no web-cams), warms it up, then queues a burst of
+"/lang" updates from many users at once and measures how fast the bot answers them.  "--shards 0" is the
+single-process bot handling the updates itself:
+
+    python -m tools.bench_sharding --workers 0,1,2,4,8 --updates 20000 --users 2000
+
+The front process only receives and routes the updates, so the throughput should grow with the workers up to
+the number of the machine's cores.
+"""
+
+import asyncio
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Sequence
+
+from loguru import logger
+
+from tools.fake_api import create_parser, from_args
+from tools.loadtest import LoadReport, percentile
+
+BOT_TOKEN = "123456:bench"
+
+
+def bot_command(workers: int, url: str, folder: str, options: Sequence[str] = ()) -> List[str]:
+    warehouses = os.path.join(folder, "warehouses.json")
+
+    with open(warehouses, "w", encoding="utf-8") as file:
+        json.dump([{"name": "bench", "uid": "admin", "table": "Orders", "cameras": []}], file)
+
+    return [
+        sys.executable,
+        "main.py",
+        "--api-url",
+        url,
+        "--standins",
+        "--warehouses",
+        warehouses,
+        "--shards",
+        str(workers),
+        "--metrics-interval",
+        "0",
+        "--logfile",
+        os.path.join(folder, "bot.log"),
+        "--deferred",
+        os.path.join(folder, "deferred.sqlite"),
+        *options,
+    ]
+
+
+async def answered(report: LoadReport, count: int, timeout: float) -> bool:
+    deadline = time.perf_counter() + timeout
+
+    while report.answered < count:
+        if time.perf_counter() > deadline:
+            return False
+
+        await asyncio.sleep(0.01)
+
+    return True
+
+
+async def measure(args: Any, workers: int, options: Sequence[str] = ()) -> Dict[str, Any]:
+    """Runs the bot with :workers: worker processes and the extra command line :options: against a fresh stand-in
+    and measures its throughput.  The bot's logs are left in the returned "folder".
+    """
+
+    server = from_args(args, record=False)
+    report = LoadReport()
+    server.listeners.append(report.on_sent)
+    url = await server.start(args.host, args.port)
+    folder = tempfile.mkdtemp(prefix="bench_sharding_")
+    env = dict(os.environ, PROD_BOT_TOKEN=BOT_TOKEN, DEV_BOT_TOKEN=BOT_TOKEN)
+    bot = subprocess.Popen(
+        bot_command(workers, url, folder, options), env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    users = list(range(args.first_user, args.first_user + args.users))
+
+    try:
+        await asyncio.wait_for(server.polling.wait(), args.timeout)
+
+        for user_id in users:
+            server.add_message(user_id, "/lang")
+            report.expect(user_id)
+
+        if not await answered(report, len(users), args.timeout):
+            raise TimeoutError(f"the bot hasn't warmed up in {args.timeout} second(s)")
+
+        warmed = report.answered
+        started = time.perf_counter()
+
+        for number in range(args.updates):
+            user_id = users[number % len(users)]
+            server.add_message(user_id, "/lang")
+            report.expect(user_id)
+
+        if not await answered(report, warmed + args.updates, args.timeout):
+            raise TimeoutError(f"the bot hasn't answered in {args.timeout} second(s)")
+
+        elapsed = time.perf_counter() - started
+        latencies = sorted(report.latencies[warmed:])
+        return dict(
+            workers=workers,
+            updates=args.updates,
+            elapsed=elapsed,
+            rate=args.updates / elapsed,
+            p50=1000 * percentile(latencies, 0.5),
+            p99=1000 * percentile(latencies, 0.99),
+            folder=folder,
+        )
+    finally:
+        bot.send_signal(signal.SIGINT)
+
+        try:
+            bot.wait(args.timeout)
+        except subprocess.TimeoutExpired:
+            bot.kill()
+
+        await server.stop()
+
+
+async def compare(args: Any) -> None:
+    results = []
+
+    for workers in args.workers:
+        logger.info("Measuring the bot with {} worker(s)...", workers)
+
+        try:
+            result = await measure(args, workers)
+        except (TimeoutError, asyncio.TimeoutError) as ex:
+            logger.error("Skipping {} worker(s): {}", workers, ex or "the bot hasn't started polling")
+            continue
+
+        results.append(result)
+        logger.info(
+            "{workers} worker(s): {updates} update(s) in {elapsed:.2f}s, {rate:.0f} update(s)/s, "
+            "latency p50={p50:.1f}ms p99={p99:.1f}ms",
+            **result,
+        )
+
+    if not results:
+        return
+
+    base = results[0]["rate"]
+
+    for result in results:
+        logger.success(
+            "{:>2} worker(s): {:>8.0f} update(s)/s, x{:.2f}", result["workers"], result["rate"], result["rate"] / base
+        )
+
+
+def main() -> None:
+    parser = create_parser("Throughput of the update handlers against the number of the worker processes")
+    parser.add_argument(
+        "--workers",
+        type=lambda value: [int(workers) for workers in value.split(",") if workers],
+        default=[0, 1, 2, 4],
+        help="comma-separated numbers of the worker processes to compare, 0 for the single-process bot",
+    )
+    parser.add_argument("--updates", type=int, default=10000, help="number of the measured updates")
+    parser.add_argument("--users", type=int, default=1000, help="number of distinct users sending updates")
+    parser.add_argument("--first-user", type=int, default=1, help="Telegram ID of the first user")
+    parser.add_argument("--timeout", type=float, default=120, help="time (in seconds) to wait for the bot")
+    args = parser.parse_args()
+    asyncio.get_event_loop().run_until_complete(compare(args))
+
+
+if __name__ == "__main__":
+    main()
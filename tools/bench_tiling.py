@@ -0,0 +1,105 @@
+r"""Benchmark of the tiled multi-core QR-code detection.
+
+    Compares the single-threaded detection (scan_square, as "main.py" runs it) with TiledDetector running on
+    1..N workers over the same high-resolution frame and reports the time per frame and the speedup:
+
+        python -m tools.bench_tiling --width 3840 --height 2160 --side 2000 --tiles 4 --max-workers 8
+        python -m tools.bench_tiling --image dock_camera_4k.png --processes
+
+    Without --image a synthetic frame with a few bright label-like shapes is generated, so the detection stage is
+    fully exercised even though nothing gets decoded.
+"""
+import argparse
+import time
+from typing import Any, Callable
+
+import cv2
+import numpy as np
+from loguru import logger
+
+from core.detection import create_square, scan_square
+from core.tiling import TiledDetector
+
+
+def synthetic_frame(width: int, height: int, labels: int = 12, seed: int = 0) -> Any:
+    """Generates a dark noisy BGR frame with :labels: bright rectangles that have a dark pattern inside."""
+
+    rng = np.random.default_rng(seed)
+    frame = rng.integers(0, 96, (height, width, 3), dtype=np.uint8)
+
+    for _ in range(labels):
+        size = int(rng.integers(min(width, height) // 16, min(width, height) // 6))
+        x, y = int(rng.integers(0, width - size)), int(rng.integers(0, height - size))
+        cv2.rectangle(frame, (x, y), (x + size, y + size), (245, 245, 245), -1)
+        cell = max(size // 12, 2)
+
+        for cx in range(x + cell, x + size - cell, 2 * cell):
+            for cy in range(y + cell, y + size - cell, 2 * cell):
+                if rng.random() < 0.5:
+                    cv2.rectangle(frame, (cx, cy), (cx + cell, cy + cell), (16, 16, 16), -1)
+
+    return frame
+
+
+def measure(run: Callable[[], Any], repeat: int) -> float:
+    """Returns the average wall-clock time in seconds of a single call of :run: after a warm-up call."""
+
+    run()
+    started = time.perf_counter()
+
+    for _ in range(repeat):
+        run()
+
+    return (time.perf_counter() - started) / repeat
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        "Benchmark of the tiled multi-core QR-code detection", formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument("--image", default=None, help="path to a captured frame, a synthetic one is used otherwise")
+    parser.add_argument("--width", type=int, default=3840, help="width of the synthetic frame")
+    parser.add_argument("--height", type=int, default=2160, help="height of the synthetic frame")
+    parser.add_argument("--side", type=int, default=2000, help="side (in pixels) of the detection square")
+    parser.add_argument("--area", type=int, default=300, help="thresholded area of the object's detection")
+    parser.add_argument("--color", type=int, default=196, help="thresholded hue of the object")
+    parser.add_argument("--tiles", type=int, default=4, help="number of tiles along each side of the square")
+    parser.add_argument("--overlap", type=int, default=256, help="width (in pixels) of the tiles' overlap")
+    parser.add_argument("--max-workers", type=int, default=8, help="largest number of workers to measure")
+    parser.add_argument("--processes", action="store_true", help="use a process pool instead of a thread pool")
+    parser.add_argument("--repeat", type=int, default=20, help="number of measured frames per setting")
+    args = parser.parse_args()
+
+    frame = cv2.imread(args.image) if args.image else synthetic_frame(args.width, args.height)
+    square = create_square(frame, side=args.side)
+    kernel = np.ones((2, 2), np.uint8)
+    logger.info("Frame {0}x{1}, square side {2}, {3}x{3} tiles", frame.shape[1], frame.shape[0], args.side, args.tiles)
+
+    def single() -> None:
+        scan_square(frame, square, kernel, args.area, args.color)
+
+    baseline = measure(single, args.repeat)
+    logger.info("{:>22}: {:8.1f} ms/frame {:6.1f} fps", "single-threaded", baseline * 1000, 1 / baseline)
+    reference = 0.0
+
+    for workers in range(1, args.max_workers + 1):
+        tiler = TiledDetector(args.tiles, args.overlap, workers, args.processes)
+
+        try:
+            elapsed = measure(lambda: tiler.detect(frame, square, kernel, args.area, args.color), args.repeat)
+        finally:
+            tiler.shutdown()
+
+        reference = reference or elapsed
+        logger.info(
+            "{:>22}: {:8.1f} ms/frame {:6.1f} fps  x{:.2f} vs 1 worker  x{:.2f} vs single-threaded",
+            f"tiled, {workers} worker(s)",
+            elapsed * 1000,
+            1 / elapsed,
+            reference / elapsed,
+            baseline / elapsed,
+        )
+
+
+if __name__ == "__main__":
+    main()
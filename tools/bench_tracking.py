@@ -0,0 +1,114 @@
+r"""Benchmark of the candidates' tracking between frames.
+
+    Runs the same stream of frames through the full detection on every frame (scan_square, as "main.py" does by
+    default) and through the tracked one ("main.py --track"), and reports the time per frame,
+    the number of the full detections and of the decoding attempts of each:
+
+        python -m tools.bench_tracking --frames 500 --track-frames 3 --track-retry 5
+        python -m tools.bench_tracking --image label.png --width 1920 --height 1080 --side 800
+
+    The frames are generated by core.sources.SyntheticCapture: a label sliding through the square, taken away for a
+    while every --period frames.  The decoding is timed as well, so with a real QR-code given as --image the
+    benchmark shows the decodes the tracking saves and those it loses.
+"""
+import argparse
+import time
+from typing import Any, Dict, List
+
+import cv2
+import numpy as np
+from loguru import logger
+
+from core.detection import ScanStats, create_square, decode_candidate, locate_inside_square, scan_square
+from core.sources import SyntheticCapture
+from core.tracking import BoxTracker, track_candidate
+
+
+def untracked(frames: List[Any], square: np.ndarray, kernel: np.ndarray, args: Any) -> Dict[str, Any]:
+    """Runs the full detection and decoding of every frame."""
+
+    stats = ScanStats()
+    started = time.perf_counter()
+
+    for frame in frames:
+        scan_square(frame, square, kernel, args.area, args.color, stats=stats)
+
+    return dict(
+        elapsed=time.perf_counter() - started, detections=len(frames), attempts=stats.attempts, decoded=stats.decoded
+    )
+
+
+def tracked(frames: List[Any], square: np.ndarray, kernel: np.ndarray, args: Any) -> Dict[str, Any]:
+    """Tracks the candidate between the frames and decodes it once it's still, as core.qr_cam.scan_frame does."""
+
+    tracker = BoxTracker(stable_frames=args.track_frames, retry_frames=args.track_retry)
+    stats = ScanStats()
+    detections = 0
+
+    def locate(image: Any) -> Any:
+        nonlocal detections
+        detections += 1
+        return locate_inside_square(image, square, kernel, args.area, args.color, draw=False)
+
+    started = time.perf_counter()
+
+    for frame in frames:
+        cropped = track_candidate(frame, square, tracker, locate)
+
+        if cropped is not None:
+            tracker.attempt(decoded=bool(decode_candidate(cropped, stats)))
+
+    return dict(
+        elapsed=time.perf_counter() - started,
+        detections=detections,
+        attempts=stats.attempts,
+        decoded=stats.decoded,
+        lost=tracker.lost,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        "Benchmark of the candidates' tracking between frames", formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument("--image", default=None, help="path to the label shown on the frames, a generated one if unset")
+    parser.add_argument("--width", type=int, default=1280, help="width of the frames")
+    parser.add_argument("--height", type=int, default=720, help="height of the frames")
+    parser.add_argument("--side", type=int, default=600, help="side (in pixels) of the detection square")
+    parser.add_argument("--area", type=int, default=300, help="thresholded area of the object's detection")
+    parser.add_argument("--color", type=int, default=196, help="thresholded hue of the object")
+    parser.add_argument("--frames", type=int, default=300, help="number of measured frames")
+    parser.add_argument("--period", type=int, default=50, help="number of frames in a cycle of the label's appearance")
+    parser.add_argument("--track-frames", type=int, default=3, help="frames a candidate has to stay still")
+    parser.add_argument("--track-retry", type=int, default=5, help="frames to wait before decoding again")
+    args = parser.parse_args()
+
+    image = cv2.imread(args.image) if args.image else None
+    capture = SyntheticCapture(args.width, args.height, image=image, period=args.period)
+    frames = [capture.read()[1] for _ in range(args.frames)]
+    square = create_square(frames[0], side=args.side)
+    kernel = np.ones((2, 2), np.uint8)
+    logger.info("{} frame(s) {}x{}, square side {}", len(frames), args.width, args.height, args.side)
+    results = {}
+
+    for name, run in (("full detection", untracked), ("tracked", tracked)):
+        result = run([frame.copy() for frame in frames], square, kernel, args)
+        results[name] = result
+        logger.info(
+            "{:>14}: {:6.2f} ms/frame, {} full detection(s), {} decoding attempt(s), {} decoded",
+            name,
+            result["elapsed"] * 1000 / len(frames),
+            result["detections"],
+            result["attempts"],
+            result["decoded"],
+        )
+
+    logger.success(
+        "Tracking: x{:.2f} per frame, lost the track {} time(s)",
+        results["full detection"]["elapsed"] / results["tracked"]["elapsed"],
+        results["tracked"]["lost"],
+    )
+
+
+if __name__ == "__main__":
+    main()
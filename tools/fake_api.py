@@ -0,0 +1,335 @@
+r"""Local stand-in for the Telegram Bot API server.
+
+    Serves the subset of the Bot API the bot relies on (getMe, getUpdates, sendMessage, answerCallbackQuery and
+    a generic "ok" for anything else), records every outgoing call and can inject latency, "429 Too Many Requests"
+    (aiogram's RetryAfter) and "403 bot was blocked by the user" (aiogram's BotBlocked) errors.  Updates are
+    generated on demand (or posted to "/fake/updates") and handed out through long polling, so the bot runs
+    unmodified against it:
+
+        python -m tools.fake_api --port 8081 --latency 0.05 --retry-rate 0.01
+        python main.py --api-url http://127.0.0.1:8081
+
+    The bot's token is not checked, any well-formed one (e.g. "123456:fake") will do.
+"""
+import argparse
+import asyncio
+import collections
+import itertools
+import json
+import random
+import time
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional
+
+from aiohttp import web
+from loguru import logger
+
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Fake", "username": "fake_bot"}
+WEBHOOK_INFO = {"url": "", "has_custom_certificate": False, "pending_update_count": 0}
+SEND_METHODS = {"sendmessage", "answercallbackquery", "editmessagetext", "sendphoto", "senddocument"}
+
+
+class SentCall:
+    """A single call the bot has made to the stand-in server.
+
+    Attributes:
+        method (str): Lower-cased name of the Bot API method.
+        params (dict): Parameters of the call.
+        chat_id (int): Recipient of the call (the user ID for callback answers), None if there's none.
+        timestamp (float): Time (as of time.perf_counter) the call has been received.
+    """
+
+    __slots__ = ("method", "params", "chat_id", "timestamp")
+
+    def __init__(self, method: str, params: Dict[str, Any], chat_id: Optional[int], timestamp: float):
+        self.method = method
+        self.params = params
+        self.chat_id = chat_id
+        self.timestamp = timestamp
+
+
+class FakeBotAPI:
+    """In-memory Telegram Bot API server.
+
+    Attributes:
+        [optional] latency (float): Delay in seconds before answering any non-polling call.
+        [optional] jitter (float): Maximal random delay in seconds added on top of :latency:.
+        [optional] retry_rate (float): Probability of answering a send call with "429 Too Many Requests".
+        [optional] retry_after (int): The "retry_after" value in seconds reported along with the 429 error.
+        [optional] blocked (iterable): Telegram IDs of the users who have blocked the bot.
+        [optional] record (bool): Keep every sent call in :sent:.  Disable for long runs.
+        sent (list): Every recorded call to a send method.
+        counters (collections.Counter): Number of calls per method and number of injected errors.
+        listeners (list): Callables that receive every SentCall as soon as it's received.
+        polling (asyncio.Event): Set once the bot has started long polling for updates.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        retry_rate: float = 0.0,
+        retry_after: int = 1,
+        blocked: Iterable[int] = (),
+        record: bool = True,
+        seed: Optional[int] = None,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.retry_rate = retry_rate
+        self.retry_after = retry_after
+        self.blocked = set(blocked)
+        self.record = record
+        self.sent: List[SentCall] = []
+        self.counters: collections.Counter = collections.Counter()
+        self.listeners: List[Callable[[SentCall], None]] = []
+        self.polling = asyncio.Event()
+
+        self._random = random.Random(seed)
+        self._updates: Deque[Dict[str, Any]] = collections.deque()
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._arrived = asyncio.Event()
+        self._runner: Optional[web.AppRunner] = None
+
+    def application(self) -> web.Application:
+        """Creates the aiohttp application that routes "/bot<token>/<method>" requests to the stand-in."""
+
+        app = web.Application()
+        app.router.add_route("*", "/bot{token}/{method}", self.handle)
+        app.router.add_post("/fake/updates", self.handle_updates)
+        app.router.add_get("/fake/stats", self.handle_stats)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8081) -> str:
+        """Starts serving on :host: and :port:.
+
+        Returns:
+            The base URL to pass to the bot's "--api-url" argument.
+        """
+
+        self._runner = web.AppRunner(self.application(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        url = f"http://{host}:{port}"
+        logger.success('Fake Bot API server is listening on "{}"', url)
+        return url
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def add_update(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Queues an update for the bot.  :payload: is the update without its "update_id", e.g. {"message": {...}}."""
+
+        update = dict(payload, update_id=next(self._update_ids))
+        self._updates.append(update)
+        self._arrived.set()
+        return update
+
+    def add_message(self, user_id: int, text: str) -> Dict[str, Any]:
+        """Queues a private text message from the user :user_id:.  Commands get a "bot_command" entity."""
+
+        message = self._message(user_id, text)
+
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+
+        return self.add_update({"message": message})
+
+    def add_callback(self, user_id: int, data: str) -> Dict[str, Any]:
+        """Queues a callback query with :data: as if the user :user_id: pressed an inline keyboard button."""
+
+        callback = {
+            "id": str(next(self._message_ids)),
+            "from": self._user(user_id),
+            "message": self._message(BOT_USER["id"], "", chat_id=user_id),
+            "chat_instance": str(user_id),
+            "data": data,
+        }
+        return self.add_update({"callback_query": callback})
+
+    @property
+    def pending(self) -> int:
+        """Number of updates that haven't been confirmed by the bot yet."""
+
+        return len(self._updates)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"].lower()
+        params = await self._params(request)
+        self.counters[method] += 1
+
+        if method == "getupdates":
+            return self._ok(await self._get_updates(params))
+
+        if self.latency or self.jitter:
+            await asyncio.sleep(self.latency + self._random.uniform(0, self.jitter))
+
+        if method == "getme":
+            return self._ok(BOT_USER)
+
+        if method == "getwebhookinfo":
+            return self._ok(dict(WEBHOOK_INFO, pending_update_count=self.pending))
+
+        if method not in SEND_METHODS:
+            return self._ok(True)
+
+        if self.retry_rate and (self._random.random() < self.retry_rate):
+            self.counters["error_429"] += 1
+            return self._error(
+                429, f"Too Many Requests: retry after {self.retry_after}", {"retry_after": self.retry_after}
+            )
+
+        chat_id = params.get("chat_id") or params.get("user_id")
+        chat_id = int(chat_id) if chat_id is not None else None
+
+        if (chat_id in self.blocked) and (method != "answercallbackquery"):
+            self.counters["error_403"] += 1
+            return self._error(403, "Forbidden: bot was blocked by the user")
+
+        call = SentCall(method, params, chat_id, time.perf_counter())
+
+        if self.record:
+            self.sent.append(call)
+
+        for listener in self.listeners:
+            listener(call)
+
+        if method == "answercallbackquery":
+            return self._ok(True)
+
+        return self._ok(self._message(BOT_USER["id"], params.get("text", ""), chat_id=chat_id))
+
+    async def handle_updates(self, request: web.Request) -> web.Response:
+        """Queues the posted list of updates, given as {"user_id": ..., "text": ...} for messages and
+        {"user_id": ..., "data": ...} for callback queries.
+        """
+
+        updates = []
+
+        for item in await request.json():
+            if "data" in item:
+                updates.append(self.add_callback(int(item["user_id"]), item["data"]))
+            else:
+                updates.append(self.add_message(int(item["user_id"]), item["text"]))
+
+        return self._ok(updates)
+
+    async def handle_stats(self, request: web.Request) -> web.Response:
+        return self._ok({"pending": self.pending, "calls": dict(self.counters)})
+
+    async def _get_updates(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        offset = int(params["offset"]) if params.get("offset") is not None else None
+        limit = int(params.get("limit") or 100)
+        timeout = float(params.get("timeout") or 0)
+
+        if (offset is not None) and (offset < 0):
+            while len(self._updates) > -offset:
+                self._updates.popleft()
+        else:
+            self.polling.set()
+
+            while self._updates and (offset is not None) and (self._updates[0]["update_id"] < offset):
+                self._updates.popleft()
+
+        if not self._updates and timeout:
+            self._arrived.clear()
+
+            try:
+                await asyncio.wait_for(self._arrived.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+        return list(itertools.islice(self._updates, limit))
+
+    @staticmethod
+    async def _params(request: web.Request) -> Dict[str, Any]:
+        params: Dict[str, Any] = dict(request.query)
+
+        if request.content_type == "application/json":
+            params.update(await request.json())
+        elif request.can_read_body:
+            params.update(await request.post())
+
+        return params
+
+    @staticmethod
+    def _user(user_id: int) -> Dict[str, Any]:
+        return {"id": user_id, "is_bot": False, "first_name": "User", "last_name": str(user_id)}
+
+    def _message(self, user_id: int, text: str, chat_id: Optional[int] = None) -> Dict[str, Any]:
+        chat_id = user_id if chat_id is None else chat_id
+        return {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": BOT_USER if user_id == BOT_USER["id"] else self._user(user_id),
+            "text": text,
+        }
+
+    @staticmethod
+    def _ok(result: Any) -> web.Response:
+        return web.json_response({"ok": True, "result": result})
+
+    @staticmethod
+    def _error(code: int, description: str, parameters: Optional[Dict[str, Any]] = None) -> web.Response:
+        body: Dict[str, Any] = {"ok": False, "error_code": code, "description": description}
+
+        if parameters:
+            body["parameters"] = parameters
+
+        return web.Response(text=json.dumps(body), status=code, content_type="application/json")
+
+
+def create_parser(description: str) -> argparse.ArgumentParser:
+    """Creates a parser with the stand-in server's options, so the tools built on top of it share them."""
+
+    parser = argparse.ArgumentParser(description, formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1", help="interface to listen on")
+    parser.add_argument("--port", type=int, default=8081, help="port to listen on")
+    parser.add_argument("--latency", type=float, default=0.0, help="delay (in seconds) of every API call")
+    parser.add_argument("--jitter", type=float, default=0.0, help="maximal random delay added to the latency")
+    parser.add_argument("--retry-rate", type=float, default=0.0, help="share of send calls answered with a 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="retry_after (in seconds) reported with a 429")
+    parser.add_argument(
+        "--blocked",
+        type=lambda value: [int(user_id) for user_id in value.split(",") if user_id],
+        default=[],
+        help="comma-separated Telegram IDs of the users who have blocked the bot",
+    )
+    parser.add_argument("--seed", type=int, default=None, help="seed of the error injection")
+    return parser
+
+
+def from_args(args: argparse.Namespace, record: bool = True) -> FakeBotAPI:
+    return FakeBotAPI(
+        latency=args.latency,
+        jitter=args.jitter,
+        retry_rate=args.retry_rate,
+        retry_after=args.retry_after,
+        blocked=args.blocked,
+        record=record,
+        seed=args.seed,
+    )
+
+
+def main() -> None:
+    args = create_parser("Local stand-in for the Telegram Bot API server").parse_args()
+    loop = asyncio.get_event_loop()
+    server = from_args(args, record=False)
+    loop.run_until_complete(server.start(args.host, args.port))
+
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        loop.run_until_complete(server.stop())
+        logger.info("Served calls: {}", dict(server.counters))
+
+
+if __name__ == "__main__":
+    main()
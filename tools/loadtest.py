@@ -0,0 +1,140 @@
+r"""Load generator for the bot's update handlers.
+
+    Starts the Bot API stand-in from tools/fake_api.py, waits for the bot to start polling it and then feeds it a
+    mix of "/start", "/lang" and "lang_*" callback updates at a fixed rate.  Every handler ends with a sendMessage
+    to the user who triggered it, so the latency of an update is measured from the moment it's queued up to the
+    matching sendMessage.  Run the bot against the stand-in in another terminal:
+
+        python -m tools.loadtest --rate 2000 --duration 30 --users 1000
+        python main.py --dev --api-url http://127.0.0.1:8081
+
+    The users' Telegram IDs are taken from the [--first-user, --first-user + --users) range, "/lang" answers the
+    users without a record in the orders table with the default language.
+"""
+import asyncio
+import collections
+import itertools
+import random
+import time
+from typing import Deque, Dict, List
+
+from loguru import logger
+
+from tools.fake_api import SentCall, create_parser, from_args
+
+
+MIX = (("/start", None), ("/lang", None), (None, "lang_en"), (None, "lang_ru"))
+
+
+def percentile(values: List[float], share: float) -> float:
+    """Returns the :share: (0..1) percentile of the sorted list :values:, 0 for an empty one."""
+
+    if not values:
+        return 0.0
+
+    return values[min(len(values) - 1, int(share * len(values)))]
+
+
+class LoadReport:
+    """Matches the bot's answers with the generated updates and accumulates their latencies.
+
+    Attributes:
+        sent (int): Number of generated updates.
+        answered (int): Number of updates that got an answer.
+        latencies (list): Latencies (in seconds) of the answered updates.
+    """
+
+    def __init__(self):
+        self.sent = 0
+        self.answered = 0
+        self.latencies: List[float] = []
+        self.first_answer = 0.0
+        self.last_answer = 0.0
+        self._waiting: Dict[int, Deque[float]] = collections.defaultdict(collections.deque)
+
+    def expect(self, user_id: int) -> None:
+        self.sent += 1
+        self._waiting[user_id].append(time.perf_counter())
+
+    def on_sent(self, call: SentCall) -> None:
+        if (call.method != "sendmessage") or not self._waiting.get(call.chat_id):
+            return
+
+        self.latencies.append(call.timestamp - self._waiting[call.chat_id].popleft())
+        self.answered += 1
+        self.first_answer = self.first_answer or call.timestamp
+        self.last_answer = call.timestamp
+
+    def summary(self) -> str:
+        latencies = sorted(self.latencies)
+        elapsed = self.last_answer - self.first_answer
+        throughput = self.answered / elapsed if elapsed > 0 else 0.0
+        return (
+            f"sent={self.sent} answered={self.answered} unanswered={self.sent - self.answered} "
+            f"throughput={throughput:.1f} upd/s latency(ms): "
+            f"p50={percentile(latencies, 0.5) * 1000:.1f} p90={percentile(latencies, 0.9) * 1000:.1f} "
+            f"p99={percentile(latencies, 0.99) * 1000:.1f} max={percentile(latencies, 1.0) * 1000:.1f}"
+        )
+
+
+async def generate(args) -> None:
+    server = from_args(args, record=False)
+    report = LoadReport()
+    server.listeners.append(report.on_sent)
+    await server.start(args.host, args.port)
+
+    logger.info("Waiting for the bot to start polling...")
+    await server.polling.wait()
+
+    users = list(range(args.first_user, args.first_user + args.users))
+    rng = random.Random(args.seed)
+    tick = 0.01
+    per_tick = args.rate * tick
+    budget = 0.0
+    started = time.perf_counter()
+    logger.info("Sending {} update(s)/s for {} second(s)", args.rate, args.duration)
+
+    for step in itertools.count():
+        if time.perf_counter() - started >= args.duration:
+            break
+
+        budget += per_tick
+
+        while budget >= 1:
+            budget -= 1
+            user_id = rng.choice(users)
+            text, data = rng.choice(MIX)
+
+            if text:
+                server.add_message(user_id, text)
+            else:
+                server.add_callback(user_id, data)
+
+            report.expect(user_id)
+
+        await asyncio.sleep(max(0.0, started + (step + 1) * tick - time.perf_counter()))
+
+    logger.info("Waiting up to {} second(s) for the remaining answers", args.drain)
+    deadline = time.perf_counter() + args.drain
+
+    while (report.answered < report.sent) and (time.perf_counter() < deadline):
+        await asyncio.sleep(0.1)
+
+    logger.success("Load test finished: {}", report.summary())
+    logger.info("Bot API calls: {}", dict(server.counters))
+    await server.stop()
+
+
+def main() -> None:
+    parser = create_parser("Load generator for the bot's update handlers")
+    parser.add_argument("--rate", type=float, default=1000, help="updates per second")
+    parser.add_argument("--duration", type=float, default=10, help="duration (in seconds) of the load")
+    parser.add_argument("--users", type=int, default=100, help="number of distinct users sending updates")
+    parser.add_argument("--first-user", type=int, default=1, help="Telegram ID of the first user")
+    parser.add_argument("--drain", type=float, default=10, help="time (in seconds) to wait for late answers")
+    args = parser.parse_args()
+    asyncio.get_event_loop().run_until_complete(generate(args))
+
+
+if __name__ == "__main__":
+    main()
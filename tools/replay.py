@@ -0,0 +1,182 @@
+r"""Replay of the recorded frames through the detection.
+
+Feeds the frames recorded by the bot ("python main.py --record recordings/") through the same detection,
+sharpness gate and decoding the bot runs, either at maximal speed (a throughput benchmark) or in real time, as
+they were captured.  The frames are read in place from the memory-mapped recordings, so even long recordings
+don't have to fit into memory.  Every replayed decode is compared with the one recorded in the field, so a
+folder of recordings doubles as a regression corpus:
+
+    python -m tools.replay recordings/ --strict
+    python -m tools.replay recordings/dock-0-20210301120000.qrrec --realtime --speed 2 --area 200
+
+The detection's settings are those the frames were recorded with, unless they're overridden (the recordings hold
+only the squares, so a larger --side doesn't fit them).  The frames are
+replayed one by one, so a recording made with the candidates' tracking may decode somewhat different frames.
+A recording can also be passed to the bot itself, e.g. "python main.py --source recording.qrrec".
+"""
+
+import argparse
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from loguru import logger
+
+from core.detection import ScanStats, create_square, scan_square
+from core.recording import Recording, find_recordings
+from core.tiling import TiledDetector
+
+SETTINGS = {"area": 300, "color": 196, "side": 240, "kernel": 2, "sharpness": 0.0, "tiles": 1}
+
+
+def scan(
+    frame: Any,
+    square: np.ndarray,
+    kernel: np.ndarray,
+    settings: Dict[str, Any],
+    stats: ScanStats,
+    tiler: Optional[TiledDetector] = None,
+) -> List[str]:
+    """Searches for QR-codes inside the square on a single frame and decodes them, as core.qr_cam.scan_frame does.
+
+    Returns:
+        addresses (list): A list of the decoded addresses, empty if there are none.
+    """
+
+    if tiler is not None:
+        codes = tiler.detect(
+            frame, square, kernel, area_min=settings["area"], color_lower=settings["color"], stats=stats
+        )
+        return [address for (address, polygon) in codes]
+
+    return scan_square(
+        frame, square, kernel, settings["area"], settings["color"], sharpness_min=settings["sharpness"], stats=stats
+    )
+
+
+def replay(
+    path: str, overrides: Dict[str, Any], realtime: bool = False, speed: float = 1.0, limit: int = 0
+) -> Dict[str, Any]:
+    """Replays the recording at :path: and compares the decodes with the recorded ones.
+
+    Args:
+        path (str): Path to the recording.
+        overrides (dict): The detection's settings overriding the recorded ones.
+        [optional] realtime (bool): Replay the frames with the recorded intervals instead of at maximal speed.
+        [optional] speed (float): Speed-up of the real-time replay.
+        [optional] limit (int): Maximal number of frames to replay, 0 for all of them.
+
+    Returns:
+        result (dict): Number of the replayed frames, the wall and CPU time spent, the frames per second,
+        the number of the decodes along with those lost and gained compared to the recording, and the scan stats.
+    """
+
+    with Recording(path) as recording:
+        settings = dict(SETTINGS, **recording.metadata.get("settings", {}))
+        settings.update(overrides)
+        kernel = np.ones((settings["kernel"], settings["kernel"]), np.uint8)
+        tiler = TiledDetector(settings["tiles"], sharpness_min=settings["sharpness"]) if settings["tiles"] > 1 else None
+        stats = ScanStats()
+        frames = decoded = lost = gained = 0
+        square = None
+        first = None
+        started = time.perf_counter()
+        cpu = time.process_time()
+
+        for frame, metadata in recording:
+            if limit and (frames >= limit):
+                break
+
+            if first is None:
+                first = metadata["time"]
+                square = create_square(frame, side=settings["side"])
+
+            if realtime:
+                time.sleep(max(0.0, started + (metadata["time"] - first) / speed - time.perf_counter()))
+
+            addresses = scan(frame, square, kernel, settings, stats, tiler)
+            recorded = set(metadata.get("addresses", []))
+            frames += 1
+            decoded += len(addresses)
+            lost += len(recorded - set(addresses))
+            gained += len(set(addresses) - recorded)
+
+            if recorded - set(addresses):
+                logger.debug(
+                    "Frame {} at {:.3f}: lost {}", metadata["index"], metadata["time"], recorded - set(addresses)
+                )
+
+        elapsed = time.perf_counter() - started
+        cpu = time.process_time() - cpu
+
+        if tiler is not None:
+            tiler.shutdown()
+
+    return dict(
+        path=path,
+        frames=frames,
+        elapsed=elapsed,
+        cpu=cpu,
+        fps=frames / elapsed if elapsed > 0 else 0.0,
+        decoded=decoded,
+        lost=lost,
+        gained=gained,
+        stats=stats.summary(),
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        "Replay of the recorded frames through the detection", formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument("recordings", nargs="+", help="recordings or folders of them")
+    parser.add_argument("--realtime", action="store_true", help="replay the frames as fast as they were captured")
+    parser.add_argument("--speed", type=float, default=1.0, help="speed-up of the real-time replay")
+    parser.add_argument("--limit", type=int, default=0, help="maximal number of frames to replay per recording")
+    parser.add_argument("--strict", action="store_true", help="exit with an error if a recorded decode is lost")
+
+    for key, default in SETTINGS.items():
+        parser.add_argument(f"--{key}", type=type(default), default=None, help=f"override the recorded --{key}")
+
+    args = parser.parse_args()
+    overrides = {key: getattr(args, key) for key in SETTINGS if getattr(args, key) is not None}
+    paths = find_recordings(args.recordings)
+
+    if not paths:
+        logger.critical("No recordings found in {}", args.recordings)
+        return
+
+    results = []
+
+    for path in paths:
+        try:
+            result = replay(path, overrides, args.realtime, args.speed, args.limit)
+        except (OSError, ValueError) as ex:
+            logger.error('Couldn\'t replay "{}": {}', path, ex)
+            continue
+
+        results.append(result)
+        logger.info(
+            '"{path}": {frames} frame(s) in {elapsed:.2f}s ({fps:.1f} fps, {cpu:.2f} CPU-s), decoded={decoded} '
+            "lost={lost} gained={gained}. {stats}",
+            **result,
+        )
+
+    frames = sum(result["frames"] for result in results)
+    elapsed = sum(result["elapsed"] for result in results)
+    lost = sum(result["lost"] for result in results)
+    logger.success(
+        "Replayed {} frame(s) of {} recording(s) at {:.1f} fps, lost {} and gained {} decode(s)",
+        frames,
+        len(results),
+        frames / elapsed if elapsed > 0 else 0.0,
+        lost,
+        sum(result["gained"] for result in results),
+    )
+
+    if args.strict and lost:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+r"""Soak test of the bot against the stand-in database and Bot API server.
+
+    Not a script on its own: "python main.py --soak 21600" sets it up (see :setup:) and runs the bot for 6 hours,
+    sampling its memory, event loop lag and latencies, and writes the drift report to --soak-report.
+"""
+import asyncio
+import itertools
+import json
+import os
+import pathlib
+import time
+import tracemalloc
+from typing import Any, Dict, List, Optional, Tuple
+
+import aiogram
+from aiogram.utils import executor
+from loguru import logger
+
+from core import config, misc
+from core.metrics import latencies
+from core.warehouse import Warehouse
+from handlers import notify
+from tools import standins
+from tools.fake_api import FakeBotAPI
+
+TOP_ALLOCATORS = 10
+
+
+def rss() -> int:
+    """Returns the resident set size of the process in bytes (the peak one where the current one isn't available)."""
+
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+
+    try:
+        import resource
+
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except ImportError:
+        return 0
+
+
+def slope(xs: List[float], ys: List[float]) -> float:
+    """Returns the least-squares slope of :ys: over :xs:, 0 if there are fewer than two points."""
+
+    if len(xs) < 2:
+        return 0.0
+
+    x_mean = sum(xs) / len(xs)
+    y_mean = sum(ys) / len(ys)
+    variance = sum((x - x_mean) ** 2 for x in xs)
+    return sum((x - x_mean) * (y - y_mean) for x, y in zip(xs, ys)) / variance if variance else 0.0
+
+
+class SoakMonitor:
+    """Periodically samples the bot's memory (RSS, memory traced by tracemalloc and its top allocators since the
+    start), the event loop's lag, the number of asyncio tasks and the latency of every recorded stage, and summarizes
+    their drift over the whole run.  A leak shows up as a steady growth of the memory, a slowdown as a steady growth
+    of the lag or the latencies.
+
+    Attributes:
+        interval (float): Interval in seconds between the samples.
+        [optional] top (int): Number of the top allocators to keep per sample.
+        samples (list): The collected samples.
+    """
+
+    def __init__(self, interval: float, top: int = TOP_ALLOCATORS):
+        self.interval = interval
+        self.top = top
+        self.samples: List[Dict[str, Any]] = []
+        self._started = time.monotonic()
+        self._baseline: Optional[tracemalloc.Snapshot] = None
+
+    def start(self) -> None:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+        self._baseline = self._snapshot()
+        self._started = time.monotonic()
+
+    def sample(self) -> Dict[str, Any]:
+        traced, peak = tracemalloc.get_traced_memory()
+        stages = latencies.drain()
+        lag = stages.pop("loop_lag", {})
+        sample = dict(
+            elapsed=time.monotonic() - self._started,
+            rss=rss() / 2 ** 20,
+            traced=traced / 2 ** 20,
+            traced_peak=peak / 2 ** 20,
+            tasks=len(asyncio.all_tasks()),
+            lag={key: lag.get(key, 0.0) for key in ("p50", "p95", "max")},
+            stages=stages,
+            allocators=self.allocators(),
+        )
+        self.samples.append(sample)
+        logger.info(
+            "Soak sample at {:.0f}s: RSS {:.1f} MB, traced {:.1f} MB, {} task(s), loop lag p95 {:.1f} ms",
+            sample["elapsed"],
+            sample["rss"],
+            sample["traced"],
+            sample["tasks"],
+            sample["lag"]["p95"],
+        )
+        return sample
+
+    def allocators(self) -> List[Dict[str, Any]]:
+        """Returns the source lines whose allocations have grown the most since the start."""
+
+        if self._baseline is None:
+            return []
+
+        differences = self._snapshot().compare_to(self._baseline, "lineno")
+        return [
+            dict(
+                location=f"{difference.traceback[0].filename}:{difference.traceback[0].lineno}",
+                size=difference.size / 2 ** 10,
+                growth=difference.size_diff / 2 ** 10,
+                count=difference.count,
+            )
+            for difference in differences[: self.top]
+        ]
+
+    def report(self) -> Dict[str, Any]:
+        """Summarizes the samples: the per-hour drift of the memory, the lag and every stage's median latency,
+        along with their first and last values.  The very first sample is left out of the drift as a warm-up.
+        """
+
+        samples = self.samples[1:] if len(self.samples) > 2 else self.samples
+        series: Dict[str, List[Tuple[float, float]]] = {}
+
+        for sample in samples:
+            hour = sample["elapsed"] / 3600
+            values = dict(
+                rss_mb=sample["rss"],
+                traced_mb=sample["traced"],
+                tasks=sample["tasks"],
+                lag_p95_ms=sample["lag"]["p95"],
+            )
+            values.update({f"{stage}_p50_ms": summary["p50"] for stage, summary in sample["stages"].items()})
+
+            for name, value in values.items():
+                series.setdefault(name, []).append((hour, value))
+
+        drift = {
+            name: dict(
+                first=points[0][1],
+                last=points[-1][1],
+                per_hour=slope([hour for hour, _ in points], [value for _, value in points]),
+            )
+            for name, points in series.items()
+        }
+
+        return dict(
+            duration=self.samples[-1]["elapsed"] if self.samples else 0.0,
+            interval=self.interval,
+            counts=dict(latencies.counts),
+            drift=drift,
+            samples=self.samples,
+        )
+
+    @staticmethod
+    def _snapshot() -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces(
+            (
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            )
+        )
+
+
+async def drive_notifications(warehouses: List[Warehouse], addresses: List[str], period: float) -> None:
+    """Passes the stand-in addresses of every warehouse to the notify module one by one, as if their QR-codes had
+    been scanned.
+    """
+
+    for site, address in itertools.cycle(itertools.product(warehouses, addresses)):
+        await notify.start(address, pause_success=0, pause_fail=0, warehouse=site)
+        await asyncio.sleep(period)
+
+
+async def drive_updates(server: FakeBotAPI, users: List[int], period: float) -> None:
+    """Sends the bot "/lang" commands and the language buttons' callbacks on behalf of the stand-in users."""
+
+    for number, user_id in enumerate(itertools.cycle(users)):
+        if number % 2:
+            server.add_callback(user_id, "lang_ru" if number % 4 == 1 else "lang_en")
+        else:
+            server.add_message(user_id, "/lang")
+
+        await asyncio.sleep(period)
+
+
+async def finish(monitor: SoakMonitor, duration: float, path: str) -> None:
+    """Samples the monitor every interval for :duration: seconds, writes the drift report and stops the bot."""
+
+    deadline = time.monotonic() + duration
+
+    while time.monotonic() < deadline:
+        await asyncio.sleep(min(monitor.interval, max(0.0, deadline - time.monotonic())))
+        monitor.sample()
+
+    report = monitor.report()
+    pathlib.Path(path).parent.mkdir(parents=True, exist_ok=True)
+
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=4)
+
+    for name, drift in report["drift"].items():
+        logger.info("Drift of {}: {first:.2f} -> {last:.2f} ({per_hour:+.3f} per hour)", name, **drift)
+
+    logger.success('Soak test is over, the drift report has been written to "{}"', path)
+    misc.loop.stop()
+
+
+def setup(runner: executor.Executor, period: float = 1.0) -> None:
+    """Prepares the soak test: starts the stand-in Bot API server and, once the bot is polling, the monitor and the
+    drivers of the notifications and the updates.  The bot stops by itself after the test's duration.
+
+    Args:
+        runner (executor.Executor): The executor the bot is started with.
+        [optional] period (float): Interval in seconds between the driven notifications (and between the updates).
+    """
+
+    server = FakeBotAPI(record=False)
+    monitor = SoakMonitor(config.args.soak_interval)
+    tasks: List[asyncio.Task] = []
+    misc.loop.run_until_complete(server.start(port=config.args.soak_port))
+    query = "SELECT DISTINCT telegram_id FROM %s.%s;"
+    users = sorted(
+        {
+            telegram_id
+            for site in misc.warehouses
+            for (telegram_id,) in misc.loop.run_until_complete(site.execute(query % (site.uid, site.table)))
+        }
+    )
+
+    async def on_startup(dp: aiogram.Dispatcher) -> None:
+        monitor.start()
+        tasks.extend(
+            misc.loop.create_task(coroutine)
+            for coroutine in (
+                drive_notifications(misc.warehouses, standins.ADDRESSES, period),
+                drive_updates(server, users, period),
+                finish(monitor, config.args.soak, config.args.soak_report),
+            )
+        )
+
+    async def on_shutdown(dp: aiogram.Dispatcher) -> None:
+        for task in tasks:
+            task.cancel()
+
+        await server.stop()
+        logger.info("Stand-in Bot API calls: {}", dict(server.counters))
+
+    runner.on_startup(on_startup)
+    runner.on_shutdown(on_shutdown)
@@ -0,0 +1,86 @@
+r"""In-memory stand-in for the orders database.
+
+    "python main.py --standins" (and the soak test) connects the warehouses to it instead of SQL Anywhere, so the bot
+    runs without a database, e.g. for the benchmarks (see tools/bench_sharding.py).
+"""
+import random
+import sqlite3
+from typing import Dict, List
+
+from core.warehouse import Warehouse
+
+
+ADDRESSES = [f"{number} Soak Street, Testville" for number in range(1, 9)]
+USERS = list(range(100001, 100017))
+TIMEZONES = ["UTC", "Europe/Berlin", "Europe/Moscow", "America/New_York"]
+PRODUCTS = [("Keyboard", "K120", 17.5, 0.55), ("Monitor", "P2419H", 189.9, 5.2), ("Headset", "HS-7", 49.0, 0.31)]
+
+
+def connect(uid: str, table: str, orders: int = 64, seed: int = 0) -> sqlite3.Connection:
+    """Creates an in-memory stand-in for the orders database, so the bot can run without SQL Anywhere (e.g. in the
+    soak-test mode).  The table is attached as :uid:.:table:, hence the bot's queries run against it unchanged.
+    Every address gets orders of one or several of the stand-in users.
+
+    Args:
+        uid (str): The schema's name, as the DB user's UID the bot qualifies the table with.
+        table (str): The orders table's name.
+        [optional] orders (int): Number of the generated orders.
+        [optional] seed (int): Seed of the generated orders.
+
+    Returns:
+        conn (sqlite3.Connection): The connection to the stand-in.
+    """
+
+    conn = sqlite3.connect(":memory:", check_same_thread=False)
+    conn.execute(f"ATTACH DATABASE ':memory:' AS {uid};")
+    conn.execute(
+        f"CREATE TABLE {uid}.{table} ("
+        "id INTEGER PRIMARY KEY, product TEXT NOT NULL, model TEXT, price DECIMAL(10,2) NOT NULL, "
+        "amount INTEGER NOT NULL DEFAULT 1, weight DECIMAL(8,3) NOT NULL, first_name TEXT NOT NULL, "
+        "last_name TEXT, address TEXT NOT NULL, telegram_id INTEGER NOT NULL, timezone TEXT DEFAULT 'UTC', "
+        "locale TEXT DEFAULT 'en_US');"
+    )
+    conn.execute(f"CREATE INDEX {uid}.{table}_address ON {table} (address);")
+    conn.executemany(
+        f"INSERT INTO {uid}.{table} (product, model, price, amount, weight, first_name, last_name, address, "
+        "telegram_id, timezone, locale) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);",
+        generate_orders(orders, seed),
+    )
+    conn.commit()
+    return conn
+
+
+def connect_warehouse(warehouse: Warehouse) -> sqlite3.Connection:
+    """Opens a connection to a stand-in of the :warehouse:'s orders table, to be passed to core.misc.open_warehouses.
+    Every connection is a separate in-memory database, hence the warehouses have to use a single connection.
+    """
+
+    return connect(warehouse.uid, warehouse.table)
+
+
+def generate_orders(count: int, seed: int = 0) -> List[tuple]:
+    generator = random.Random(seed)
+    owners: Dict[str, List[int]] = {address: generator.sample(USERS, generator.randint(1, 2)) for address in ADDRESSES}
+    rows = []
+
+    for number in range(count):
+        address = ADDRESSES[number % len(ADDRESSES)]
+        telegram_id = generator.choice(owners[address])
+        product, model, price, weight = generator.choice(PRODUCTS)
+        rows.append(
+            (
+                product,
+                model,
+                price,
+                generator.randint(1, 3),
+                weight,
+                f"User{telegram_id}",
+                "Soak",
+                address,
+                telegram_id,
+                TIMEZONES[telegram_id % len(TIMEZONES)],
+                "ru_RU" if telegram_id % 3 == 0 else "en_US",
+            )
+        )
+
+    return rows
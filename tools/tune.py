@@ -0,0 +1,190 @@
+r"""Offline tuning of the detection thresholds.
+
+    Replays recorded frames through the bot's detection (core.detection.scan_square) for every combination of the
+    "--area", "--color", "--side" and "--kernel" values (a full grid or a random sample of it), measures the CPU time
+    spent per combination and reports the settings that maximise successful decodes per CPU-second.  To avoid picking
+    a setting that is fast only because it hardly decodes anything, the winner must decode at least --min-share
+    of the decodes of the best-decoding setting.  The winner is written as a profile the bot loads at startup:
+
+        python -m tools.tune frames/ --areas 100,300,600 --colors 160,196,224 --kernels 2,3 --output dock.json
+        python main.py --profile dock.json
+
+    Frames are read from a folder of images, from a recording made with "python main.py --record" or from a video
+    file.
+"""
+import argparse
+import itertools
+import json
+import pathlib
+import random
+import time
+from typing import Any, Dict, Iterator, List, Tuple
+
+import cv2
+import numpy as np
+from loguru import logger
+
+from core.detection import ScanStats, create_square, scan_square
+from core.recording import SUFFIX, Recording
+
+
+IMAGE_SUFFIXES = {".png", ".jpg", ".jpeg", ".bmp"}
+
+
+def iter_frames(path: str, limit: int = 0) -> Iterator[Any]:
+    """Yields the frames stored at :path:, a folder of images (in the order of their names), a recording of the bot
+    (read in place, see core/recording.py) or a video file.
+
+    Args:
+        path (str): Path to the folder or the file.
+        [optional] limit (int): Maximal number of frames to yield, 0 for all of them.
+    """
+
+    source = pathlib.Path(path)
+
+    if source.is_dir():
+        frames: Iterator[Any] = (
+            cv2.imread(str(image)) for image in sorted(source.iterdir()) if image.suffix.lower() in IMAGE_SUFFIXES
+        )
+    elif source.suffix == SUFFIX:
+        frames = (frame for frame, _ in Recording(str(source)))
+    else:
+        frames = read_video(str(source))
+
+    yield from itertools.islice(frames, limit or None)
+
+
+def read_video(path: str) -> Iterator[Any]:
+    capture = cv2.VideoCapture(path)
+
+    try:
+        while True:
+            ret, frame = capture.read()
+
+            if not ret:
+                return
+
+            yield frame
+    finally:
+        capture.release()
+
+
+def evaluate(frames: List[Any], area: int, color: int, side: int, kernel_side: int) -> Dict[str, Any]:
+    """Runs the detection with the given thresholds over :frames: and measures its cost.
+
+    Returns:
+        result (dict): The thresholds along with the number of candidates, decodes, distinct decoded strings,
+        the CPU time in seconds and the decodes per CPU-second.
+    """
+
+    kernel = np.ones((kernel_side, kernel_side), np.uint8)
+    stats = ScanStats()
+    addresses = set()
+    cpu = 0.0
+
+    for frame in frames:
+        square = create_square(frame, side=side)
+        started = time.process_time()
+        decoded = scan_square(frame, square, kernel, area, color, stats=stats)
+        cpu += time.process_time() - started
+        addresses.update(decoded)
+
+    return dict(
+        area=area,
+        color=color,
+        side=side,
+        kernel=kernel_side,
+        candidates=stats.candidates,
+        decoded=stats.decoded,
+        distinct=len(addresses),
+        cpu=cpu,
+        rate=stats.decoded / cpu if cpu > 0 else 0.0,
+    )
+
+
+def select(results: List[Dict[str, Any]], min_share: float) -> List[Dict[str, Any]]:
+    """Sorts :results: by decodes per CPU-second, leaving out those with fewer than :min_share: of the best decodes."""
+
+    best = max((result["decoded"] for result in results), default=0)
+    eligible = [result for result in results if result["decoded"] >= min_share * best and result["decoded"]]
+    return sorted(eligible, key=lambda result: result["rate"], reverse=True)
+
+
+def integers(value: str) -> List[int]:
+    return [int(item) for item in value.split(",") if item]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        "Offline tuning of the detection thresholds", formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument("frames", help="folder of recorded frames, a recording of the bot or a video file")
+    parser.add_argument("--areas", type=integers, default=[100, 200, 300, 500, 800], help="values of --area")
+    parser.add_argument("--colors", type=integers, default=[128, 160, 196, 212, 232], help="values of --color")
+    parser.add_argument("--sides", type=integers, default=[240], help="values of --side")
+    parser.add_argument("--kernels", type=integers, default=[2, 3, 5], help="values of --kernel")
+    parser.add_argument("--random", type=int, default=0, help="evaluate a random sample of N combinations")
+    parser.add_argument("--seed", type=int, default=None, help="seed of the random sample")
+    parser.add_argument("--limit", type=int, default=0, help="maximal number of frames to replay, 0 for all")
+    parser.add_argument("--min-share", type=float, default=0.9, help="minimal share of the best decodes to win")
+    parser.add_argument("--top", type=int, default=10, help="number of the best settings to report")
+    parser.add_argument("--output", default=None, help="path to write the winning profile to")
+    args = parser.parse_args()
+
+    try:
+        frames = [frame for frame in iter_frames(args.frames, args.limit) if frame is not None]
+    except ValueError as ex:
+        logger.critical('Couldn\'t read the frames of "{}": {}', args.frames, ex)
+        return
+
+    if not frames:
+        logger.critical('No frames found in "{}"', args.frames)
+        return
+
+    height, width = frames[0].shape[:2]
+    sides = [side for side in args.sides if side <= min(width, height)]
+
+    if not sides:
+        logger.critical("None of the sides {} fits the frames {}x{}", args.sides, width, height)
+        return
+
+    grid: List[Tuple[int, int, int, int]] = list(itertools.product(args.areas, args.colors, sides, args.kernels))
+
+    if args.random and (args.random < len(grid)):
+        grid = random.Random(args.seed).sample(grid, args.random)
+
+    logger.info("Replaying {} frame(s) {}x{} through {} setting(s)", len(frames), width, height, len(grid))
+    results = []
+
+    for number, (area, color, side, kernel_side) in enumerate(grid, 1):
+        result = evaluate(frames, area, color, side, kernel_side)
+        results.append(result)
+        logger.debug("[{}/{}] {}", number, len(grid), result)
+
+    ranking = select(results, args.min_share)
+
+    if not ranking:
+        logger.warning("None of the settings decoded a single QR-code")
+        return
+
+    for result in ranking[: args.top]:
+        logger.info(
+            "area={area:<4} color={color:<3} side={side:<4} kernel={kernel:<2} candidates={candidates:<5} "
+            "decoded={decoded:<5} distinct={distinct:<3} cpu={cpu:7.3f}s decodes/cpu-s={rate:8.2f}",
+            **result,
+        )
+
+    if args.output:
+        winner = ranking[0]
+        profile = {key: winner[key] for key in ("area", "color", "side", "kernel")}
+        profile["score"] = {key: winner[key] for key in ("decoded", "distinct", "cpu", "rate")}
+        profile["frames"] = len(frames)
+
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(profile, file, indent=4)
+
+        logger.success('The best profile has been written to "{}"', args.output)
+
+
+if __name__ == "__main__":
+    main()